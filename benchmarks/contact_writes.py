@@ -0,0 +1,111 @@
+"""Round trips and latency of the ContactRepository write path.
+
+Counts the SQL statements each write sends to the database (transaction
+control excluded) against the database configured in DB_URL.
+
+    python -m benchmarks.contact_writes --iterations 200
+"""
+
+import argparse
+import asyncio
+import time
+import uuid
+from datetime import date
+
+from sqlalchemy import delete, event
+
+from src.database.db import sessionmanager
+from src.database.models import Group, User
+from src.repository.contacts import ContactRepository
+from src.schemas import ContactIsActiveUpdate, ContactModel, ContactUpdate
+
+
+class StatementCounter:
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine.sync_engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+
+async def seed(db) -> tuple[User, Group]:
+    suffix = uuid.uuid4().hex[:8]
+    user = User(
+        username=f"bench_{suffix}",
+        email=f"bench_{suffix}@example.com",
+        hashed_password="-",
+        confirmed=True,
+    )
+    group = Group(name=f"bench_{suffix}", user=user)
+    db.add_all([user, group])
+    await db.commit()
+    await db.refresh(user)
+    await db.refresh(group)
+    return user, group
+
+
+async def measure(name: str, counter: StatementCounter, iterations: int, operation):
+    statements = 0
+    start = time.perf_counter()
+    for i in range(iterations):
+        before = counter.count
+        await operation(i)
+        statements += counter.count - before
+    elapsed = time.perf_counter() - start
+    print(
+        f"{name:<26} {statements / iterations:>6.1f} statements/op"
+        f" {elapsed / iterations * 1000:>8.2f} ms/op"
+    )
+
+
+async def main(iterations: int):
+    counter = StatementCounter(sessionmanager._engine)
+    async with sessionmanager.session() as db:
+        user, group = await seed(db)
+        user_id, group_id = user.id, group.id
+        repository = ContactRepository(db)
+        contact_ids = []
+
+        def contact_body(i: int, model=ContactModel, **extra):
+            return model(
+                name=f"name{i}",
+                surname=f"surname{i}",
+                email=f"contact{i}@example.com",
+                phone_number="0501234567",
+                birthday=date(1990, 1 + i % 12, 1 + i % 28),
+                groups=[group_id],
+                **extra,
+            )
+
+        async def create(i: int):
+            contact = await repository.create_contact(contact_body(i), [group], user)
+            contact_ids.append(contact.id)
+
+        async def update(i: int):
+            body = contact_body(i + 1, ContactUpdate, is_active=True)
+            await repository.update_contact(contact_ids[i], body, [group], user)
+
+        async def update_is_active(i: int):
+            body = ContactIsActiveUpdate(is_active=bool(i % 2))
+            await repository.update_contact_is_active(contact_ids[i], body, user)
+
+        try:
+            await measure("create_contact", counter, iterations, create)
+            await measure("update_contact", counter, iterations, update)
+            await measure(
+                "update_contact_is_active", counter, iterations, update_is_active
+            )
+        finally:
+            # contacts and groups are removed by ON DELETE CASCADE
+            await db.rollback()
+            await db.execute(delete(User).where(User.id == user_id))
+            await db.commit()
+            await sessionmanager.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=100)
+    args = parser.parse_args()
+    asyncio.run(main(args.iterations))
@@ -0,0 +1,394 @@
+"""Load test of the API hot paths.
+
+Seeds the database configured in DB_URL with users, groups and contacts,
+drives the app with concurrent clients and reports latency percentiles,
+throughput and SQL statements per endpoint.
+
+    python -m benchmarks.load --users 10 --contacts 1000 --duration 30
+    python -m benchmarks.load --save-baseline benchmarks/baseline.json
+    python -m benchmarks.load --baseline benchmarks/baseline.json --tolerance 0.2
+
+By default the app runs in this process (no network, rate limits off).
+With --url an already running server is driven instead; start it with
+RATE_LIMITS='{}' so that the clients are not throttled. Statement counts
+are read from the Server-Timing header. Seeded rows are removed at the end.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import re
+import sys
+import time
+import uuid
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+
+import httpx
+from sqlalchemy import delete, insert, select
+
+from src.conf.config import config
+from src.database.db import sessionmanager
+from src.database.models import (
+    CollectionVersion,
+    Contact,
+    ContactTombstone,
+    Group,
+    User,
+    birthday_key,
+    contact_m2m_group,
+)
+from src.services.hashing import hash_password
+
+PASSWORD = "password1"
+
+SERVER_TIMING_QUERIES = re.compile(r'db;[^,]*desc="(\d+) queries"')
+
+
+@dataclass
+class SeededUser:
+    id: int
+    username: str
+    contact_ids: list[int]
+    group_ids: list[int]
+
+
+@dataclass
+class EndpointStats:
+    latencies: list[float] = field(default_factory=list)
+    errors: int = 0
+    statements: int = 0
+
+    def report(self, elapsed: float) -> dict:
+        latencies = sorted(self.latencies)
+        count = len(latencies)
+
+        def percentile(p: float) -> float:
+            # nearest rank
+            return latencies[max(int(p * count + 0.5) - 1, 0)] * 1000
+
+        return {
+            "count": count,
+            "errors": self.errors,
+            "rps": count / elapsed,
+            "p50": percentile(0.50),
+            "p95": percentile(0.95),
+            "p99": percentile(0.99),
+            "max": latencies[-1] * 1000,
+            "statements": self.statements / count if self.statements else None,
+        }
+
+
+async def seed(users: int, contacts: int, groups: int) -> list[SeededUser]:
+    run = uuid.uuid4().hex[:8]
+    hashed_password = hash_password(PASSWORD, config.BCRYPT_ROUNDS)
+    seeded = []
+    async with sessionmanager.session() as db:
+        for u in range(users):
+            username = f"load_{run}_{u}"
+            user_id = (
+                await db.execute(
+                    insert(User)
+                    .values(
+                        username=username,
+                        email=f"{username}@example.com",
+                        hashed_password=hashed_password,
+                        confirmed=True,
+                    )
+                    .returning(User.id)
+                )
+            ).scalar_one()
+            await db.execute(
+                insert(Group),
+                [{"name": f"group {g}", "user_id": user_id} for g in range(groups)],
+            )
+            group_ids = (
+                await db.scalars(select(Group.id).filter_by(user_id=user_id))
+            ).all()
+
+            for start in range(0, contacts, 1000):
+                rows = []
+                for c in range(start, min(start + 1000, contacts)):
+                    birthday = date(1970, 1, 1) + timedelta(days=c * 37 % 18000)
+                    rows.append(
+                        {
+                            "name": f"name{c}",
+                            "surname": f"surname{c % 500}",
+                            "email": f"contact{c}@example.com",
+                            "phone_number": "0501234567",
+                            "birthday": birthday,
+                            # Core inserts skip the ORM validator
+                            "birthday_md": birthday_key(birthday),
+                            "user_id": user_id,
+                        }
+                    )
+                await db.execute(insert(Contact), rows)
+            contact_ids = (
+                await db.scalars(select(Contact.id).filter_by(user_id=user_id))
+            ).all()
+            if group_ids:
+                await db.execute(
+                    insert(contact_m2m_group),
+                    [
+                        {
+                            "contact_id": contact_id,
+                            "group_id": group_ids[i % len(group_ids)],
+                        }
+                        for i, contact_id in enumerate(contact_ids)
+                    ],
+                )
+            await db.commit()
+            seeded.append(
+                SeededUser(user_id, username, list(contact_ids), list(group_ids))
+            )
+    return seeded
+
+
+async def cleanup(users: list[SeededUser]) -> None:
+    user_ids = [user.id for user in users]
+    contact_ids = select(Contact.id).where(Contact.user_id.in_(user_ids))
+    async with sessionmanager.session() as db:
+        # explicit, ON DELETE CASCADE is not enforced by every database
+        await db.execute(
+            delete(contact_m2m_group).where(
+                contact_m2m_group.c.contact_id.in_(contact_ids)
+            )
+        )
+        for model in (Contact, Group, ContactTombstone, CollectionVersion):
+            await db.execute(delete(model).where(model.user_id.in_(user_ids)))
+        await db.execute(delete(User).where(User.id.in_(user_ids)))
+        await db.commit()
+
+
+class Client:
+    def __init__(self, http: httpx.AsyncClient, user: SeededUser, stats: dict):
+        self.http = http
+        self.user = user
+        self.stats = stats
+        self.headers = {}
+
+    async def request(self, endpoint: str, method: str, url: str, **kwargs):
+        start = time.perf_counter()
+        response = await self.http.request(method, url, headers=self.headers, **kwargs)
+        stats = self.stats[endpoint]
+        stats.latencies.append(time.perf_counter() - start)
+        queries = SERVER_TIMING_QUERIES.search(
+            response.headers.get("server-timing", "")
+        )
+        if queries:
+            stats.statements += int(queries.group(1))
+        if response.status_code >= 400:
+            stats.errors += 1
+        return response
+
+    def contact_body(self) -> dict:
+        n = random.randrange(100000)
+        return {
+            "name": f"name{n}",
+            "surname": f"surname{n % 500}",
+            "email": f"new{n}@example.com",
+            "phone_number": "0501234567",
+            "birthday": str(date(1980, 1, 1) + timedelta(days=n % 10000)),
+            "groups": random.sample(
+                self.user.group_ids, min(2, len(self.user.group_ids))
+            ),
+        }
+
+    async def login(self):
+        self.headers = {}
+        response = await self.request(
+            "POST /api/auth/login",
+            "POST",
+            "/api/auth/login",
+            data={"username": self.user.username, "password": PASSWORD},
+        )
+        if response.status_code != 200:
+            raise RuntimeError(f"login failed: {response.text}")
+        token = response.json()["access_token"]
+        self.headers = {"Authorization": f"Bearer {token}"}
+
+    async def list_contacts(self):
+        await self.request("GET /api/contacts/", "GET", "/api/contacts/?limit=20")
+
+    async def search_contacts(self):
+        query = f"surname{random.randrange(500)}"
+        await self.request(
+            "GET /api/contacts/?query", "GET", f"/api/contacts/?query={query}"
+        )
+
+    async def birthdays(self):
+        start = date.today() + timedelta(days=random.randrange(365))
+        await self.request(
+            "GET /api/contacts/birthday",
+            "GET",
+            f"/api/contacts/birthday?from_date={start}&to_date={start + timedelta(days=7)}",
+        )
+
+    async def read_contact(self):
+        contact_id = random.choice(self.user.contact_ids)
+        await self.request(
+            "GET /api/contacts/{id}", "GET", f"/api/contacts/{contact_id}"
+        )
+
+    async def create_contact(self):
+        response = await self.request(
+            "POST /api/contacts/", "POST", "/api/contacts/", json=self.contact_body()
+        )
+        if response.status_code == 201:
+            self.user.contact_ids.append(response.json()["id"])
+
+    async def update_contact(self):
+        contact_id = random.choice(self.user.contact_ids)
+        await self.request(
+            "PUT /api/contacts/{id}",
+            "PUT",
+            f"/api/contacts/{contact_id}",
+            json={**self.contact_body(), "is_active": True},
+        )
+
+    async def groups(self):
+        await self.request("GET /api/groups/", "GET", "/api/groups/")
+        response = await self.request(
+            "POST /api/groups/",
+            "POST",
+            "/api/groups/",
+            json={"name": f"tmp {uuid.uuid4().hex[:12]}"},
+        )
+        if response.status_code != 201:
+            return
+        group_id = response.json()["id"]
+        await self.request(
+            "PUT /api/groups/{id}",
+            "PUT",
+            f"/api/groups/{group_id}",
+            json={"name": f"tmp {uuid.uuid4().hex[:12]}"},
+        )
+        await self.request(
+            "DELETE /api/groups/{id}", "DELETE", f"/api/groups/{group_id}"
+        )
+
+    async def run(self, deadline: float):
+        scenarios = [
+            (self.list_contacts, 30),
+            (self.read_contact, 20),
+            (self.search_contacts, 15),
+            (self.birthdays, 10),
+            (self.update_contact, 10),
+            (self.create_contact, 8),
+            (self.groups, 5),
+            (self.login, 2),
+        ]
+        operations, weights = zip(*scenarios)
+        await self.login()
+        while time.perf_counter() < deadline:
+            await random.choices(operations, weights)[0]()
+
+
+def print_report(report: dict, baseline: dict | None, elapsed: float) -> None:
+    total = sum(row["count"] for row in report.values())
+    print(f"{total} requests in {elapsed:.1f}s, {total / elapsed:.1f} rps\n")
+    header = (
+        f"{'endpoint':<30} {'count':>6} {'err':>4} {'rps':>7} {'p50':>8}"
+        f" {'p95':>8} {'p99':>8} {'max':>8} {'sql':>5}"
+    )
+    print(header + ("  p95 vs baseline" if baseline else ""))
+    for endpoint, row in sorted(report.items()):
+        statements = f"{row['statements']:.1f}" if row["statements"] else "-"
+        line = (
+            f"{endpoint:<30} {row['count']:>6} {row['errors']:>4} {row['rps']:>7.1f}"
+            f" {row['p50']:>8.2f} {row['p95']:>8.2f} {row['p99']:>8.2f}"
+            f" {row['max']:>8.2f} {statements:>5}"
+        )
+        if baseline and endpoint in baseline:
+            change = row["p95"] / baseline[endpoint]["p95"] - 1
+            line += f"  {change:+.0%}"
+        print(line)
+    print("\nlatencies in ms, sql - statements per request")
+
+
+def regressions(report: dict, baseline: dict, tolerance: float) -> list[str]:
+    found = []
+    for endpoint, row in report.items():
+        base = baseline.get(endpoint)
+        if base is None:
+            continue
+        if row["p95"] > base["p95"] * (1 + tolerance):
+            found.append(f"{endpoint}: p95 {base['p95']:.2f} -> {row['p95']:.2f} ms")
+        if base["statements"] and row["statements"]:
+            if row["statements"] > base["statements"] + 0.5:
+                found.append(
+                    f"{endpoint}: statements {base['statements']:.1f}"
+                    f" -> {row['statements']:.1f}"
+                )
+    return found
+
+
+async def main(args) -> int:
+    if args.url:
+        http = httpx.AsyncClient(base_url=args.url, timeout=60)
+    else:
+        # the benchmark clients would be throttled by the per-route limits
+        config.RATE_LIMITS = {}
+        config.RATE_LIMIT_DEFAULT = None
+        from main import app
+
+        http = httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=60
+        )
+
+    print(
+        f"seeding {args.users} users x {args.contacts} contacts, {args.groups} groups"
+    )
+    users = await seed(args.users, args.contacts, args.groups)
+    stats: dict[str, EndpointStats] = defaultdict(EndpointStats)
+    try:
+        async with http:
+            clients = [
+                Client(http, users[i % len(users)], stats)
+                for i in range(args.concurrency)
+            ]
+            start = time.perf_counter()
+            await asyncio.gather(
+                *(client.run(start + args.duration) for client in clients)
+            )
+            elapsed = time.perf_counter() - start
+    finally:
+        await cleanup(users)
+        await sessionmanager.close()
+
+    report = {endpoint: row.report(elapsed) for endpoint, row in stats.items()}
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_report(report, baseline, elapsed)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        print(f"baseline saved to {args.save_baseline}")
+
+    if baseline:
+        found = regressions(report, baseline, args.tolerance)
+        for regression in found:
+            print(f"REGRESSION {regression}")
+        return 1 if found else 0
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--contacts", type=int, default=1000, help="per user")
+    parser.add_argument("--groups", type=int, default=10, help="per user")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=20, help="seconds")
+    parser.add_argument("--url", help="base URL of a running server")
+    parser.add_argument("--baseline", help="compare with this report")
+    parser.add_argument("--save-baseline", help="write the report to this file")
+    parser.add_argument(
+        "--tolerance", type=float, default=0.2, help="allowed p95 growth, 0.2 = 20%%"
+    )
+    sys.exit(asyncio.run(main(parser.parse_args())))
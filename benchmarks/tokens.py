@@ -0,0 +1,90 @@
+"""Access token verification: decode per request against the cached path.
+
+    python -m benchmarks.tokens --iterations 20000
+"""
+
+import argparse
+import time
+import uuid
+from datetime import UTC, datetime, timedelta
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jose import jwt
+
+from src.services.tokens import Keyring, TokenVerifier
+
+
+def claims() -> dict:
+    now = datetime.now(UTC)
+    return {
+        "sub": "bench",
+        "iat": now,
+        "exp": now + timedelta(hours=1),
+        "token_type": "access",
+        "jti": uuid.uuid4().hex,
+    }
+
+
+def rsa_keys() -> tuple[str, str]:
+    private = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    private_pem = private.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    ).decode()
+    public_pem = (
+        private.public_key()
+        .public_bytes(
+            serialization.Encoding.PEM,
+            serialization.PublicFormat.SubjectPublicKeyInfo,
+        )
+        .decode()
+    )
+    return private_pem, public_pem
+
+
+def measure(name: str, iterations: int, verify) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        verify()
+    elapsed = (time.perf_counter() - start) / iterations
+    print(f"{name:<36} {elapsed * 1e6:>9.1f} us/token")
+    return elapsed
+
+
+def main(iterations: int) -> None:
+    secret = "benchmark-secret"
+    hs256 = Keyring("HS256", secret, "k1", secret)
+    token = hs256.sign(claims())
+
+    print("HS256")
+    measure(
+        "jose decode (per request, before)",
+        iterations,
+        lambda: jwt.decode(token, secret, algorithms=["HS256"]),
+    )
+    measure("keyring decode (parsed keys)", iterations, lambda: hs256.decode(token))
+    verifier = TokenVerifier(hs256, 10000)
+    measure("verifier, cached", iterations, lambda: verifier.decode(token))
+
+    private_pem, public_pem = rsa_keys()
+    rs256 = Keyring("RS256", secret, "k2", private_pem, {"k2": public_pem})
+    token = rs256.sign(claims())
+
+    print("RS256")
+    measure(
+        "jose decode (per request)",
+        iterations,
+        lambda: jwt.decode(token, public_pem, algorithms=["RS256"]),
+    )
+    measure("keyring decode (parsed keys)", iterations, lambda: rs256.decode(token))
+    verifier = TokenVerifier(rs256, 10000)
+    measure("verifier, cached", iterations, lambda: verifier.decode(token))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+    main(args.iterations)
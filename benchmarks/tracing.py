@@ -0,0 +1,88 @@
+"""Overhead of the tracing instrumentation, per traced call.
+
+With TRACING_ENABLED off, @traced returns the functions unchanged, so
+the only cost left is the span lookup of the SQL event listeners. The
+other cases wrap a no-op coroutine the way @traced does when enabled.
+
+    python -m benchmarks.tracing --iterations 200000
+"""
+
+import argparse
+import asyncio
+import time
+
+from src.services.tracing import (
+    MemorySpanExporter,
+    SERVER,
+    current_span,
+    start_sql_span,
+    trace_function,
+    tracer,
+)
+
+
+async def noop():
+    return None
+
+
+async def measure_async(iterations: int, func) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        await func()
+    return (time.perf_counter() - start) / iterations
+
+
+def measure_sync(iterations: int, func) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations
+
+
+async def main(iterations: int, max_disabled_ns: float) -> int:
+    tracer.exporter = MemorySpanExporter()
+    tracer.max_queue = iterations
+    wrapped = trace_function(noop)
+
+    baseline = await measure_async(iterations, noop)
+    unsampled = await measure_async(iterations, wrapped)
+
+    root = tracer.start_root("benchmark", SERVER, f"00-{'1' * 32}-{'2' * 16}-01")
+    token = current_span.set(root)
+    try:
+        sampled = await measure_async(iterations, wrapped)
+    finally:
+        current_span.reset(token)
+    exported = len(tracer._queue)
+    await tracer.flush()
+
+    sql_lookup = measure_sync(iterations, lambda: start_sql_span("SELECT 1", "x"))
+
+    print(f"{'plain call':<28} {baseline * 1e9:>8.0f} ns")
+    rows = [
+        ("disabled (@traced is a no-op)", 0.0),
+        ("SQL listener, no trace", sql_lookup),
+        ("enabled, not sampled", unsampled - baseline),
+        ("enabled, sampled", sampled - baseline),
+    ]
+    for name, overhead in rows:
+        print(f"{name:<28} {overhead * 1e9:>+8.0f} ns/call")
+    print(f"spans recorded while sampled: {exported}, dropped: {tracer.dropped}")
+
+    if sql_lookup * 1e9 > max_disabled_ns:
+        print(f"overhead without a trace above {max_disabled_ns:.0f} ns")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=200000)
+    parser.add_argument(
+        "--max-disabled-ns",
+        type=float,
+        default=1000,
+        help="fail when the per statement cost without a trace is above it",
+    )
+    args = parser.parse_args()
+    raise SystemExit(asyncio.run(main(args.iterations, args.max_disabled_ns)))
@@ -1,34 +1,109 @@
-from fastapi import FastAPI, Request, status
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from starlette.responses import JSONResponse
-from src.api import contacts, groups, utils, auth, users
-from slowapi.errors import RateLimitExceeded
-from src.conf import messages
+from fastapi.staticfiles import StaticFiles
+from src.api import contacts, groups, utils, auth, users, metrics
+from src.conf.config import config
+from src.database.db import sessionmanager
+from src.services.avatars import avatar_worker
+from src.services.birthdays import refresh_birthday_digests
+from src.services.contacts import prune_contact_tombstones
+from src.services.email import email_worker, prune_sent_emails
+from src.services.hashing import hashing_pool
+from src.services.metrics import RequestMetricsMiddleware
+from src.services.monitoring import metrics_exporter
+from src.services.query_stats import QueryStatsMiddleware
+from src.services.rate_limit import RateLimitMiddleware, prune_rate_limit_buckets
+from src.services.scheduler import scheduler
+from src.services.sessions import prune_expired_sessions
+from src.services.tokens import prune_revoked_tokens
+from src.services.tracing import TracingMiddleware, tracer
+
+scheduler.add_job(
+    "prune_contact_tombstones",
+    config.SYNC_TOMBSTONE_PRUNE_INTERVAL,
+    prune_contact_tombstones,
+)
+scheduler.add_job(
+    "prune_sent_emails", config.EMAIL_OUTBOX_PRUNE_INTERVAL, prune_sent_emails
+)
+scheduler.add_job(
+    "prune_expired_sessions", config.SESSION_PRUNE_INTERVAL, prune_expired_sessions
+)
+scheduler.add_job(
+    "prune_revoked_tokens", config.SESSION_PRUNE_INTERVAL, prune_revoked_tokens
+)
+scheduler.add_job(
+    "prune_rate_limit_buckets",
+    config.RATE_LIMIT_PRUNE_INTERVAL,
+    prune_rate_limit_buckets,
+)
+scheduler.add_job(
+    "refresh_birthday_digests",
+    config.BIRTHDAY_DIGEST_INTERVAL,
+    refresh_birthday_digests,
+)
+
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    sessionmanager.start()
+    scheduler.start()
+    email_worker.start()
+    avatar_worker.start()
+    metrics_exporter.start()
+    tracer.start()
+    yield
+    await tracer.stop()
+    await metrics_exporter.stop()
+    await avatar_worker.stop()
+    await email_worker.stop()
+    await scheduler.stop()
+    hashing_pool.shutdown()
+    await sessionmanager.close()
 
+
+app = FastAPI(lifespan=lifespan)
+
+app.add_middleware(QueryStatsMiddleware)
+# outside of QueryStatsMiddleware, its log lines carry the trace id
+app.add_middleware(TracingMiddleware)
+app.add_middleware(RequestMetricsMiddleware)
+# added before CORS, so that CORS headers are set on 429 responses as well
+app.add_middleware(RateLimitMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:3000"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[
+        "X-Next-Cursor",
+        "ETag",
+        "RateLimit-Limit",
+        "RateLimit-Remaining",
+        "RateLimit-Reset",
+        "RateLimit-Policy",
+        "Retry-After",
+        "Server-Timing",
+    ],
 )
 
 
-@app.exception_handler(RateLimitExceeded)
-async def rate_limi_handler(request: Request, exc: RateLimitExceeded):
-    return JSONResponse(
-        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-        content={"error": messages.EXCEED_REQUESTS_LIMIT},
+if config.AVATAR_STORAGE == "local":
+    app.mount(
+        config.AVATAR_LOCAL_URL.rstrip("/"),
+        StaticFiles(directory=config.AVATAR_LOCAL_DIR, check_dir=False),
+        name="media",
     )
 
-
 app.include_router(contacts.router, prefix="/api")
 app.include_router(groups.router, prefix="/api")
 app.include_router(utils.router, prefix="/api")
 app.include_router(auth.router, prefix="/api")
 app.include_router(users.router, prefix="/api")
+app.include_router(metrics.router)
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,36 @@
+"""add birthday digests
+
+Revision ID: 1ac42d334c39
+Revises: 687443078d9d
+Create Date: 2026-10-18 06:48:07.271359
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '1ac42d334c39'
+down_revision: Union[str, None] = '687443078d9d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('birthday_digests',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('from_date', sa.Date(), nullable=False),
+    sa.Column('to_date', sa.Date(), nullable=False),
+    sa.Column('contacts_version', sa.Integer(), nullable=False),
+    sa.Column('contacts', sa.JSON(), nullable=False),
+    sa.Column('computed_at', sa.DateTime(), nullable=False),
+    sa.Column('emailed_on', sa.Date(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('birthday_digests')
@@ -0,0 +1,27 @@
+"""add contact version
+
+Revision ID: 2cb0f7173492
+Revises: bbb8adf7ca75
+Create Date: 2026-10-18 07:09:17.042311
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2cb0f7173492'
+down_revision: Union[str, None] = 'bbb8adf7ca75'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # the ETags given out so far (made of updated_at) stop matching
+    op.add_column('contact', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('contact', 'version')
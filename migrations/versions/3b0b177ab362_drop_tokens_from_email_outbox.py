@@ -0,0 +1,31 @@
+"""drop tokens from email outbox
+
+Revision ID: 3b0b177ab362
+Revises: 2cb0f7173492
+Create Date: 2026-10-18 07:15:00.551257
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3b0b177ab362'
+down_revision: Union[str, None] = '2cb0f7173492'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # confirmation tokens are made at send time now, the ones stored
+    # with the queued and sent emails are removed
+    op.execute(
+        "UPDATE email_outbox SET context = (context::jsonb - 'token')::json "
+        "WHERE template = 'confirm_email.html'"
+    )
+
+
+def downgrade() -> None:
+    pass
@@ -0,0 +1,50 @@
+"""add contact counts
+
+Revision ID: 5aa412193a4b
+Revises: 42f39e97df7c
+Create Date: 2026-10-18 06:56:09.511813
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5aa412193a4b'
+down_revision: Union[str, None] = '42f39e97df7c'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('group', sa.Column('contact_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('collection_versions', sa.Column('contact_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('collection_versions', sa.Column('active_contact_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('collection_versions', sa.Column('group_count', sa.Integer(), server_default='0', nullable=False))
+    # counts of the existing rows, the writes keep them from now on
+    op.execute(
+        'UPDATE "group" SET contact_count = '
+        '(SELECT COUNT(*) FROM contact_m2m_group WHERE group_id = "group".id)'
+    )
+    op.execute(
+        'INSERT INTO collection_versions (user_id) '
+        'SELECT id FROM users WHERE id NOT IN (SELECT user_id FROM collection_versions)'
+    )
+    op.execute(
+        'UPDATE collection_versions SET '
+        'contact_count = (SELECT COUNT(*) FROM contact '
+        'WHERE contact.user_id = collection_versions.user_id), '
+        'active_contact_count = (SELECT COUNT(*) FROM contact '
+        'WHERE contact.user_id = collection_versions.user_id AND contact.is_active), '
+        'group_count = (SELECT COUNT(*) FROM "group" '
+        'WHERE "group".user_id = collection_versions.user_id)'
+    )
+
+
+def downgrade() -> None:
+    op.drop_column('collection_versions', 'group_count')
+    op.drop_column('collection_versions', 'active_contact_count')
+    op.drop_column('collection_versions', 'contact_count')
+    op.drop_column('group', 'contact_count')
@@ -0,0 +1,35 @@
+"""add rate limit buckets
+
+Revision ID: 6c110551fc18
+Revises: 3b0b177ab362
+Create Date: 2026-10-18 07:33:18.955501
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6c110551fc18'
+down_revision: Union[str, None] = '3b0b177ab362'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('rate_limit_buckets',
+    sa.Column('key', sa.String(length=255), nullable=False),
+    sa.Column('tokens', sa.Float(), nullable=False),
+    sa.Column('allowed', sa.Boolean(), nullable=False),
+    sa.Column('updated_at', sa.Float(), nullable=False),
+    sa.Column('full_at', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('key')
+    )
+    op.create_index('ix_rate_limit_buckets_full_at', 'rate_limit_buckets', ['full_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_rate_limit_buckets_full_at', table_name='rate_limit_buckets')
+    op.drop_table('rate_limit_buckets')
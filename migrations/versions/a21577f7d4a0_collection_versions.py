@@ -0,0 +1,32 @@
+"""collection versions
+
+Revision ID: a21577f7d4a0
+Revises: b303620e1395
+Create Date: 2026-10-18 06:28:49.489114
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a21577f7d4a0'
+down_revision: Union[str, None] = 'b303620e1395'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('collection_versions',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('contacts', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('groups', sa.Integer(), server_default='0', nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('collection_versions')
@@ -0,0 +1,33 @@
+"""add contact birthday_md
+
+Revision ID: b303620e1395
+Revises: dd1613ccc3f9
+Create Date: 2026-10-18 06:16:35.253616
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b303620e1395'
+down_revision: Union[str, None] = 'dd1613ccc3f9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('contact', sa.Column('birthday_md', sa.Integer(), nullable=True))
+    op.execute(
+        'UPDATE contact SET birthday_md = '
+        'EXTRACT(MONTH FROM birthday) * 100 + EXTRACT(DAY FROM birthday)'
+    )
+    op.alter_column('contact', 'birthday_md', existing_type=sa.Integer(), nullable=False)
+    op.create_index('ix_contact_user_id_birthday_md', 'contact', ['user_id', 'birthday_md'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_contact_user_id_birthday_md', table_name='contact')
+    op.drop_column('contact', 'birthday_md')
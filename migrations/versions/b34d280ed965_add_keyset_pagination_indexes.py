@@ -0,0 +1,28 @@
+"""add keyset pagination indexes
+
+Revision ID: b34d280ed965
+Revises: e7ace7d4fffe
+Create Date: 2026-10-18 06:14:42.103862
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b34d280ed965'
+down_revision: Union[str, None] = 'e7ace7d4fffe'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_contact_user_id_surname_name_id', 'contact', ['user_id', 'surname', 'name', 'id'], unique=False)
+    op.create_index('ix_group_user_id_id', 'group', ['user_id', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_group_user_id_id', table_name='group')
+    op.drop_index('ix_contact_user_id_surname_name_id', table_name='contact')
@@ -0,0 +1,26 @@
+"""add contact_m2m_group group_id index
+
+Revision ID: bbb8adf7ca75
+Revises: 5aa412193a4b
+Create Date: 2026-10-18 06:57:50.664920
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'bbb8adf7ca75'
+down_revision: Union[str, None] = '5aa412193a4b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_contact_m2m_group_group_id_contact_id', 'contact_m2m_group', ['group_id', 'contact_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_contact_m2m_group_group_id_contact_id', table_name='contact_m2m_group')
@@ -0,0 +1,39 @@
+"""add trigram search indexes
+
+Revision ID: dd1613ccc3f9
+Revises: b34d280ed965
+Create Date: 2026-10-18 06:15:46.629935
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'dd1613ccc3f9'
+down_revision: Union[str, None] = 'b34d280ed965'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+SEARCH_COLUMNS = ('name', 'surname', 'email')
+
+
+def upgrade() -> None:
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for column in SEARCH_COLUMNS:
+        op.create_index(
+            f'ix_contact_{column}_trgm',
+            'contact',
+            [column],
+            unique=False,
+            postgresql_using='gin',
+            postgresql_ops={column: 'gin_trgm_ops'},
+        )
+
+
+def downgrade() -> None:
+    for column in SEARCH_COLUMNS:
+        op.drop_index(f'ix_contact_{column}_trgm', table_name='contact')
@@ -1,15 +1,14 @@
-from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Request, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi.security import OAuth2PasswordRequestForm
-from src.services.email import send_email
+from src.services.email import EmailService
 from src.schemas import TokenRefreshRequest, UserCreate, Token, UserBase, RequestEmail
 from src.services.auth import (
-    create_access_token,
     Hash,
-    create_refresh_token,
     get_email_from_token,
-    verify_refresh_token,
+    get_token_claims,
 )
+from src.services.sessions import SessionService, device_name
 from src.services.users import UserService
 from src.database.db import get_db
 from src.conf import messages
@@ -20,31 +19,17 @@ router = APIRouter(prefix="/auth", tags=["auth"])
 @router.post("/register", response_model=UserBase, status_code=status.HTTP_201_CREATED)
 async def register(
     body: UserCreate,
-    background_tasks: BackgroundTasks,
     request: Request,
     db: AsyncSession = Depends(get_db),
 ):
     user_service = UserService(db)
 
-    email_user = await user_service.get_user_by_email(body.email)
-    if email_user is not None:
-        raise HTTPException(
-            status_code=status.HTTP_409_CONFLICT,
-            detail=messages.USER_EMAIL_OR_NAME_ALREADY_EXISTS,
-        )
-
-    username_user = await user_service.get_user_by_username(body.username)
-    if username_user is not None:
-        raise HTTPException(
-            status_code=status.HTTP_409_CONFLICT,
-            detail=messages.USER_EMAIL_OR_NAME_ALREADY_EXISTS,
-        )
-
-    body.password = Hash().get_password_hash(body.password)
+    # duplicates are answered with 409 by create_user
+    body.password = await Hash().get_password_hash(body.password)
     new_user = await user_service.create_user(body)
 
-    background_tasks.add_task(
-        send_email, new_user.email, new_user.username, request.base_url
+    await EmailService(db).send_confirmation_email(
+        new_user.email, new_user.username, request.base_url
     )
     return new_user
 
@@ -52,12 +37,20 @@ async def register(
 # login
 @router.post("/login", response_model=Token)
 async def login_user(
-    form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)
+    request: Request,
+    form_data: OAuth2PasswordRequestForm = Depends(),
+    db: AsyncSession = Depends(get_db),
 ):
     user_service = UserService(db)
     user = await user_service.get_user_by_username(form_data.username)
 
-    if not user or not Hash().verify_password(form_data.password, user.hashed_password):
+    valid, new_hash = False, None
+    if user:
+        valid, new_hash = await Hash().verify_and_update(
+            form_data.password, user.hashed_password
+        )
+
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail=messages.INVALID_CREDENTIALS,
@@ -70,40 +63,28 @@ async def login_user(
             detail=messages.USER_NOT_CONFIRMED,
         )
 
-    # generate JWT
-    access_token = await create_access_token(data={"sub": user.username})
-    refresh_token = await create_refresh_token(data={"sub": user.username})
-    user.refresh_token = refresh_token
-    await db.commit()
-    await db.refresh(user)
-    return {
-        "access_token": access_token,
-        "refresh_token": refresh_token,
-        "token_type": "bearer",
-    }
+    # transparently rehash when the bcrypt cost factor has changed
+    if new_hash:
+        user.hashed_password = new_hash
+        await db.commit()
+    # a session per device, the users row is not written to
+    return await SessionService(db).sign_in(user, device_name(request))
 
 
 @router.post("/refresh-token", response_model=Token)
-async def new_token(request: TokenRefreshRequest, db: AsyncSession = Depends(get_db)):
+async def new_token(
+    body: TokenRefreshRequest, request: Request, db: AsyncSession = Depends(get_db)
+):
+    return await SessionService(db).refresh(body.refresh_token, device_name(request))
 
-    user = await verify_refresh_token(request.refresh_token, db)
 
-    if user is None:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail=messages.INVALID_REFRESH_TOKEN,
-        )
-
-    new_access_token = await create_access_token(data={"sub": user.username})
-    new_refresh_token = await create_refresh_token(data={"sub": user.username})
-    user.refresh_token = new_refresh_token
-    await db.commit()
-    await db.refresh(user)
-    return {
-        "access_token": new_access_token,
-        "refresh_token": new_refresh_token,
-        "token_type": "bearer",
-    }
+@router.post("/logout")
+async def logout(
+    claims: dict = Depends(get_token_claims),
+    db: AsyncSession = Depends(get_db),
+):
+    await SessionService(db).sign_out(claims)
+    return {"message": messages.LOGGED_OUT}
 
 
 # confirm email
@@ -126,7 +107,6 @@ async def confirm_email(token: str, db: AsyncSession = Depends(get_db)):
 @router.post("/request_email")
 async def request_email(
     body: RequestEmail,
-    background_tasks: BackgroundTasks,
     request: Request,
     db: AsyncSession = Depends(get_db),
 ):
@@ -141,5 +121,7 @@ async def request_email(
     if user.confirmed:
         return {"message": messages.USER_ALREADY_CONFIRMED}
 
-    background_tasks.add_task(send_email, user.email, user.username, request.base_url)
+    await EmailService(db).send_confirmation_email(
+        user.email, user.username, request.base_url
+    )
     return {"message": messages.EMAIL_SENT}
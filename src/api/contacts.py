@@ -1,33 +1,82 @@
+from contextlib import aclosing
 from typing import List
 from datetime import date
 
-from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi import (
+    APIRouter,
+    Body,
+    HTTPException,
+    Depends,
+    File,
+    Header,
+    Query,
+    Request,
+    Response,
+    UploadFile,
+    status,
+)
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.database.db import get_db
+from src.database.db import get_db, get_read_db, sessionmanager
 from src.database.models import User
 from src.schemas import (
     ContactModel,
     ContactUpdate,
     ContactIsActiveUpdate,
     ContactResponse,
+    ContactImportResult,
+    ContactChanges,
+    ContactStats,
 )
-from src.services.contacts import ContactService
+from src.services.birthdays import BirthdayDigestService
+from src.services.contacts import ContactService, read_csv_rows
+from src.services.export import ContactExportService, ExportFormat, MEDIA_TYPES
 from src.services.auth import get_current_user
+from src.services.etag import (
+    collection_etag,
+    contact_etag,
+    etag_matches,
+    not_modified,
+)
+from src.services.pagination import clamp_limit
 
 router = APIRouter(prefix="/contacts", tags=["contacts"])
 
 
-@router.get("/", response_model=List[ContactResponse])
+@router.get(
+    "/",
+    response_model=List[ContactResponse],
+    description=(
+        "Pass the X-Next-Cursor header value as cursor to get the next page. "
+        "limit is cut to PAGE_MAX_LIMIT (200 by default). "
+        "Answers 304 when If-None-Match has the ETag of an unchanged page"
+    ),
+)
 async def read_contacts(
+    response: Response,
     skip: int = 0,
     limit: int = 20,
     query: str | None = None,
-    db: AsyncSession = Depends(get_db),
+    cursor: str | None = None,
+    if_none_match: str | None = Header(None),
+    db: AsyncSession = Depends(get_read_db),
     user: User = Depends(get_current_user),
 ):
+    limit = clamp_limit(limit)
     contact_service = ContactService(db)
-    contacts = await contact_service.get_contacts(skip, limit, query, user)
+    # the page changes only with the collection version, no need to query it
+    version = await contact_service.get_collection_version(user)
+    etag = collection_etag("contacts", user.id, version, skip, limit, query, cursor)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+
+    contacts, next_cursor = await contact_service.get_contacts(
+        skip, limit, query, user, cursor
+    )
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    response.headers["ETag"] = etag
     return contacts
 
 
@@ -41,13 +90,108 @@ async def create_contact(
     return await contact_service.create_contact(body, user)
 
 
+@router.post(
+    "/bulk",
+    response_model=ContactImportResult,
+    description="Rows are validated one by one, invalid rows are reported and skipped",
+)
+async def create_contacts_bulk(
+    body: List[dict] = Body(),
+    db: AsyncSession = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    contact_service = ContactService(db)
+    return await contact_service.import_contacts(body, user)
+
+
+@router.post(
+    "/import",
+    response_model=ContactImportResult,
+    description=(
+        "CSV with the columns name, surname, email, phone_number, birthday "
+        "and groups (group ids separated by ';')"
+    ),
+)
+async def import_contacts_csv(
+    file: UploadFile = File(),
+    db: AsyncSession = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    contact_service = ContactService(db)
+    # closed here, import_contacts may stop before the last row
+    async with aclosing(read_csv_rows(file)) as rows:
+        return await contact_service.import_contacts(rows, user)
+
+
+@router.get(
+    "/export",
+    response_class=StreamingResponse,
+    description="Streams all contacts of the user as CSV, NDJSON or vCard",
+)
+async def export_contacts(
+    request: Request,
+    format: ExportFormat = "csv",
+    user: User = Depends(get_current_user),
+):
+    # the response outlives the request dependencies,
+    # so the stream uses its own session
+    async def content():
+        async with sessionmanager.read_session(request) as db:
+            async for chunk in ContactExportService(db).export(format, user):
+                yield chunk
+
+    return StreamingResponse(
+        content(),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="contacts.{format}"'},
+    )
+
+
+@router.get(
+    "/changes",
+    response_model=ContactChanges,
+    description=(
+        "Contacts changed and ids of contacts deleted since the since token. "
+        "Without since returns all contacts; pass next_token as since on the next "
+        "call, right away while has_more is true. 410 means a full sync is needed"
+    ),
+)
+async def read_contact_changes(
+    since: str | None = None,
+    limit: int = Query(100, ge=1, le=500),
+    # the primary, a lagging replica could move the watermark past
+    # changes it has not received yet
+    db: AsyncSession = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    contact_service = ContactService(db)
+    return await contact_service.get_changes(since, limit, user)
+
+
+@router.get(
+    "/stats",
+    response_model=ContactStats,
+    description="Numbers of contacts, active contacts and groups of the user",
+)
+async def read_contact_stats(
+    db: AsyncSession = Depends(get_read_db),
+    user: User = Depends(get_current_user),
+):
+    contact_service = ContactService(db)
+    return await contact_service.get_stats(user)
+
+
 @router.get("/birthday", response_model=List[ContactResponse])
 async def filter_contacts_by_birthday(
     from_date: date | None = None,
     to_date: date | None = None,
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     user: User = Depends(get_current_user),
 ):
+    if from_date is None and to_date is None:
+        # the default window, precomputed by the digest job
+        return await BirthdayDigestService(db).get_upcoming_birthdays(user)
+
     contact_service = ContactService(db)
     contacts = await contact_service.get_contacts_by_birthday(from_date, to_date, user)
     return contacts
@@ -56,58 +200,88 @@ async def filter_contacts_by_birthday(
 @router.get("/{contact_id}", response_model=ContactResponse)
 async def read_contact(
     contact_id: int,
-    db: AsyncSession = Depends(get_db),
+    response: Response,
+    if_none_match: str | None = Header(None),
+    db: AsyncSession = Depends(get_read_db),
     user: User = Depends(get_current_user),
 ):
     contact_service = ContactService(db)
+    if if_none_match:
+        # a single column lookup instead of loading the contact with its groups
+        etag = await contact_service.get_contact_etag(contact_id, user)
+        if etag and etag_matches(if_none_match, etag):
+            return not_modified(etag)
+
     contact = await contact_service.get_contact(contact_id, user)
     if contact is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Contact not found"
         )
+    response.headers["ETag"] = contact_etag(contact.id, contact.version)
     return contact
 
 
-@router.put("/{contact_id}", response_model=ContactResponse)
+@router.put(
+    "/{contact_id}",
+    response_model=ContactResponse,
+    description="With If-Match the contact is updated only if its ETag matches",
+)
 async def update_contact(
     contact_id: int,
     body: ContactUpdate,
+    response: Response,
+    if_match: str | None = Header(None),
     db: AsyncSession = Depends(get_db),
     user: User = Depends(get_current_user),
 ):
     contact_service = ContactService(db)
-    contact = await contact_service.update_contact(contact_id, body, user)
+    contact = await contact_service.update_contact(contact_id, body, user, if_match)
     if contact is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Contact not found"
         )
+    response.headers["ETag"] = contact_etag(contact.id, contact.version)
     return contact
 
 
-@router.patch("/{contact_id}", response_model=ContactResponse)
+@router.patch(
+    "/{contact_id}",
+    response_model=ContactResponse,
+    description="With If-Match the contact is updated only if its ETag matches",
+)
 async def update_contact_is_active(
     contact_id: int,
     body: ContactIsActiveUpdate,
+    response: Response,
+    if_match: str | None = Header(None),
     db: AsyncSession = Depends(get_db),
     user: User = Depends(get_current_user),
 ):
     contact_service = ContactService(db)
-    contact = await contact_service.update_contact_is_active(contact_id, body, user)
+    contact = await contact_service.update_contact_is_active(
+        contact_id, body, user, if_match
+    )
     if contact is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Contact not found"
         )
+    response.headers["ETag"] = contact_etag(contact.id, contact.version)
     return contact
 
 
-@router.delete("/{contact_id}", response_model=ContactResponse)
+@router.delete(
+    "/{contact_id}",
+    response_model=ContactResponse,
+    description="With If-Match the contact is deleted only if its ETag matches",
+)
 async def remove_contact(
     contact_id: int,
+    if_match: str | None = Header(None),
     db: AsyncSession = Depends(get_db),
     user: User = Depends(get_current_user),
 ):
     contact_service = ContactService(db)
-    contact = await contact_service.remove_contact(contact_id, user)
+    contact = await contact_service.remove_contact(contact_id, user, if_match)
     if contact is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Contact not found"
@@ -1,33 +1,60 @@
 from typing import List
 
-from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi import APIRouter, HTTPException, Depends, Header, Response, status
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.database.db import get_db
+from src.database.db import get_db, get_read_db
 from src.database.models import User
-from src.schemas import GroupModel, GroupResponse
+from src.schemas import (
+    ContactResponse,
+    GroupMembersUpdate,
+    GroupModel,
+    GroupResponse,
+)
 from src.services.groups import GroupService
 from src.services.auth import get_current_user
+from src.services.etag import collection_etag, etag_matches, not_modified
+from src.services.pagination import clamp_limit
 
 router = APIRouter(prefix="/groups", tags=["groups"])
 
 
-@router.get("/", response_model=List[GroupResponse])
+@router.get(
+    "/",
+    response_model=List[GroupResponse],
+    description=(
+        "Pass the X-Next-Cursor header value as cursor to get the next page. "
+        "limit is cut to PAGE_MAX_LIMIT (200 by default). "
+        "Answers 304 when If-None-Match has the ETag of an unchanged page"
+    ),
+)
 async def read_groups(
+    response: Response,
     skip: int = 0,
     limit: int = 50,
-    db: AsyncSession = Depends(get_db),
+    cursor: str | None = None,
+    if_none_match: str | None = Header(None),
+    db: AsyncSession = Depends(get_read_db),
     user: User = Depends(get_current_user),
 ):
+    limit = clamp_limit(limit)
     group_service = GroupService(db)
-    groups = await group_service.get_groups(skip, limit, user)
+    version = await group_service.get_collection_version(user)
+    etag = collection_etag("groups", user.id, version, skip, limit, cursor)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+
+    groups, next_cursor = await group_service.get_groups(skip, limit, user, cursor)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    response.headers["ETag"] = etag
     return groups
 
 
-@router.get("/{group_id", response_model=GroupResponse)
+@router.get("/{group_id}", response_model=GroupResponse)
 async def read_group(
     group_id: int,
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     user: User = Depends(get_current_user),
 ):
     group_service = GroupService(db)
@@ -41,6 +68,93 @@ async def read_group(
     return group
 
 
+@router.get(
+    "/{group_id}/contacts",
+    response_model=List[ContactResponse],
+    description=(
+        "Contacts of the group, by id. Pass the X-Next-Cursor header value as "
+        "cursor to get the next page, limit is cut to PAGE_MAX_LIMIT (200 by "
+        "default). Answers 304 when If-None-Match has the ETag of an unchanged "
+        "page"
+    ),
+)
+async def read_group_contacts(
+    group_id: int,
+    response: Response,
+    limit: int = 50,
+    cursor: str | None = None,
+    if_none_match: str | None = Header(None),
+    db: AsyncSession = Depends(get_read_db),
+    user: User = Depends(get_current_user),
+):
+    limit = clamp_limit(limit)
+    group_service = GroupService(db)
+    group = await group_service.get_group(group_id, user)
+    if group is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Group not found"
+        )
+
+    version = await group_service.get_contacts_version(user)
+    etag = collection_etag("group_contacts", user.id, group_id, version, limit, cursor)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+
+    contacts, next_cursor = await group_service.get_group_contacts(
+        group, limit, user, cursor
+    )
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    response.headers["ETag"] = etag
+    return contacts
+
+
+@router.post(
+    "/{group_id}/contacts",
+    response_model=GroupResponse,
+    description=(
+        "Adds the contacts to the group. "
+        "Unknown ids and contacts already in the group are skipped"
+    ),
+)
+async def add_group_contacts(
+    group_id: int,
+    body: GroupMembersUpdate,
+    db: AsyncSession = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    group_service = GroupService(db)
+    group = await group_service.get_group(group_id, user)
+    if group is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Group not found"
+        )
+    return await group_service.add_contacts(group, body.contact_ids, user)
+
+
+@router.post(
+    "/{group_id}/contacts/remove",
+    response_model=GroupResponse,
+    description=(
+        "Removes the contacts from the group. "
+        "Ids of contacts not in the group are skipped"
+    ),
+)
+async def remove_group_contacts(
+    group_id: int,
+    body: GroupMembersUpdate,
+    db: AsyncSession = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    group_service = GroupService(db)
+    group = await group_service.get_group(group_id, user)
+    if group is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Group not found"
+        )
+    return await group_service.remove_contacts(group, body.contact_ids, user)
+
+
 @router.post("/", response_model=GroupResponse, status_code=status.HTTP_201_CREATED)
 async def create_group(
     body: GroupModel,
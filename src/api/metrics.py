@@ -0,0 +1,16 @@
+from fastapi import APIRouter, Depends
+from fastapi.responses import PlainTextResponse
+
+from src.services.auth import require_internal_token
+from src.services.monitoring import metrics_exporter
+
+# scraped with the INTERNAL_TOKEN as bearer token
+router = APIRouter(tags=["metrics"], dependencies=[Depends(require_internal_token)])
+
+
+@router.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def metrics():
+    return PlainTextResponse(
+        await metrics_exporter.render(),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
@@ -1,41 +1,42 @@
-from fastapi import APIRouter, Depends, File, Request, UploadFile
+from fastapi import APIRouter, Depends, File, Response, UploadFile, status
 from sqlalchemy.ext.asyncio import AsyncSession
-from slowapi import Limiter
-from slowapi.util import get_remote_address
 from src.database.db import get_db
-from src.services.upload_file import UploadFileService
-from src.services.users import UserService
+from src.services.avatars import AvatarService
 from src.schemas import UserBase
 from src.services.auth import get_current_user
 from src.database.models import User
-from src.conf.config import config
 
 
 router = APIRouter(prefix="/users", tags=["users"])
-limiter = Limiter(key_func=get_remote_address)
 
 
 @router.get(
-    "/me", response_model=UserBase, description="No more than 10 requests per minute"
+    "/me",
+    response_model=UserBase,
+    description="Rate limited, see the RateLimit-* response headers",
 )
-@limiter.limit("10/minute")
 async def me(
-    request: Request,
     user: User = Depends(get_current_user),
 ):
     return user
 
 
-@router.patch("/avatar", response_model=UserBase)
+@router.patch(
+    "/avatar",
+    response_model=UserBase,
+    status_code=status.HTTP_202_ACCEPTED,
+    description=(
+        "The avatar is processed in the background (202), "
+        "an already uploaded image is applied right away (200)"
+    ),
+)
 async def update_avatar(
+    response: Response,
     file: UploadFile = File(),
     user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db),
 ):
-    avatar_url = UploadFileService(
-        config.CLD_NAME, config.CLD_API_KEY, config.CLD_API_SECRET
-    ).upload_file(file, user.username)
-
-    user_service = UserService(db)
-    user = await user_service.update_avatar_url(user.email, avatar_url)
+    user, updated = await AvatarService(db).update_avatar(file, user)
+    if updated:
+        response.status_code = status.HTTP_200_OK
     return user
@@ -2,7 +2,11 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import text
 
-from src.database.db import get_db
+from src.database.db import get_db, sessionmanager
+from src.repository.emails import EmailOutboxRepository
+from src.services.auth import require_internal_token
+from src.services.avatars import avatar_worker
+from src.services.email import email_worker
 
 
 router = APIRouter(tags=["utils"])
@@ -27,3 +31,31 @@ async def healthchecker(db: AsyncSession = Depends(get_db)):
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Error connecting to the database",
         )
+
+
+@router.get(
+    "/healthchecker/pool",
+    include_in_schema=False,
+    dependencies=[Depends(require_internal_token)],
+)
+async def pool_stats():
+    return sessionmanager.pool_stats()
+
+
+@router.get(
+    "/healthchecker/email",
+    include_in_schema=False,
+    dependencies=[Depends(require_internal_token)],
+)
+async def email_stats(db: AsyncSession = Depends(get_db)):
+    outbox = await EmailOutboxRepository(db).count_by_status()
+    return {**email_worker.stats(), "outbox": outbox}
+
+
+@router.get(
+    "/healthchecker/avatars",
+    include_in_schema=False,
+    dependencies=[Depends(require_internal_token)],
+)
+async def avatar_stats():
+    return avatar_worker.stats()
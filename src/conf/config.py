@@ -1,13 +1,58 @@
+from typing import Literal
+
 from pydantic import ConfigDict, EmailStr
 from pydantic_settings import BaseSettings
 
 
 class Config(BaseSettings):
     DB_URL: str
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: int = 30
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    DB_STATEMENT_CACHE_SIZE: int = 100
+    DB_REPLICA_URLS: list[str] = []
+    DB_REPLICA_STRATEGY: Literal["round_robin", "least_connections"] = "round_robin"
+    DB_REPLICA_HEALTHCHECK_INTERVAL: int = 10
+    DB_REPLICA_HEALTHCHECK_TIMEOUT: int = 2
+    DB_READ_YOUR_WRITES_SECONDS: int = 5
+    DB_SLOW_QUERY_MS: int = 200
+    # requests sending more statements are logged as warnings (N+1 suspects)
+    DB_QUERY_COUNT_WARN: int = 20
+    # per request database timings in the Server-Timing response header
+    SERVER_TIMING_HEADER: bool = True
+    # bearer token of the monitoring routes (/healthchecker/*, /metrics),
+    # they answer 404 without it
+    INTERNAL_TOKEN: str | None = None
+    # shared by the worker processes, to aggregate their metrics
+    METRICS_DIR: str | None = None
+    METRICS_FLUSH_INTERVAL: int = 5
+    METRICS_STALE_SECONDS: int = 60
+    TRACING_ENABLED: bool = False
+    # share of the traces started here that are recorded, 0.0 to 1.0
+    TRACING_SAMPLE_RATIO: float = 1.0
+    TRACING_SERVICE_NAME: str = "contacts-api"
+    # "file" writes OTLP/JSON lines, "memory" keeps the spans for tests
+    TRACING_EXPORTER: Literal["file", "memory"] = "file"
+    TRACING_FILE: str = "traces.jsonl"
+    TRACING_FLUSH_INTERVAL: float = 5
+    TRACING_MAX_QUEUE: int = 10000
     JWT_SECRET: str
     JWT_ALGORITHM: str = "HS256"
     JWT_EXPIRATION_SECONDS: int = 3600
     JWT_REFRESH_EXPIRATION_SECONDS: int = 60 * 24 * 7
+    # kid of the signing key; tokens without a kid are checked with JWT_SECRET,
+    # or with the signing key when there is no kid
+    JWT_KEY_ID: str | None = None
+    # secret or PEM private key (inline or a .pem path), JWT_SECRET without it
+    JWT_SIGNING_KEY: str | None = None
+    # kid -> secret or PEM public key, JSON; keys being rotated in or out
+    JWT_VERIFICATION_KEYS: dict[str, str] = {}
+    JWT_VERIFY_CACHE_SIZE: int = 10000
+    SESSION_PRUNE_INTERVAL: int = 3600
+    # how long a logout may take to reach the other workers without CACHE_URL
+    JWT_REVOCATION_SYNC_SECONDS: float = 1.0
 
     MAIL_USERNAME: EmailStr
     MAIL_PASSWORD: str
@@ -19,11 +64,77 @@ class Config(BaseSettings):
     MAIL_SSL_TLS: bool = True
     USE_CREDENTIALS: bool = True
     VALIDATE_CERTS: bool = True
+    # memory - messages are kept in the process, for tests and local runs
+    EMAIL_TRANSPORT: Literal["smtp", "memory"] = "smtp"
+    EMAIL_SMTP_CONNECTIONS: int = 2
+    EMAIL_SMTP_TIMEOUT: int = 30
+    EMAIL_BATCH_SIZE: int = 50
+    EMAIL_POLL_INTERVAL: float = 2.0
+    EMAIL_LEASE_SECONDS: int = 300
+    EMAIL_MAX_ATTEMPTS: int = 8
+    EMAIL_RETRY_BASE_SECONDS: int = 30
+    EMAIL_RETRY_MAX_SECONDS: int = 3600
+    EMAIL_OUTBOX_RETENTION_DAYS: int = 7
+    EMAIL_OUTBOX_PRUNE_INTERVAL: int = 3600
 
     CLD_NAME: str
     CLD_API_KEY: int = 0
     CLD_API_SECRET: str = ""
 
+    AVATAR_STORAGE: Literal["cloudinary", "local"] = "cloudinary"
+    AVATAR_LOCAL_DIR: str = "media"
+    AVATAR_LOCAL_URL: str = "/media/"
+    AVATAR_MAX_BYTES: int = 5 * 1024 * 1024
+    AVATAR_SIZE: int = 250
+    AVATAR_WORKERS: int = 2
+    AVATAR_QUEUE_SIZE: int = 100
+    # on shutdown, for the queued avatars to be processed
+    AVATAR_DRAIN_TIMEOUT_SECONDS: float = 30
+    AVATAR_HASH_TTL_SECONDS: int = 30 * 24 * 3600
+
+    # larger limits of the list routes are cut to this, not rejected
+    PAGE_MAX_LIMIT: int = 200
+    CONTACT_IMPORT_BATCH_SIZE: int = 500
+    CONTACT_IMPORT_MAX_ROWS: int = 10000
+    CONTACT_EXPORT_CHUNK_SIZE: int = 500
+    SYNC_OVERLAP_SECONDS: int = 5
+    SYNC_TOMBSTONE_RETENTION_DAYS: int = 30
+    SYNC_TOMBSTONE_PRUNE_INTERVAL: int = 3600
+    # default window of GET /api/contacts/birthday, precomputed per user
+    BIRTHDAY_WINDOW_DAYS: int = 7
+    BIRTHDAY_DIGEST_INTERVAL: int = 3600
+    BIRTHDAY_DIGEST_BATCH_SIZE: int = 500
+    BIRTHDAY_DIGEST_EMAIL: bool = False
+
+    # shared by all the workers, per process without it (a user changed on
+    # another worker is then seen up to USER_CACHE_TTL_SECONDS late);
+    # logouts (revoked tokens) are kept there, in the database without it
+    CACHE_URL: str | None = None
+    CACHE_MAX_SIZE: int = 10000
+    USER_CACHE_TTL_SECONDS: int = 60
+
+    # redis for the buckets, shared by all the workers; in the database
+    # (rate_limit_buckets) without it
+    RATE_LIMIT_URL: str | None = None
+    RATE_LIMIT_PRUNE_INTERVAL: int = 3600
+    # "METHOD /path": "<count>/<second|minute|hour|day>", token buckets
+    # that hold count tokens and refill at count per period; the path may
+    # be a route template, e.g. "PUT /api/contacts/{contact_id}"
+    RATE_LIMITS: dict[str, str] = {
+        "GET /api/users/me": "10/minute",
+        "POST /api/auth/login": "10/minute",
+        "POST /api/auth/register": "5/minute",
+        "POST /api/auth/request_email": "3/minute",
+    }
+    # for the routes not listed in RATE_LIMITS, none by default
+    RATE_LIMIT_DEFAULT: str | None = None
+    RATE_LIMIT_TRUST_FORWARDED: bool = False
+
+    BCRYPT_ROUNDS: int = 12
+    HASH_EXECUTOR: Literal["thread", "process"] = "thread"
+    HASH_WORKERS: int = 4
+    HASH_QUEUE_SIZE: int = 64
+
     model_config = ConfigDict(
         extra="ignore", env_file=".env", env_file_encoding="utf-8", case_sensitive=True
     )
@@ -11,3 +11,16 @@ USER_ALREADY_CONFIRMED = "Your email is already confirmed"
 USER_CONFIRMED = "Your email is confirmed"
 UNEXISTING_TOKEN = "Unexisting token for mail confirmation"
 EMAIL_SENT = "Email with confirmation sent"
+HASHING_POOL_BUSY = "Server is busy, please try again later"
+INVALID_CURSOR = "Invalid pagination cursor"
+SEARCH_CURSOR_UNSUPPORTED = "Cursor pagination is not supported for search queries"
+INVALID_DATE_RANGE = "to_date must not be earlier than from_date"
+IMPORT_ROWS_LIMIT = "Import rows limit exceeded, the rest of the rows were skipped"
+FIELD_REQUIRED = "Field required"
+UNKNOWN_GROUPS = "Unknown group ids"
+PRECONDITION_FAILED = "Contact was changed by another request, fetch it and retry"
+SYNC_TOKEN_EXPIRED = "Sync token has expired, a full sync is required"
+AVATAR_NOT_IMAGE = "Avatar must be an image"
+AVATAR_TOO_LARGE = "Avatar file is too large"
+AVATAR_QUEUE_FULL = "Too many avatar uploads in progress, please try again later"
+LOGGED_OUT = "Logged out"
@@ -1,22 +1,231 @@
+import asyncio
 import contextlib
+import contextvars
+import logging
+import time
+from dataclasses import dataclass
 
-from sqlalchemy.exc import SQLAlchemyError
+from fastapi import Request
+from sqlalchemy import event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import SQLAlchemyError, TimeoutError as PoolTimeoutError
 from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from src.conf.config import config
+from src.services.metrics import Histogram
+from src.services.tracing import start_sql_span, tracer
+
+logger = logging.getLogger(__name__)
+
+# pool checkout wait buckets, in seconds
+POOL_WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0)
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """Queue pool that records how long callers wait for a connection."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.wait_time = Histogram(POOL_WAIT_BUCKETS)
+        self.timeouts = 0
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        except PoolTimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            self.wait_time.observe(time.perf_counter() - start)
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size(),
+            "checked_in": self.checkedin(),
+            "checked_out": self.checkedout(),
+            "overflow": self.overflow(),
+            "timeouts": self.timeouts,
+            "wait_time": self.wait_time.snapshot(),
+        }
+
+
+@dataclass
+class QueryStats:
+    """SQL statements sent on behalf of one HTTP request."""
+
+    count: int = 0
+    duration: float = 0.0
+    slowest: float = 0.0
+    slowest_statement: str | None = None
+
+
+# set per request by QueryStatsMiddleware, SQLAlchemy carries the context
+# into the greenlets the statements run in
+current_query_stats: contextvars.ContextVar[QueryStats | None] = contextvars.ContextVar(
+    "current_query_stats", default=None
+)
+
+
+def parameter_shape(parameters) -> str:
+    # types only, values may be personal data
+    if isinstance(parameters, dict):
+        return repr({key: type(value).__name__ for key, value in parameters.items()})
+    if isinstance(parameters, (list, tuple)):
+        if parameters and isinstance(parameters[0], (dict, list, tuple)):
+            return f"{len(parameters)} x {parameter_shape(parameters[0])}"
+        return repr([type(value).__name__ for value in parameters])
+    return type(parameters).__name__
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_span", []).append(
+        start_sql_span(statement, conn.dialect.name)
+    )
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    span = conn.info["query_span"].pop()
+    if span is not None:
+        tracer.end(span)
+    stats = current_query_stats.get()
+    if stats is not None:
+        stats.count += 1
+        stats.duration += elapsed
+        if elapsed > stats.slowest:
+            stats.slowest = elapsed
+            stats.slowest_statement = statement
+
+    if elapsed * 1000 >= config.DB_SLOW_QUERY_MS:
+        logger.warning(
+            "Slow query %.1f ms: %s parameters: %s",
+            elapsed * 1000,
+            " ".join(statement.split())[:1000],
+            parameter_shape(parameters),
+        )
+
+
+def _discard_query_start(context) -> None:
+    # the statement failed, after_cursor_execute won't pop its start time
+    info = context.connection.info if context.connection is not None else {}
+    if info.get("query_start"):
+        info["query_start"].pop()
+
+
+def _end_failed_span(context) -> None:
+    info = context.connection.info if context.connection is not None else {}
+    span = info["query_span"].pop() if info.get("query_span") else None
+    if span is not None:
+        span.set_error(context.original_exception)
+        tracer.end(span)
+
+
+def instrument_engine(engine: AsyncEngine) -> None:
+    event.listen(engine.sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine.sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine.sync_engine, "handle_error", _discard_query_start)
+    event.listen(engine.sync_engine, "handle_error", _end_failed_span)
+
+
+def create_engine(url: str) -> AsyncEngine:
+    connect_args = {}
+    if make_url(url).drivername == "postgresql+asyncpg":
+        connect_args["statement_cache_size"] = config.DB_STATEMENT_CACHE_SIZE
+
+    return create_async_engine(
+        url,
+        poolclass=InstrumentedPool,
+        pool_size=config.DB_POOL_SIZE,
+        max_overflow=config.DB_MAX_OVERFLOW,
+        pool_timeout=config.DB_POOL_TIMEOUT,
+        pool_recycle=config.DB_POOL_RECYCLE,
+        pool_pre_ping=config.DB_POOL_PRE_PING,
+        connect_args=connect_args,
+    )
+
+
+class PrimarySession(Session):
+    pass
+
+
+@event.listens_for(PrimarySession, "after_commit")
+def _remember_write(session: Session):
+    # reads of this user go to the primary for a while, see is_sticky()
+    manager = session.info.get("manager")
+    request = session.info.get("request")
+    user_id = getattr(request.state, "user_id", None) if request else None
+    if manager is not None and user_id is not None:
+        manager.mark_write(user_id)
+
+
+class ReadSession(Session):
+    """Session that routes all its statements to one replica.
+
+    The replica is picked on the first statement, when the user of the
+    request is already known, so that read-your-writes can be honoured.
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if "engine" not in self.info:
+            request = self.info.get("request")
+            user_id = getattr(request.state, "user_id", None) if request else None
+            self.info["engine"] = self.info["manager"].read_engine(user_id)
+        return self.info["engine"].sync_engine
 
 
 class DatabaseSessionManager:
-    def __init__(self, url: str):
-        self._engine: AsyncEngine | None = create_async_engine(url)
+    def __init__(self, url: str, replica_urls: list[str] | None = None):
+        self._engine: AsyncEngine | None = create_engine(url)
+        instrument_engine(self._engine)
         self._session_maker: async_sessionmaker = async_sessionmaker(
-            autoflush=False, autocommit=False, bind=self._engine
+            autoflush=False,
+            autocommit=False,
+            expire_on_commit=False,
+            bind=self._engine,
+            sync_session_class=PrimarySession,
         )
+        self._read_session_maker: async_sessionmaker = async_sessionmaker(
+            autoflush=False,
+            autocommit=False,
+            expire_on_commit=False,
+            sync_session_class=ReadSession,
+        )
+
+        self._replicas: list[AsyncEngine] = []
+        for replica_url in replica_urls or []:
+            replica = create_engine(replica_url)
+            instrument_engine(replica)
+            event.listen(replica.sync_engine, "handle_error", self._on_replica_error)
+            self._replicas.append(replica)
+        self._healthy: set[AsyncEngine] = set(self._replicas)
+        self._next_replica = 0
+        self._last_writes: dict[int, float] = {}
+        self._health_task: asyncio.Task | None = None
 
     @contextlib.asynccontextmanager
-    async def session(self):
+    async def session(self, request: Request | None = None):
         if self._session_maker is None:
             raise Exception("Database session is not initialized")
-        session = self._session_maker()
+        session = self._session_maker(info={"manager": self, "request": request})
+        try:
+            yield session
+        except SQLAlchemyError as e:
+            await session.rollback()
+            raise  # re-raise the original error
+        finally:
+            await session.close()
+
+    @contextlib.asynccontextmanager
+    async def read_session(self, request: Request | None = None):
+        if not self._replicas:
+            async with self.session(request) as session:
+                yield session
+            return
+
+        session = self._read_session_maker(info={"manager": self, "request": request})
         try:
             yield session
         except SQLAlchemyError as e:
@@ -25,10 +234,89 @@ class DatabaseSessionManager:
         finally:
             await session.close()
 
+    def mark_write(self, user_id: int) -> None:
+        now = time.monotonic()
+        self._last_writes[user_id] = now
+        if len(self._last_writes) > 10000:
+            window = config.DB_READ_YOUR_WRITES_SECONDS
+            self._last_writes = {
+                key: value
+                for key, value in self._last_writes.items()
+                if now - value < window
+            }
+
+    def is_sticky(self, user_id: int | None) -> bool:
+        last_write = self._last_writes.get(user_id)
+        if last_write is None:
+            return False
+        return time.monotonic() - last_write < config.DB_READ_YOUR_WRITES_SECONDS
+
+    def read_engine(self, user_id: int | None = None) -> AsyncEngine:
+        healthy = [replica for replica in self._replicas if replica in self._healthy]
+        if not healthy or self.is_sticky(user_id):
+            return self._engine
+
+        if config.DB_REPLICA_STRATEGY == "least_connections":
+            return min(healthy, key=lambda replica: replica.pool.checkedout())
+
+        self._next_replica = (self._next_replica + 1) % len(healthy)
+        return healthy[self._next_replica]
+
+    def _on_replica_error(self, context) -> None:
+        if context.is_disconnect and context.engine is not None:
+            for replica in self._replicas:
+                if replica.sync_engine is context.engine:
+                    self._healthy.discard(replica)
+
+    async def check_replicas(self) -> None:
+        for replica in self._replicas:
+            try:
+                async with asyncio.timeout(config.DB_REPLICA_HEALTHCHECK_TIMEOUT):
+                    async with replica.connect() as connection:
+                        await connection.execute(text("SELECT 1"))
+                self._healthy.add(replica)
+            except Exception as e:
+                self._healthy.discard(replica)
 
-sessionmanager = DatabaseSessionManager(config.DB_URL)
+    async def _run_health_checks(self) -> None:
+        while True:
+            await asyncio.sleep(config.DB_REPLICA_HEALTHCHECK_INTERVAL)
+            await self.check_replicas()
+
+    def start(self) -> None:
+        if self._replicas and self._health_task is None:
+            self._health_task = asyncio.create_task(self._run_health_checks())
+
+    async def close(self) -> None:
+        if self._health_task is not None:
+            self._health_task.cancel()
+            self._health_task = None
+        for engine in [self._engine, *self._replicas]:
+            await engine.dispose()
+
+    def pool_stats(self) -> dict:
+        return {
+            "primary": self._engine.pool.stats(),
+            "replicas": [
+                {
+                    "host": replica.url.host,
+                    "healthy": replica in self._healthy,
+                    **replica.pool.stats(),
+                }
+                for replica in self._replicas
+            ],
+        }
+
+
+sessionmanager = DatabaseSessionManager(config.DB_URL, config.DB_REPLICA_URLS)
+
+
+async def get_db(request: Request):
+    async with sessionmanager.session(request) as session:
+        yield session
 
 
-async def get_db():
-    async with sessionmanager.session() as session:
+# for read-only routes, may be served by a replica
+async def get_read_db(request: Request):
+    async with sessionmanager.read_session(request) as session:
         yield session
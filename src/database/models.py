@@ -1,8 +1,27 @@
 from datetime import datetime, date
 from typing import Optional
 
-from sqlalchemy import Column, Integer, String, Boolean, Table, UniqueConstraint, func
-from sqlalchemy.orm import relationship, mapped_column, Mapped, DeclarativeBase
+from sqlalchemy import (
+    JSON,
+    Column,
+    Float,
+    Index,
+    Integer,
+    String,
+    Text,
+    Boolean,
+    Table,
+    UniqueConstraint,
+    func,
+    literal_column,
+)
+from sqlalchemy.orm import (
+    relationship,
+    mapped_column,
+    validates,
+    Mapped,
+    DeclarativeBase,
+)
 from sqlalchemy.sql.schema import ForeignKey, PrimaryKeyConstraint
 from sqlalchemy.sql.sqltypes import DateTime, Date
 
@@ -11,13 +30,19 @@ class Base(DeclarativeBase):
     pass
 
 
+def birthday_key(birthday: date | None) -> int | None:
+    # month-day integer (e.g. 1231 for December 31), year independent
+    if birthday is None:
+        return None
+    return birthday.month * 100 + birthday.day
+
+
 class User(Base):
     __tablename__ = "users"
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     username: Mapped[str] = mapped_column(String(50), nullable=False, unique=True)
     email: Mapped[str] = mapped_column(String(50), nullable=False, unique=True)
     hashed_password: Mapped[str] = mapped_column(String(255), nullable=False)
-    refresh_token: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
     created_at: Mapped[datetime] = mapped_column(
         "created_at", DateTime, default=func.now()
     )
@@ -43,11 +68,30 @@ contact_m2m_group = Table(
         ForeignKey("group.id", ondelete="CASCADE", onupdate="CASCADE"),
     ),
     PrimaryKeyConstraint("contact_id", "group_id"),
+    # the members of a group, the primary key serves the groups of a contact
+    Index("ix_contact_m2m_group_group_id_contact_id", "group_id", "contact_id"),
 )
 
 
 class Contact(Base):
     __tablename__ = "contact"
+    __table_args__ = (
+        # keyset pagination order, see ContactRepository.get_contacts
+        Index("ix_contact_user_id_surname_name_id", "user_id", "surname", "name", "id"),
+        # upcoming birthdays lookup, see ContactRepository.get_contacts_by_birthday
+        Index("ix_contact_user_id_birthday_md", "user_id", "birthday_md"),
+        Index("ix_contact_user_id_updated_at", "user_id", "updated_at"),
+        # trigram indexes for ILIKE search, see ContactRepository.search_contacts
+        *(
+            Index(
+                f"ix_contact_{column}_trgm",
+                column,
+                postgresql_using="gin",
+                postgresql_ops={column: "gin_trgm_ops"},
+            )
+            for column in ("name", "surname", "email")
+        ),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     name: Mapped[str] = mapped_column(String(150), nullable=False)
@@ -55,6 +99,7 @@ class Contact(Base):
     email: Mapped[str] = mapped_column(String(150), nullable=False)
     phone_number: Mapped[str] = mapped_column(String(20), nullable=False)
     birthday: Mapped[date] = mapped_column(DateTime, nullable=False)
+    birthday_md: Mapped[int] = mapped_column(Integer, nullable=False)
     user_id: Mapped[int] = mapped_column(
         Integer, ForeignKey("users.id", ondelete="CASCADE"), default=None, nullable=True
     )
@@ -69,14 +114,31 @@ class Contact(Base):
     updated_at: Mapped[datetime] = mapped_column(
         "updated_at", DateTime, default=func.now(), onupdate=func.now()
     )
+    # the version in the ETag, incremented by every UPDATE of the row;
+    # timestamps don't compare exactly on every database (SQLite)
+    version: Mapped[int] = mapped_column(
+        Integer,
+        nullable=False,
+        default=1,
+        server_default="1",
+        onupdate=literal_column("version + 1"),
+    )
     groups: Mapped[list["Group"]] = relationship(
         "Group", secondary=contact_m2m_group, back_populates="contacts"
     )
 
+    @validates("birthday")
+    def validate_birthday(self, key, birthday):
+        self.birthday_md = birthday_key(birthday)
+        return birthday
+
 
 class Group(Base):
     __tablename__ = "group"
-    __table_args__ = (UniqueConstraint("name", "user_id", name="unique_group_user"),)
+    __table_args__ = (
+        UniqueConstraint("name", "user_id", name="unique_group_user"),
+        Index("ix_group_user_id_id", "user_id", "id"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     name: Mapped[str] = Column(String(50), nullable=False)
@@ -87,6 +149,121 @@ class Group(Base):
         Integer, ForeignKey("users.id", ondelete="CASCADE"), default=None, nullable=True
     )
     user: Mapped["User"] = relationship("User", back_populates="groups")
+    # number of member contacts, kept by the contact writes
+    contact_count: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0, server_default="0"
+    )
+
+
+class ContactTombstone(Base):
+    """Ids of deleted contacts, kept for the delta sync for a limited time."""
+
+    __tablename__ = "contact_tombstones"
+    __table_args__ = (
+        Index("ix_contact_tombstones_user_id_deleted_at", "user_id", "deleted_at"),
+    )
+
+    contact_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    user_id: Mapped[int] = mapped_column(
+        Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False
+    )
+    deleted_at: Mapped[datetime] = mapped_column(
+        DateTime, nullable=False, default=func.now()
+    )
+
+
+class CollectionVersion(Base):
+    """Per-user versions and sizes of the contacts and groups collections.
+
+    Bumped in the same transaction as every write, used for collection ETags;
+    the counts are adjusted by the same upsert.
+    """
+
+    __tablename__ = "collection_versions"
+
+    user_id: Mapped[int] = mapped_column(
+        Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True
+    )
+    contacts: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0, server_default="0"
+    )
+    groups: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0, server_default="0"
+    )
+    contact_count: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0, server_default="0"
+    )
+    active_contact_count: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0, server_default="0"
+    )
+    group_count: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0, server_default="0"
+    )
+
+
+class UserSession(Base):
+    """A signed-in device of a user, its refresh token rotates on every use.
+
+    Only the hash of the current refresh token's id (jti) is stored.
+    """
+
+    __tablename__ = "user_sessions"
+    __table_args__ = (
+        Index("ix_user_sessions_user_id", "user_id"),
+        Index("ix_user_sessions_expires_at", "expires_at"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    user_id: Mapped[int] = mapped_column(
+        Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False
+    )
+    token_hash: Mapped[str] = mapped_column(String(64), nullable=False, unique=True)
+    device: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    last_used_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    expires_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+
+
+class RevokedToken(Base):
+    """Hashes of the ids (jti) of revoked access tokens, until they expire.
+
+    Read by every process, see DatabaseRevocationBackend.
+    """
+
+    __tablename__ = "revoked_tokens"
+    __table_args__ = (
+        Index("ix_revoked_tokens_revoked_at", "revoked_at"),
+        Index("ix_revoked_tokens_expires_at", "expires_at"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    token_hash: Mapped[str] = mapped_column(String(64), nullable=False, unique=True)
+    revoked_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    expires_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+
+
+class BirthdayDigest(Base):
+    """Upcoming birthdays of a user, precomputed by a scheduled job.
+
+    Valid for the day of from_date while the contacts collection is still
+    at contacts_version, see BirthdayDigestService.
+    """
+
+    __tablename__ = "birthday_digests"
+
+    user_id: Mapped[int] = mapped_column(
+        Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True
+    )
+    from_date: Mapped[date] = mapped_column(Date, nullable=False)
+    to_date: Mapped[date] = mapped_column(Date, nullable=False)
+    contacts_version: Mapped[int] = mapped_column(Integer, nullable=False)
+    # serialized ContactResponse objects, in the order they are served
+    contacts: Mapped[list] = mapped_column(JSON, nullable=False)
+    computed_at: Mapped[datetime] = mapped_column(
+        DateTime, nullable=False, default=func.now()
+    )
+    # the day the digest email was taken care of, sent or not needed
+    emailed_on: Mapped[Optional[date]] = mapped_column(Date, nullable=True)
 
 
 class Address(Base):
@@ -99,3 +276,43 @@ class Address(Base):
     street: Mapped[str] = mapped_column(String(50), nullable=False)
     house: Mapped[str] = mapped_column(String(4), nullable=False)
     apartment: Mapped[str] = mapped_column(String(4))
+
+
+class EmailOutbox(Base):
+    """Outgoing emails, sent by the email worker (src/services/email.py)."""
+
+    __tablename__ = "email_outbox"
+    __table_args__ = (
+        Index("ix_email_outbox_status_next_attempt_at", "status", "next_attempt_at"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    recipient: Mapped[str] = mapped_column(String(150), nullable=False)
+    subject: Mapped[str] = mapped_column(String(255), nullable=False)
+    template: Mapped[str] = mapped_column(String(100), nullable=False)
+    context: Mapped[dict] = mapped_column(JSON, nullable=False)
+    # pending, sent or failed (gave up after EMAIL_MAX_ATTEMPTS)
+    status: Mapped[str] = mapped_column(String(20), nullable=False, default="pending")
+    attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    next_attempt_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    last_error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=func.now())
+    sent_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+
+
+class RateLimitBucket(Base):
+    """Token bucket of the rate limiter, shared by all the workers.
+
+    Times are unix timestamps; a bucket is full again at full_at and can be
+    deleted from then on, see src/services/rate_limit.py.
+    """
+
+    __tablename__ = "rate_limit_buckets"
+    __table_args__ = (Index("ix_rate_limit_buckets_full_at", "full_at"),)
+
+    key: Mapped[str] = mapped_column(String(255), primary_key=True)
+    tokens: Mapped[float] = mapped_column(Float, nullable=False)
+    # whether the last request took a token
+    allowed: Mapped[bool] = mapped_column(Boolean, nullable=False)
+    updated_at: Mapped[float] = mapped_column(Float, nullable=False)
+    full_at: Mapped[float] = mapped_column(Float, nullable=False)
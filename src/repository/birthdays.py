@@ -0,0 +1,95 @@
+from datetime import date
+from typing import List
+
+from sqlalchemy import Row, func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database.models import BirthdayDigest, CollectionVersion, User
+from src.repository.versions import DIALECT_INSERTS, CollectionVersionRepository
+from src.services.tracing import traced
+
+
+@traced
+class BirthdayDigestRepository:
+    def __init__(self, session: AsyncSession):
+        self.db = session
+        self.versions = CollectionVersionRepository(session)
+
+    async def get_digest(self, user: User) -> BirthdayDigest | None:
+        stmt = select(BirthdayDigest).filter_by(user_id=user.id)
+        digest = await self.db.execute(stmt)
+        return digest.scalar_one_or_none()
+
+    async def get_users_to_refresh(
+        self, today: date, after_id: int, limit: int, emails: bool
+    ) -> List[Row]:
+        """Users without an up to date digest, with their contacts version."""
+        version = func.coalesce(CollectionVersion.contacts, 0)
+        stale = [
+            BirthdayDigest.user_id.is_(None),
+            BirthdayDigest.from_date != today,
+            BirthdayDigest.contacts_version != version,
+        ]
+        if emails:
+            stale += [
+                BirthdayDigest.emailed_on.is_(None),
+                BirthdayDigest.emailed_on != today,
+            ]
+        stmt = (
+            select(
+                User.id,
+                User.username,
+                User.email,
+                User.confirmed,
+                version.label("version"),
+            )
+            .outerjoin(BirthdayDigest, BirthdayDigest.user_id == User.id)
+            .outerjoin(CollectionVersion, CollectionVersion.user_id == User.id)
+            .where(User.id > after_id, or_(*stale))
+            .order_by(User.id)
+            .limit(limit)
+        )
+        users = await self.db.execute(stmt)
+        return users.all()
+
+    async def save_digests(self, digests: List[dict]) -> None:
+        # upsert, emailed_on of an existing digest is kept
+        insert = DIALECT_INSERTS[self.db.get_bind().dialect.name]
+        stmt = insert(BirthdayDigest).values(digests)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[BirthdayDigest.user_id],
+            set_={
+                column: stmt.excluded[column]
+                for column in (
+                    "from_date",
+                    "to_date",
+                    "contacts_version",
+                    "contacts",
+                    "computed_at",
+                )
+            },
+        )
+        await self.db.execute(stmt)
+        await self.db.commit()
+
+    async def claim_emails(self, user_ids: List[int], today: date) -> set[int]:
+        """Marks the digest emails of today as taken care of, once per user.
+
+        Does not commit: the emails are enqueued in the same transaction, so
+        concurrent runs of the job can't both send them.
+        """
+        stmt = (
+            update(BirthdayDigest)
+            .where(
+                BirthdayDigest.user_id.in_(user_ids),
+                or_(
+                    BirthdayDigest.emailed_on.is_(None),
+                    BirthdayDigest.emailed_on != today,
+                ),
+            )
+            .values(emailed_on=today)
+            .returning(BirthdayDigest.user_id)
+            .execution_options(synchronize_session=False)
+        )
+        claimed = await self.db.execute(stmt)
+        return set(claimed.scalars())
@@ -1,141 +1,536 @@
-from typing import List, Optional
+from collections import Counter
+from typing import AsyncIterator, List, Optional
 from datetime import datetime, timedelta, date
 
-from sqlalchemy import and_, or_, select, extract
+from sqlalchemy import (
+    or_,
+    select,
+    insert,
+    update,
+    delete,
+    exists,
+    literal,
+    case,
+    func,
+    tuple_,
+    type_coerce,
+    union_all,
+    DateTime,
+)
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
+from sqlalchemy.orm.attributes import set_committed_value
 
-from src.database.models import Contact, Group, User
+from src.database.models import (
+    Contact,
+    ContactTombstone,
+    Group,
+    User,
+    birthday_key,
+    contact_m2m_group,
+)
+from src.repository.versions import CollectionVersionRepository
 from src.schemas import ContactModel, ContactUpdate, ContactIsActiveUpdate
+from src.services.tracing import traced
 
 
+@traced
 class ContactRepository:
     def __init__(self, session: AsyncSession):
         self.db = session
+        self.versions = CollectionVersionRepository(session)
 
     async def get_contacts(
-        self, skip: int, limit: int, query: str | None, user: User
+        self,
+        skip: int,
+        limit: int,
+        user: User,
+        after: tuple[str, str, int] | None = None,
     ) -> List[Contact]:
         # selectinload - to get groups connected with this contact
         # skip and limit - pagination realization
-        query = query.lower() if query is not None else ""
+        # after - keyset pagination, continues right after the given
+        # (surname, name, id) key instead of skipping rows
+        stmt = (
+            select(Contact)
+            .filter_by(user=user)
+            .options(selectinload(Contact.groups))
+            .order_by(Contact.surname, Contact.name, Contact.id)
+            .limit(limit)
+        )
+        if after is not None:
+            stmt = stmt.filter(
+                tuple_(Contact.surname, Contact.name, Contact.id) > after
+            )
+        else:
+            stmt = stmt.offset(skip)
+        contacts = await self.db.execute(stmt)
+        return contacts.scalars().all()
+
+    async def get_group_contacts(
+        self, group_id: int, limit: int, user: User, after: int | None = None
+    ) -> List[Contact]:
+        # served by ix_contact_m2m_group_group_id_contact_id, the links are
+        # read in contact_id order, after - continues right after that id
+        links = contact_m2m_group.c
+        stmt = (
+            select(Contact)
+            .join(contact_m2m_group, links.contact_id == Contact.id)
+            .filter(links.group_id == group_id, Contact.user_id == user.id)
+            .options(selectinload(Contact.groups))
+            .order_by(links.contact_id)
+            .limit(limit)
+        )
+        if after is not None:
+            stmt = stmt.filter(links.contact_id > after)
+        contacts = await self.db.execute(stmt)
+        return contacts.scalars().all()
+
+    async def search_contacts(
+        self, query: str, skip: int, limit: int, user: User
+    ) -> List[Contact]:
+        # escape LIKE wildcards, the query is matched as a plain substring
+        pattern = (
+            query.lower().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        )
         stmt = (
             select(Contact)
             .filter_by(user=user)
             .options(selectinload(Contact.groups))
             .filter(
-                (Contact.name.ilike(f"%{query}%"))
-                | (Contact.surname.ilike(f"%{query}%"))
-                | (Contact.email.ilike(f"%{query}%"))
+                Contact.name.ilike(f"%{pattern}%", escape="\\")
+                | Contact.surname.ilike(f"%{pattern}%", escape="\\")
+                | Contact.email.ilike(f"%{pattern}%", escape="\\")
             )
             .offset(skip)
             .limit(limit)
         )
+
+        if self.db.get_bind().dialect.name == "postgresql":
+            # ILIKE is served by the pg_trgm GIN indexes,
+            # best matching contacts go first
+            rank = func.greatest(
+                func.word_similarity(query, Contact.name),
+                func.word_similarity(query, Contact.surname),
+                func.word_similarity(query, Contact.email),
+            )
+            stmt = stmt.order_by(rank.desc(), Contact.id)
+        else:
+            # pg_trgm is not available (e.g. SQLite in tests), no ranking
+            stmt = stmt.order_by(Contact.surname, Contact.name, Contact.id)
+
+        contacts = await self.db.execute(stmt)
+        return contacts.scalars().all()
+
+    async def stream_contacts(
+        self, user: User, chunk_size: int
+    ) -> AsyncIterator[List[tuple]]:
+        # plain rows from a server-side cursor, nothing is kept in the identity
+        # map, so memory stays flat whatever the number of contacts
+        stmt = (
+            select(
+                Contact.id,
+                Contact.name,
+                Contact.surname,
+                Contact.email,
+                Contact.phone_number,
+                Contact.birthday,
+                Contact.is_active,
+            )
+            .filter_by(user_id=user.id)
+            .order_by(Contact.id)
+            .execution_options(yield_per=chunk_size)
+        )
+        result = await self.db.stream(stmt)
+        async for rows in result.partitions():
+            group_names = await self.get_group_names([row.id for row in rows])
+            yield [(row, group_names.get(row.id, [])) for row in rows]
+
+    async def get_group_names(self, contact_ids: List[int]) -> dict[int, List[str]]:
+        stmt = (
+            select(contact_m2m_group.c.contact_id, Group.name)
+            .join(Group, Group.id == contact_m2m_group.c.group_id)
+            .where(contact_m2m_group.c.contact_id.in_(contact_ids))
+            .order_by(Group.name)
+        )
+        result = await self.db.execute(stmt)
+        group_names = {}
+        for contact_id, name in result:
+            group_names.setdefault(contact_id, []).append(name)
+        return group_names
+
+    async def get_db_now(self) -> datetime:
+        # the clock of the database, the one updated_at values come from
+        if self.db.get_bind().dialect.name == "postgresql":
+            now = func.localtimestamp()
+        else:
+            now = type_coerce(func.now(), DateTime)
+        return (await self.db.execute(select(now))).scalar_one()
+
+    async def get_changed_contacts(
+        self, user: User, after: tuple[datetime, int] | None, limit: int
+    ) -> List[Contact]:
+        # served by ix_contact_user_id_updated_at,
+        # (updated_at, id) keyset continues right after the given key
+        stmt = (
+            select(Contact)
+            .filter_by(user_id=user.id)
+            .options(selectinload(Contact.groups))
+            .order_by(Contact.updated_at, Contact.id)
+            .limit(limit)
+        )
+        if after is not None:
+            stmt = stmt.filter(tuple_(Contact.updated_at, Contact.id) > after)
         contacts = await self.db.execute(stmt)
         return contacts.scalars().all()
 
-    async def get_contact_by_id(self, contact_id: int, user: User) -> Contact | None:
+    async def get_deleted_contact_ids(
+        self, user: User, since: datetime, until: datetime | None = None
+    ) -> List[int]:
+        stmt = (
+            select(ContactTombstone.contact_id)
+            .filter_by(user_id=user.id)
+            .filter(ContactTombstone.deleted_at > since)
+            .order_by(ContactTombstone.deleted_at, ContactTombstone.contact_id)
+        )
+        if until is not None:
+            stmt = stmt.filter(ContactTombstone.deleted_at <= until)
+        contact_ids = await self.db.execute(stmt)
+        return contact_ids.scalars().all()
+
+    async def prune_tombstones(self, before: datetime) -> int:
+        result = await self.db.execute(
+            delete(ContactTombstone).where(ContactTombstone.deleted_at < before)
+        )
+        await self.db.commit()
+        return result.rowcount
+
+    async def get_contact_by_id(
+        self, contact_id: int, user: User, for_update: bool = False
+    ) -> Contact | None:
         stmt = (
             select(Contact)
             .options(selectinload(Contact.groups))
             .filter_by(id=contact_id, user=user)
         )
+        if for_update:
+            stmt = stmt.with_for_update(of=Contact)
         contact = await self.db.execute(stmt)
         return contact.scalar_one_or_none()
 
+    async def get_contact_version(self, contact_id: int, user: User) -> int | None:
+        stmt = select(Contact.version).filter_by(id=contact_id, user_id=user.id)
+        version = await self.db.execute(stmt)
+        return version.scalar_one_or_none()
+
     async def create_contact(
         self, body: ContactModel, groups: List[Group], user: User
     ) -> Contact:
-        contact = Contact(
+        # INSERT ... RETURNING gives back the whole row, the groups are already
+        # loaded by the caller, so no refresh or re-select is needed
+        values = {
             **body.model_dump(exclude={"groups"}, exclude_unset=True),
-            groups=groups,
-            user=user,
+            "birthday_md": birthday_key(body.birthday),
+            "user_id": user.id,
+        }
+        result = await self.db.scalars(insert(Contact).returning(Contact), [values])
+        contact = result.one()
+        await self._link_groups(contact, groups)
+        groups_changed = await self._add_to_group_counts(
+            {group.id: 1 for group in groups}
+        )
+        await self.versions.bump(
+            user,
+            *self._changed(groups_changed),
+            contact_count=1,
+            active_contact_count=int(contact.is_active),
+        )
+        await self.db.commit()
+        return contact
+
+    async def create_contacts(
+        self, bodies: List[ContactModel], user: User
+    ) -> List[int]:
+        # one multi-row INSERT ... RETURNING for the contacts
+        # and one for their group links
+        values = [
+            {
+                **body.model_dump(exclude={"groups"}, exclude_unset=True),
+                "birthday_md": birthday_key(body.birthday),
+                "user_id": user.id,
+            }
+            for body in bodies
+        ]
+        result = await self.db.execute(
+            insert(Contact).returning(
+                Contact.id, Contact.is_active, sort_by_parameter_order=True
+            ),
+            values,
+        )
+        rows = result.all()
+        contact_ids = [row.id for row in rows]
+
+        links = [
+            {"contact_id": contact_id, "group_id": group_id}
+            for contact_id, body in zip(contact_ids, bodies)
+            for group_id in set(body.groups)
+        ]
+        if links:
+            await self.db.execute(insert(contact_m2m_group), links)
+        groups_changed = await self._add_to_group_counts(
+            Counter(link["group_id"] for link in links)
+        )
+
+        await self.versions.bump(
+            user,
+            *self._changed(groups_changed),
+            contact_count=len(rows),
+            active_contact_count=sum(row.is_active for row in rows),
         )
-        self.db.add(contact)
         await self.db.commit()
-        await self.db.refresh(contact)
-        return await self.get_contact_by_id(contact.id, user)
+        return contact_ids
 
-    async def remove_contact(self, contact_id: int, user: User) -> Contact | None:
-        contact = await self.get_contact_by_id(contact_id, user)
+    async def remove_contact(
+        self, contact_id: int, user: User, if_version: List[int] | None = None
+    ) -> Contact | None:
+        # the row stays locked until the commit, its groups can't change
+        # in between; if_version - as in update_contact, a part of the DELETE
+        contact = await self.get_contact_by_id(contact_id, user, for_update=True)
         if contact:
-            await self.db.delete(contact)
+            stmt = delete(Contact).where(Contact.id == contact.id)
+            if if_version is not None:
+                stmt = stmt.where(Contact.version.in_(if_version))
+            result = await self.db.execute(
+                stmt.execution_options(synchronize_session=False)
+            )
+            if result.rowcount == 0:
+                return None
+            await self.db.execute(
+                delete(contact_m2m_group).where(
+                    contact_m2m_group.c.contact_id == contact.id
+                )
+            )
+            # tells the delta sync clients that the contact is gone
+            self.db.add(ContactTombstone(contact_id=contact.id, user_id=user.id))
+            groups_changed = await self._add_to_group_counts(
+                {group.id: -1 for group in contact.groups}
+            )
+            await self.versions.bump(
+                user,
+                *self._changed(groups_changed),
+                contact_count=-1,
+                active_contact_count=-int(contact.is_active),
+            )
             await self.db.commit()
         return contact
 
     async def update_contact(
-        self, contact_id: int, body: ContactUpdate, groups: List[Group], user: User
+        self,
+        contact_id: int,
+        body: ContactUpdate,
+        groups: List[Group],
+        user: User,
+        if_version: List[int] | None = None,
     ) -> Contact | None:
-        contact = await self.get_contact_by_id(contact_id, user)
+        # if_version - optimistic concurrency, the row is updated only
+        # if it was not changed since one of the given versions
+        values = body.model_dump(exclude_unset=True, exclude={"groups"})
+        if "birthday" in values:
+            values["birthday_md"] = birthday_key(values["birthday"])
+        was_active = None
+        if "is_active" in values:
+            was_active = await self._get_is_active_for_update(contact_id, user)
+        stmt = (
+            update(Contact)
+            .where(Contact.id == contact_id, Contact.user_id == user.id)
+            .values(**values)
+            .returning(Contact)
+        )
+        if if_version is not None:
+            stmt = stmt.where(Contact.version.in_(if_version))
+        contact = (await self.db.scalars(stmt)).one_or_none()
         if contact:
-            for key, value in body.dict(exclude_unset=True, exclude={"groups"}).items():
-                setattr(contact, key, value)
-
+            groups_changed = False
             if groups is not None:
-                contact.groups = groups
-
+                groups_changed = await self._replace_groups(contact, groups)
+            counts = {}
+            if was_active is not None:
+                counts["active_contact_count"] = contact.is_active - was_active
+            await self.versions.bump(user, *self._changed(groups_changed), **counts)
             await self.db.commit()
-            await self.db.refresh(contact)
 
         return contact
 
     async def update_contact_is_active(
-        self, contact_id: int, body: ContactIsActiveUpdate, user: User
+        self,
+        contact_id: int,
+        body: ContactIsActiveUpdate,
+        user: User,
+        if_version: List[int] | None = None,
     ) -> Contact | None:
-        contact = await self.get_contact_by_id(contact_id, user)
+        was_active = await self._get_is_active_for_update(contact_id, user)
+        stmt = (
+            update(Contact)
+            .where(Contact.id == contact_id, Contact.user_id == user.id)
+            .values(is_active=body.is_active)
+            .returning(Contact)
+        )
+        if if_version is not None:
+            stmt = stmt.where(Contact.version.in_(if_version))
+        # the updated row plus one SELECT for its groups
+        contact = (
+            await self.db.scalars(
+                select(Contact)
+                .from_statement(stmt)
+                .options(selectinload(Contact.groups))
+                .execution_options(populate_existing=True)
+            )
+        ).one_or_none()
         if contact:
-            contact.is_active = body.is_active
+            await self.versions.bump(
+                user,
+                "contacts",
+                active_contact_count=contact.is_active - was_active,
+            )
             await self.db.commit()
-            await self.db.refresh(contact)
 
         return contact
 
+    @staticmethod
+    def _changed(groups_changed: bool) -> tuple[str, ...]:
+        # member counts are a part of the groups representation
+        return ("contacts", "groups") if groups_changed else ("contacts",)
+
+    async def _get_is_active_for_update(
+        self, contact_id: int, user: User
+    ) -> bool | None:
+        # the value before the update, for the active contacts count;
+        # the row lock keeps concurrent updates from both counting a change
+        stmt = (
+            select(Contact.is_active)
+            .filter_by(id=contact_id, user_id=user.id)
+            .with_for_update()
+        )
+        is_active = await self.db.execute(stmt)
+        return is_active.scalar_one_or_none()
+
+    async def _add_to_group_counts(self, deltas: dict[int, int]) -> bool:
+        # one UPDATE for all the groups, returns whether any count changed
+        deltas = {group_id: delta for group_id, delta in deltas.items() if delta}
+        if not deltas:
+            return False
+        await self.db.execute(
+            update(Group)
+            .where(Group.id.in_(deltas))
+            .values(
+                contact_count=Group.contact_count
+                + case(deltas, value=Group.id, else_=0)
+            )
+            .execution_options(synchronize_session=False)
+        )
+        return True
+
+    async def _link_groups(self, contact: Contact, groups: List[Group]) -> None:
+        if groups:
+            await self.db.execute(
+                insert(contact_m2m_group),
+                [{"contact_id": contact.id, "group_id": group.id} for group in groups],
+            )
+        set_committed_value(contact, "groups", list(groups))
+
+    async def _replace_groups(self, contact: Contact, groups: List[Group]) -> bool:
+        # returns whether the membership changed
+        links = contact_m2m_group.c
+        group_ids = [group.id for group in groups]
+        stale_links = delete(contact_m2m_group).where(
+            links.contact_id == contact.id, links.group_id.not_in(group_ids)
+        )
+        # links that already exist are kept as they are
+        new_links = insert(contact_m2m_group).from_select(
+            ["contact_id", "group_id"],
+            select(literal(contact.id), Group.id).where(
+                Group.id.in_(group_ids),
+                ~exists().where(
+                    links.contact_id == contact.id, links.group_id == Group.id
+                ),
+            ),
+        )
+
+        if self.db.get_bind().dialect.name == "postgresql":
+            # both changes and the member counts in one round trip
+            # with data-modifying CTEs
+            stale = stale_links.returning(links.group_id).cte("stale_links")
+            added = new_links.returning(links.group_id).cte("new_links")
+            changes = union_all(
+                select(stale.c.group_id, literal(-1).label("delta")),
+                select(added.c.group_id, literal(1)),
+            ).subquery("changes")
+            result = await self.db.execute(
+                update(Group)
+                .where(Group.id == changes.c.group_id)
+                .values(contact_count=Group.contact_count + changes.c.delta)
+                .execution_options(synchronize_session=False)
+            )
+            changed = result.rowcount > 0
+        else:
+            stale = await self.db.execute(stale_links.returning(links.group_id))
+            deltas = {group_id: -1 for group_id in stale.scalars()}
+            if group_ids:
+                added = await self.db.execute(new_links.returning(links.group_id))
+                deltas.update({group_id: 1 for group_id in added.scalars()})
+            changed = await self._add_to_group_counts(deltas)
+        set_committed_value(contact, "groups", list(groups))
+        return changed
+
+    @staticmethod
+    def _birthdays_stmt(from_date: date, to_date: date):
+        from_key, to_key = birthday_key(from_date), birthday_key(to_date)
+        years = to_date.year - from_date.year
+
+        stmt = (
+            select(Contact).options(selectinload(Contact.groups))
+            # birthdays from from_date up to the end of the year go first
+            .order_by(
+                case((Contact.birthday_md >= from_key, 0), else_=1),
+                Contact.birthday_md,
+                Contact.id,
+            )
+        )
+        if (years, to_key) >= (1, from_key):
+            # the range covers a whole year, every birthday matches
+            pass
+        elif years == 0:
+            stmt = stmt.filter(
+                Contact.birthday_md >= from_key, Contact.birthday_md < to_key
+            )
+        else:  # the range wraps the year end (e.g., December -> January)
+            stmt = stmt.filter(
+                or_(Contact.birthday_md >= from_key, Contact.birthday_md < to_key)
+            )
+        return stmt
+
     async def get_contacts_by_birthday(
         self, from_date: date | None, to_date: date | None, user: User
     ) -> List[Contact]:
-        # Default range: next 7 days
+        # Default range: next 7 days, to_date is not included
         from_date = from_date or datetime.now().date()
         to_date = to_date or (from_date + timedelta(days=7))
+        if to_date <= from_date:
+            return []
 
-        print("From", from_date, "To", to_date)
-
-        # extract month and day for the given range
-        from_month, from_day = from_date.month, from_date.day
-        to_month, to_day = to_date.month, to_date.day
-        print("from_month", from_month, "from_day", from_day)
-        print("to_month", to_month, "to_day", to_day)
-        # construct the SQL query
-        if from_month == to_month:  # Same month case
-            stmt = (
-                select(Contact)
-                .filter_by(user=user)
-                .options(selectinload(Contact.groups))
-                .filter(
-                    extract("month", Contact.birthday) == from_month,
-                    extract("day", Contact.birthday) >= from_day,
-                    extract("day", Contact.birthday) < to_day,
-                )
-            )
-        else:  # cross-month case (e.g., December -> January)
-            stmt = (
-                select(Contact)
-                .filter_by(user=user)
-                .options(selectinload(Contact.groups))
-                .filter(
-                    or_(
-                        # remaining days in the starting month
-                        and_(
-                            extract("month", Contact.birthday) == from_month,
-                            extract("day", Contact.birthday) >= from_day,
-                        ),
-                        # days in the next month
-                        and_(
-                            extract("month", Contact.birthday) == to_month,
-                            extract("day", Contact.birthday) < to_day,
-                        ),
-                    )
-                )
-            )
-
+        stmt = self._birthdays_stmt(from_date, to_date).filter_by(user=user)
         contacts = await self.db.execute(stmt)
         return contacts.scalars().all()
+
+    async def get_birthdays_of_users(
+        self, user_ids: List[int], from_date: date, to_date: date
+    ) -> dict[int, List[Contact]]:
+        # one statement for a batch of users, the order is kept per user
+        stmt = self._birthdays_stmt(from_date, to_date).filter(
+            Contact.user_id.in_(user_ids)
+        )
+        contacts = await self.db.execute(stmt)
+        birthdays = {user_id: [] for user_id in user_ids}
+        for contact in contacts.scalars():
+            birthdays[contact.user_id].append(contact)
+        return birthdays
@@ -0,0 +1,98 @@
+from datetime import datetime, timedelta, UTC
+from typing import List
+
+from sqlalchemy import select, update, delete, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database.models import EmailOutbox
+from src.services.tracing import traced
+
+
+def utcnow() -> datetime:
+    # naive UTC, the outbox timestamps are set and compared by the application
+    return datetime.now(UTC).replace(tzinfo=None)
+
+
+@traced
+class EmailOutboxRepository:
+    def __init__(self, session: AsyncSession):
+        self.db = session
+
+    def add(
+        self, recipient: str, subject: str, template: str, context: dict
+    ) -> EmailOutbox:
+        # does not commit, for emails sent along with another write
+        email = EmailOutbox(
+            recipient=recipient,
+            subject=subject,
+            template=template,
+            context=context,
+            next_attempt_at=utcnow(),
+        )
+        self.db.add(email)
+        return email
+
+    async def enqueue(
+        self, recipient: str, subject: str, template: str, context: dict
+    ) -> EmailOutbox:
+        email = self.add(recipient, subject, template, context)
+        await self.db.commit()
+        return email
+
+    async def claim_batch(self, limit: int, lease: timedelta) -> List[EmailOutbox]:
+        # SKIP LOCKED - concurrent workers (one per app process) take
+        # different rows; the lease hands a row to another worker
+        # if this one dies before saving the result
+        now = utcnow()
+        stmt = (
+            select(EmailOutbox)
+            .where(EmailOutbox.status == "pending", EmailOutbox.next_attempt_at <= now)
+            .order_by(EmailOutbox.next_attempt_at)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        emails = (await self.db.scalars(stmt)).all()
+        for email in emails:
+            email.attempts += 1
+            email.next_attempt_at = now + lease
+        await self.db.commit()
+        return emails
+
+    async def save_results(
+        self, sent_ids: List[int], failures: List[tuple[int, str, datetime | None]]
+    ) -> None:
+        # failures - (id, error, retry at), no retry time means giving up
+        if sent_ids:
+            await self.db.execute(
+                update(EmailOutbox)
+                .where(EmailOutbox.id.in_(sent_ids))
+                .values(status="sent", sent_at=utcnow(), last_error=None)
+                .execution_options(synchronize_session=False)
+            )
+        for email_id, error, retry_at in failures:
+            values = {"last_error": error[:1000]}
+            if retry_at is None:
+                values["status"] = "failed"
+            else:
+                values["next_attempt_at"] = retry_at
+            await self.db.execute(
+                update(EmailOutbox)
+                .where(EmailOutbox.id == email_id)
+                .values(**values)
+                .execution_options(synchronize_session=False)
+            )
+        await self.db.commit()
+
+    async def count_by_status(self) -> dict[str, int]:
+        stmt = select(EmailOutbox.status, func.count()).group_by(EmailOutbox.status)
+        counts = await self.db.execute(stmt)
+        return dict(counts.all())
+
+    async def prune_sent(self, before: datetime) -> int:
+        result = await self.db.execute(
+            delete(EmailOutbox).where(
+                EmailOutbox.status == "sent", EmailOutbox.sent_at < before
+            )
+        )
+        await self.db.commit()
+        return result.rowcount
@@ -1,18 +1,28 @@
 from typing import List
 
-from sqlalchemy import select
+from sqlalchemy import delete, literal, select, update, func
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.database.models import Group, User
+from src.database.models import Contact, Group, User, contact_m2m_group
+from src.repository.versions import DIALECT_INSERTS, CollectionVersionRepository
 from src.schemas import GroupModel, GroupResponse
+from src.services.tracing import traced
 
 
+@traced
 class GroupRepository:
     def __init__(self, session: AsyncSession):
         self.db = session
+        self.versions = CollectionVersionRepository(session)
 
-    async def get_groups(self, skip: int, limit: int, user: User) -> List[Group]:
-        stmt = select(Group).filter_by(user=user).offset(skip).limit(limit)
+    async def get_groups(
+        self, skip: int, limit: int, user: User, after: int | None = None
+    ) -> List[Group]:
+        stmt = select(Group).filter_by(user=user).order_by(Group.id).limit(limit)
+        if after is not None:
+            stmt = stmt.filter(Group.id > after)
+        else:
+            stmt = stmt.offset(skip)
         groups = await self.db.execute(stmt)
         return groups.scalars().all()
 
@@ -24,6 +34,8 @@ class GroupRepository:
     async def create_group(self, body: GroupModel, user: User) -> Group:
         group = Group(**body.model_dump(exclude_unset=True), user=user)
         self.db.add(group)
+        await self.db.flush()
+        await self.versions.bump(user, "groups", group_count=1)
         await self.db.commit()
         await self.db.refresh(group)
         return group
@@ -34,6 +46,8 @@ class GroupRepository:
         group = await self.get_group_by_id(group_id, user)
         if group:
             group.name = body.name
+            await self._touch_contacts(group)
+            await self.versions.bump(user, "groups", "contacts")
             await self.db.commit()
             await self.db.refresh(group)
 
@@ -42,11 +56,82 @@ class GroupRepository:
     async def remove_group(self, group_id: int, user: User) -> Group | None:
         group = await self.get_group_by_id(group_id, user)
         if group:
+            await self._touch_contacts(group)
             await self.db.delete(group)
+            await self.versions.bump(user, "groups", "contacts", group_count=-1)
             await self.db.commit()
         return group
 
+    async def add_contacts(
+        self, group: Group, contact_ids: List[int], user: User
+    ) -> Group:
+        # contacts of other users are not linked, the links that already
+        # exist are skipped, RETURNING gives only the new ones
+        insert = DIALECT_INSERTS[self.db.get_bind().dialect.name]
+        stmt = (
+            insert(contact_m2m_group)
+            .from_select(
+                ["contact_id", "group_id"],
+                select(Contact.id, literal(group.id)).where(
+                    Contact.id.in_(contact_ids), Contact.user_id == user.id
+                ),
+            )
+            .on_conflict_do_nothing()
+            .returning(contact_m2m_group.c.contact_id)
+        )
+        added = (await self.db.execute(stmt)).scalars().all()
+        await self._members_changed(group, added, len(added), user)
+        return group
+
+    async def remove_contacts(
+        self, group: Group, contact_ids: List[int], user: User
+    ) -> Group:
+        links = contact_m2m_group.c
+        stmt = (
+            delete(contact_m2m_group)
+            .where(links.group_id == group.id, links.contact_id.in_(contact_ids))
+            .returning(links.contact_id)
+        )
+        removed = (await self.db.execute(stmt)).scalars().all()
+        await self._members_changed(group, removed, -len(removed), user)
+        return group
+
+    async def _members_changed(
+        self, group: Group, contact_ids: List[int], delta: int, user: User
+    ) -> None:
+        if not contact_ids:
+            return
+        # group names are a part of the contact representation
+        await self.db.execute(
+            update(Contact)
+            .where(Contact.id.in_(contact_ids))
+            .values(updated_at=func.now())
+            .execution_options(synchronize_session=False)
+        )
+        group.contact_count = Group.contact_count + delta
+        await self.versions.bump(user, "groups", "contacts")
+        await self.db.commit()
+        await self.db.refresh(group)
+
+    async def _touch_contacts(self, group: Group) -> None:
+        # group names are a part of the contact representation,
+        # so the member contacts get a new version (updated_at) as well
+        member_ids = select(contact_m2m_group.c.contact_id).where(
+            contact_m2m_group.c.group_id == group.id
+        )
+        await self.db.execute(
+            update(Contact)
+            .where(Contact.id.in_(member_ids))
+            .values(updated_at=func.now())
+            .execution_options(synchronize_session=False)
+        )
+
     async def get_groups_by_ids(self, group_ids: List[int], user: User) -> List[Group]:
         stmt = select(Group).where(Group.id.in_(group_ids), Group.user == user)
         result = await self.db.execute(stmt)
         return result.scalars().all()
+
+    async def get_group_ids(self, user: User) -> List[int]:
+        stmt = select(Group.id).filter_by(user=user)
+        result = await self.db.execute(stmt)
+        return result.scalars().all()
@@ -0,0 +1,51 @@
+from sqlalchemy import case, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database.models import RateLimitBucket
+from src.repository.versions import DIALECT_INSERTS
+from src.services.tracing import traced
+
+
+@traced
+class RateLimitRepository:
+    def __init__(self, session: AsyncSession):
+        self.db = session
+
+    async def take(
+        self, key: str, capacity: int, rate: float, now: float
+    ) -> tuple[bool, float]:
+        """Refills the bucket and takes a token if there is one, in one upsert.
+
+        Returns whether a token was taken and the tokens left.
+        """
+        insert = DIALECT_INSERTS[self.db.get_bind().dialect.name]
+        stmt = insert(RateLimitBucket).values(
+            key=key,
+            tokens=capacity - 1,
+            allowed=True,
+            updated_at=now,
+            full_at=now + 1 / rate,
+        )
+        # the SET expressions all see the row as it was before the update
+        refill = RateLimitBucket.tokens + (now - RateLimitBucket.updated_at) * rate
+        refilled = case((refill > capacity, capacity), else_=refill)
+        tokens = case((refilled >= 1, refilled - 1), else_=refilled)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[RateLimitBucket.key],
+            set_={
+                "tokens": tokens,
+                "allowed": refilled >= 1,
+                "updated_at": now,
+                "full_at": now + (capacity - tokens) / rate,
+            },
+        ).returning(RateLimitBucket.allowed, RateLimitBucket.tokens)
+        allowed, tokens = (await self.db.execute(stmt)).one()
+        await self.db.commit()
+        return allowed, tokens
+
+    async def delete_full(self, now: float) -> int:
+        # a full bucket is the same as a missing one
+        stmt = delete(RateLimitBucket).where(RateLimitBucket.full_at <= now)
+        result = await self.db.execute(stmt)
+        await self.db.commit()
+        return result.rowcount
@@ -0,0 +1,42 @@
+from datetime import datetime
+
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database.models import RevokedToken
+from src.repository.emails import utcnow
+from src.repository.versions import DIALECT_INSERTS
+from src.services.tracing import traced
+
+
+@traced
+class RevokedTokenRepository:
+    def __init__(self, session: AsyncSession):
+        self.db = session
+
+    async def add(self, token_hash: str, expires_at: datetime) -> None:
+        insert = DIALECT_INSERTS[self.db.get_bind().dialect.name]
+        stmt = insert(RevokedToken).values(
+            token_hash=token_hash, revoked_at=utcnow(), expires_at=expires_at
+        )
+        # revoking twice is a no-op
+        await self.db.execute(stmt.on_conflict_do_nothing())
+        await self.db.commit()
+
+    async def get_revoked(
+        self, now: datetime, since: datetime | None = None
+    ) -> dict[str, datetime]:
+        """Unexpired revocations, the ones revoked since a time if given."""
+        stmt = select(RevokedToken.token_hash, RevokedToken.expires_at).where(
+            RevokedToken.expires_at > now
+        )
+        if since is not None:
+            stmt = stmt.where(RevokedToken.revoked_at >= since)
+        rows = await self.db.execute(stmt)
+        return dict(rows.tuples().all())
+
+    async def delete_expired(self, now: datetime) -> int:
+        stmt = delete(RevokedToken).where(RevokedToken.expires_at <= now)
+        result = await self.db.execute(stmt)
+        await self.db.commit()
+        return result.rowcount
@@ -0,0 +1,71 @@
+from datetime import datetime
+
+from sqlalchemy import delete, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database.models import UserSession
+from src.repository.emails import utcnow
+from src.services.tracing import traced
+
+
+@traced
+class UserSessionRepository:
+    def __init__(self, session: AsyncSession):
+        self.db = session
+
+    async def create_session(
+        self, user_id: int, token_hash: str, device: str | None, expires_at: datetime
+    ) -> UserSession:
+        now = utcnow()
+        user_session = UserSession(
+            user_id=user_id,
+            token_hash=token_hash,
+            device=device,
+            created_at=now,
+            last_used_at=now,
+            expires_at=expires_at,
+        )
+        self.db.add(user_session)
+        await self.db.commit()
+        return user_session
+
+    async def rotate(
+        self,
+        session_id: int,
+        token_hash: str,
+        new_token_hash: str,
+        device: str | None,
+        expires_at: datetime,
+    ) -> bool:
+        # compare and swap in one statement: of two requests presenting
+        # the same refresh token only one gets the session
+        stmt = (
+            update(UserSession)
+            .where(
+                UserSession.id == session_id,
+                UserSession.token_hash == token_hash,
+                UserSession.expires_at > utcnow(),
+            )
+            .values(
+                token_hash=new_token_hash,
+                device=device,
+                last_used_at=utcnow(),
+                expires_at=expires_at,
+            )
+            .execution_options(synchronize_session=False)
+        )
+        result = await self.db.execute(stmt)
+        await self.db.commit()
+        return result.rowcount == 1
+
+    async def delete_session(self, session_id: int) -> bool:
+        stmt = delete(UserSession).where(UserSession.id == session_id)
+        result = await self.db.execute(stmt)
+        await self.db.commit()
+        return result.rowcount == 1
+
+    async def delete_expired(self, now: datetime) -> int:
+        stmt = delete(UserSession).where(UserSession.expires_at < now)
+        result = await self.db.execute(stmt)
+        await self.db.commit()
+        return result.rowcount
@@ -3,8 +3,10 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.models import User
 from src.schemas import UserCreate
+from src.services.tracing import traced
 
 
+@traced
 class UserRepository:
     def __init__(self, session: AsyncSession):
         self.db = session
@@ -14,13 +16,8 @@ class UserRepository:
         user = await self.db.execute(stmt)
         return user.scalar_one_or_none()
 
-    async def get_user_by_username(
-        self, username: str, refresh_token: str | None
-    ) -> User | None:
+    async def get_user_by_username(self, username: str) -> User | None:
         stmt = select(User).filter_by(username=username)
-
-        if refresh_token:
-            stmt = stmt.filter_by(refresh_token=refresh_token)
         user = await self.db.execute(stmt)
         return user.scalar_one_or_none()
 
@@ -36,15 +33,16 @@ class UserRepository:
             hashed_password=body.password
         )
         self.db.add(user)
+        # a single INSERT, the id comes back with it
         await self.db.commit()
-        await self.db.refresh(user)
         return user
 
-    async def confirmed_email(self, email: str) -> None:
+    async def confirmed_email(self, email: str) -> User:
         user = await self.get_user_by_email(email)
         user.confirmed = True
         await self.db.commit()
         await self.db.refresh(user)
+        return user
 
     async def update_avatar_url(self, email: str, avatar_url: str) -> User:
         user = await self.get_user_by_email(email)
@@ -0,0 +1,51 @@
+from sqlalchemy import Row, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database.models import CollectionVersion, User
+from src.services.tracing import traced
+
+DIALECT_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+@traced
+class CollectionVersionRepository:
+    def __init__(self, session: AsyncSession):
+        self.db = session
+
+    async def get_version(self, collection: str, user: User) -> int:
+        stmt = select(getattr(CollectionVersion, collection)).filter_by(user_id=user.id)
+        version = await self.db.execute(stmt)
+        return version.scalar_one_or_none() or 0
+
+    async def get_counts(self, user: User) -> Row | None:
+        stmt = select(
+            CollectionVersion.contact_count,
+            CollectionVersion.active_contact_count,
+            CollectionVersion.group_count,
+        ).filter_by(user_id=user.id)
+        counts = await self.db.execute(stmt)
+        return counts.one_or_none()
+
+    async def bump(self, user: User, *collections: str, **counts: int) -> None:
+        # upsert, the row of the user is created on the first write;
+        # does not commit, it is a part of the caller's transaction
+        # counts - deltas of the count columns, e.g. contact_count=-1
+        insert = DIALECT_INSERTS[self.db.get_bind().dialect.name]
+        stmt = insert(CollectionVersion).values(
+            user_id=user.id, **{collection: 1 for collection in collections}, **counts
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[CollectionVersion.user_id],
+            set_={
+                **{
+                    collection: getattr(CollectionVersion, collection) + 1
+                    for collection in collections
+                },
+                **{
+                    column: getattr(CollectionVersion, column) + delta
+                    for column, delta in counts.items()
+                },
+            },
+        )
+        await self.db.execute(stmt)
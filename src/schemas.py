@@ -36,12 +36,20 @@ class GroupModel(BaseModel):
     name: str = Field(max_length=50)
 
 
-class GroupResponse(GroupModel):
+class GroupSummary(GroupModel):
     id: int
 
     model_config = ConfigDict(from_attributes=True)
 
 
+class GroupResponse(GroupSummary):
+    contact_count: int = 0
+
+
+class GroupMembersUpdate(BaseModel):
+    contact_ids: List[int] = Field(min_length=1, max_length=1000)
+
+
 class ContactBase(BaseModel):
     name: str = Field(min_length=2, max_length=150)
     surname: str = Field(min_length=2, max_length=150)
@@ -68,6 +76,29 @@ class ContactResponse(ContactModel):
     updated_at: Optional[datetime] | None
     is_active: bool
     address_id: Optional[int]
-    groups: List[GroupResponse] | None
+    groups: List[GroupSummary] | None
 
     model_config = ConfigDict(from_attributes=True)
+
+
+class ContactStats(BaseModel):
+    contacts: int = 0
+    active_contacts: int = 0
+    groups: int = 0
+
+
+class ContactImportError(BaseModel):
+    row: int
+    errors: List[str]
+
+
+class ContactImportResult(BaseModel):
+    created: int
+    errors: List[ContactImportError]
+
+
+class ContactChanges(BaseModel):
+    changed: List[ContactResponse]
+    deleted: List[int]
+    next_token: str
+    has_more: bool
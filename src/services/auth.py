@@ -1,26 +1,60 @@
+import secrets
+import uuid
 from datetime import datetime, timedelta, UTC
 from typing import Literal, Optional
 
-from fastapi import Depends, HTTPException, status
-from passlib.context import CryptContext
-from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
-from jose import JWTError, jwt
+from fastapi import Depends, HTTPException, Request, status
+from fastapi.security import (
+    HTTPAuthorizationCredentials,
+    HTTPBearer,
+    OAuth2PasswordBearer,
+)
+from jose import JWTError
 
-from src.database.db import get_db
+from src.database.db import sessionmanager
 from src.conf.config import config
 from src.conf import messages
 from src.services.users import UserService
+from src.services.cache import user_cache
+from src.services.hashing import hashing_pool, HashingPoolSaturated
+from src.services.tokens import keyring, revocation_list, token_verifier
+from src.services.tracing import traced, tracer
 
 
+def _credentials_exception():
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail=messages.UNVERIFIED_CREDENTIALS,
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+
+def _hashing_busy_exception():
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail=messages.HASHING_POOL_BUSY,
+        headers={"Retry-After": "1"},
+    )
+
+
+@traced
 class Hash:
-    pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    async def verify_password(self, plain_password, hashed_password):
+        valid, _ = await self.verify_and_update(plain_password, hashed_password)
+        return valid
 
-    def verify_password(self, plain_password, hashed_password):
-        return self.pwd_context.verify(plain_password, hashed_password)
+    # returns a new hash as well when the stored one uses outdated cost settings
+    async def verify_and_update(self, plain_password, hashed_password):
+        try:
+            return await hashing_pool.verify_and_update(plain_password, hashed_password)
+        except HashingPoolSaturated:
+            raise _hashing_busy_exception()
 
-    def get_password_hash(self, password: str):
-        return self.pwd_context.hash(password)
+    async def get_password_hash(self, password: str):
+        try:
+            return await hashing_pool.hash(password)
+        except HashingPoolSaturated:
+            raise _hashing_busy_exception()
 
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
@@ -34,10 +68,16 @@ async def create_token(
     now = datetime.now(UTC)
     expire = now + timedelta(seconds=expires_delta)
 
-    to_encode.update({"exp": expire, "iat": now, "token_type": token_type})
-    encoded_jwt = jwt.encode(
-        to_encode, config.JWT_SECRET, algorithm=config.JWT_ALGORITHM
+    to_encode.update(
+        {
+            "exp": expire,
+            "iat": now,
+            "token_type": token_type,
+        }
     )
+    # the id the token is revoked by
+    to_encode.setdefault("jti", uuid.uuid4().hex)
+    encoded_jwt = keyring.sign(to_encode)
     return encoded_jwt
 
 
@@ -61,68 +101,72 @@ async def create_refresh_token(data: dict, expires_delta: Optional[float] = None
     return refresh_token
 
 
-async def get_current_user(
-    token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)
-):
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail=messages.UNVERIFIED_CREDENTIALS,
-        headers={"WWW-Authenticate": "Bearer"},
-    )
+internal_scheme = HTTPBearer(auto_error=False)
 
-    try:
-        # decode JWT
-        payload = jwt.decode(
-            token, config.JWT_SECRET, algorithms=[config.JWT_ALGORITHM]
-        )
-        username = payload.get("sub")
-        token_type = payload.get("token_type")
-        if username is None or token_type != "access":
-            raise credentials_exception
-    except JWTError as e:
-        raise credentials_exception
-
-    user_service = UserService(db)
-    user = await user_service.get_user_by_username(username=username)
-    if user is None:
-        raise credentials_exception
-    return user
 
+def require_internal_token(
+    credentials: HTTPAuthorizationCredentials | None = Depends(internal_scheme),
+) -> None:
+    """Guards the monitoring routes, which are off without INTERNAL_TOKEN."""
+    if not config.INTERNAL_TOKEN:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    if credentials is None or not secrets.compare_digest(
+        credentials.credentials.encode(), config.INTERNAL_TOKEN.encode()
+    ):
+        raise _credentials_exception()
 
-async def verify_refresh_token(refresh_token: str, db: Session = Depends(get_db)):
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail=messages.UNVERIFIED_CREDENTIALS,
-        headers={"WWW-Authenticate": "Bearer"},
-    )
 
+@traced
+async def get_token_claims(token: str = Depends(oauth2_scheme)) -> dict:
+    """Claims of a valid, unrevoked access token."""
     try:
-        payload = jwt.decode(
-            refresh_token, config.JWT_SECRET, algorithms=[config.JWT_ALGORITHM]
-        )
-        username = payload.get("sub")
-        token_type = payload.get("token_type")
-        if username is None or token_type != "refresh":
-            raise credentials_exception
-        user = await UserService(db).get_user_by_username(username, refresh_token)
-        return user
+        with tracer.span("jwt.decode"):
+            payload = token_verifier.decode(token)
     except JWTError as e:
-        raise credentials_exception
+        raise _credentials_exception()
+    if payload.get("sub") is None or payload.get("token_type") != "access":
+        raise _credentials_exception()
+    if await revocation_list.is_revoked(payload):
+        raise _credentials_exception()
+    return payload
+
+
+@traced
+async def get_current_user(
+    request: Request,
+    payload: dict = Depends(get_token_claims),
+):
+    username = payload["sub"]
+    iat = payload.get("iat")
+    user = await user_cache.get(username, iat)
+    if user is None:
+        # a short read session of its own rather than the one of the route:
+        # a read session picks its replica on the first statement, which
+        # must come after request.state.user_id is set below. The user is
+        # returned detached, the route session attaches it when needed.
+        async with sessionmanager.read_session(request) as db:
+            user_service = UserService(db)
+            user = await user_service.get_user_by_username(username=username)
+        if user is None:
+            raise _credentials_exception()
+        await user_cache.set(user, iat, payload.get("exp"))
+
+    # used to route the reads of this user, see DatabaseSessionManager
+    request.state.user_id = user.id
+    return user
 
 
 def create_email_token(data: dict):
     to_encode = data.copy()
     expire = datetime.now(UTC) + timedelta(days=7)
     to_encode.update({"iat": datetime.now(UTC), "exp": expire})
-    token = jwt.encode(to_encode, config.JWT_SECRET, algorithm=config.JWT_ALGORITHM)
+    token = keyring.sign(to_encode)
     return token
 
 
 async def get_email_from_token(token: str):
     try:
-        payload = jwt.decode(
-            token, config.JWT_SECRET, algorithms=[config.JWT_ALGORITHM]
-        )
+        payload = keyring.decode(token)
         email = payload.get("sub")
         return email
     except JWTError as e:
@@ -0,0 +1,204 @@
+import asyncio
+import hashlib
+import logging
+import os
+import tempfile
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+from fastapi import HTTPException, UploadFile, status
+from PIL import Image, ImageOps
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.conf import messages
+from src.conf.config import config
+from src.database.db import sessionmanager
+from src.database.models import User
+from src.services.cache import cache_backend
+from src.services.metrics import Histogram
+from src.services.storage import CloudinaryStorage, LocalStorage, create_storage
+from src.services.tracing import traced
+from src.services.users import UserService
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".gif", ".webp"}
+
+
+async def save_upload(file: UploadFile, max_bytes: int) -> tuple[Path, str]:
+    """Copies the upload to a temp file, returns its path and sha256."""
+    suffix = Path(file.filename or "").suffix.lower()
+    fd, name = tempfile.mkstemp(
+        prefix="avatar-", suffix=suffix if suffix in IMAGE_SUFFIXES else ""
+    )
+    path = Path(name)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as target:
+            while chunk := await file.read(CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise HTTPException(
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                        detail=messages.AVATAR_TOO_LARGE,
+                    )
+                digest.update(chunk)
+                target.write(chunk)
+    except BaseException:
+        path.unlink(missing_ok=True)
+        raise
+    return path, digest.hexdigest()
+
+
+def normalize_image(path: Path, size: int) -> Path:
+    # CPU bound, runs in a thread
+    target = path.with_suffix(".jpg")
+    with Image.open(path) as image:
+        image = ImageOps.exif_transpose(image)
+        image = ImageOps.fit(image.convert("RGB"), (size, size))
+        image.save(target, "JPEG", quality=85, optimize=True)
+    return target
+
+
+def _avatar_cache_key(digest: str) -> str:
+    return f"avatar:{digest}"
+
+
+@dataclass
+class AvatarJob:
+    email: str
+    path: Path
+    digest: str
+
+
+class AvatarWorker:
+    """Processes and stores uploaded avatars in the background of the app."""
+
+    def __init__(
+        self, storage: CloudinaryStorage | LocalStorage, workers: int, queue_size: int
+    ):
+        self.storage = storage
+        self.workers = workers
+        self.processed = 0
+        self.failed = 0
+        self.latency = Histogram()
+        self._queue: asyncio.Queue[AvatarJob] = asyncio.Queue(queue_size)
+        self._tasks: list[asyncio.Task] = []
+        self._active = 0
+
+    def submit(self, job: AvatarJob) -> None:
+        # raises asyncio.QueueFull
+        self._queue.put_nowait(job)
+
+    async def process(self, job: AvatarJob) -> None:
+        start = time.perf_counter()
+        image = job.path
+        try:
+            image = await asyncio.to_thread(
+                normalize_image, job.path, config.AVATAR_SIZE
+            )
+            url = await self.storage.save(image, f"avatars/{job.digest}{image.suffix}")
+            async with sessionmanager.session() as db:
+                await UserService(db).update_avatar_url(job.email, url)
+            await cache_backend.set(
+                _avatar_cache_key(job.digest), url, config.AVATAR_HASH_TTL_SECONDS
+            )
+        finally:
+            job.path.unlink(missing_ok=True)
+            image.unlink(missing_ok=True)
+            self.latency.observe(time.perf_counter() - start)
+
+    async def _run(self) -> None:
+        while True:
+            job = await self._queue.get()
+            self._active += 1
+            try:
+                await self.process(job)
+                self.processed += 1
+            except Exception:
+                self.failed += 1
+                logger.exception("Avatar processing failed for %s", job.email)
+            finally:
+                self._active -= 1
+                self._queue.task_done()
+
+    def start(self) -> None:
+        if not self._tasks:
+            self._tasks = [
+                asyncio.create_task(self._run()) for _ in range(self.workers)
+            ]
+
+    async def stop(self) -> None:
+        # the queued uploads were answered 202 already, let them finish
+        if self._tasks:
+            try:
+                async with asyncio.timeout(config.AVATAR_DRAIN_TIMEOUT_SECONDS):
+                    await self._queue.join()
+            except TimeoutError:
+                logger.warning(
+                    "Avatar queue not drained on shutdown, %s uploads dropped",
+                    self._queue.qsize() + self._active,
+                )
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        while not self._queue.empty():
+            self._queue.get_nowait().path.unlink(missing_ok=True)
+
+    def stats(self) -> dict:
+        return {
+            "storage": type(self.storage).__name__,
+            "queued": self._queue.qsize(),
+            "processed": self.processed,
+            "failed": self.failed,
+            "latency": self.latency.snapshot(),
+        }
+
+
+avatar_worker = AvatarWorker(
+    create_storage(), config.AVATAR_WORKERS, config.AVATAR_QUEUE_SIZE
+)
+
+
+@traced
+class AvatarService:
+    def __init__(self, db: AsyncSession):
+        self.user_service = UserService(db)
+
+    async def update_avatar(self, file: UploadFile, user: User) -> tuple[User, bool]:
+        """Returns the user and whether the avatar is already updated.
+
+        Otherwise it is processed by the avatar worker.
+        """
+        if not (file.content_type or "").startswith("image/"):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=messages.AVATAR_NOT_IMAGE,
+            )
+
+        path, digest = await save_upload(file, config.AVATAR_MAX_BYTES)
+        # storage keys contain the content hash, the same image is a no-op
+        if digest in (user.avatar or ""):
+            path.unlink(missing_ok=True)
+            return user, True
+
+        url = await cache_backend.get(_avatar_cache_key(digest))
+        if url:
+            path.unlink(missing_ok=True)
+            user = await self.user_service.update_avatar_url(user.email, url)
+            return user, True
+
+        try:
+            avatar_worker.submit(AvatarJob(user.email, path, digest))
+        except asyncio.QueueFull:
+            path.unlink(missing_ok=True)
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail=messages.AVATAR_QUEUE_FULL,
+                headers={"Retry-After": "5"},
+            )
+        return user, False
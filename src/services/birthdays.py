@@ -0,0 +1,128 @@
+from datetime import date, datetime, timedelta
+from typing import Iterable, List
+
+from sqlalchemy import func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.conf.config import config
+from src.database.models import Contact, User
+from src.repository.birthdays import BirthdayDigestRepository
+from src.repository.contacts import ContactRepository
+from src.repository.emails import EmailOutboxRepository
+from src.schemas import ContactResponse
+from src.services.email import email_worker
+from src.services.tracing import traced
+
+
+def birthday_window(today: date | None = None) -> tuple[date, date]:
+    # the default range of GET /api/contacts/birthday, to_date not included
+    today = today or datetime.now().date()
+    return today, today + timedelta(days=config.BIRTHDAY_WINDOW_DAYS)
+
+
+def serialize_contacts(contacts: Iterable[Contact]) -> List[dict]:
+    return [
+        ContactResponse.model_validate(contact).model_dump(mode="json")
+        for contact in contacts
+    ]
+
+
+def _digest(user_id: int, window: tuple[date, date], version: int, contacts) -> dict:
+    return {
+        "user_id": user_id,
+        "from_date": window[0],
+        "to_date": window[1],
+        "contacts_version": version,
+        "contacts": contacts,
+        "computed_at": func.now(),
+    }
+
+
+@traced
+class BirthdayDigestService:
+    """Upcoming birthdays served from the precomputed digest of the user.
+
+    Reads only: the digest of today is served even when the contacts changed
+    since, refresh_birthday_digests brings it up to date on its next run.
+    Without a digest for today the birthdays are computed, not stored.
+    """
+
+    def __init__(self, db: AsyncSession):
+        self.repository = BirthdayDigestRepository(db)
+        self.contact_repository = ContactRepository(db)
+
+    async def get_upcoming_birthdays(self, user: User) -> List[dict]:
+        window = birthday_window()
+        digest = await self.repository.get_digest(user)
+        if digest is not None and (digest.from_date, digest.to_date) == window:
+            return digest.contacts
+
+        return serialize_contacts(
+            await self.contact_repository.get_contacts_by_birthday(*window, user)
+        )
+
+
+def _email_context(user, contacts: List[dict]) -> dict:
+    return {
+        "username": user.username,
+        "days": config.BIRTHDAY_WINDOW_DAYS,
+        "contacts": [
+            {
+                "name": contact["name"],
+                "surname": contact["surname"],
+                "birthday": date.fromisoformat(contact["birthday"][:10]).strftime(
+                    "%B %d"
+                ),
+            }
+            for contact in contacts
+        ],
+    }
+
+
+async def refresh_birthday_digests(db: AsyncSession) -> None:
+    """Computes the digests of today for all the users, in batches.
+
+    Runs every BIRTHDAY_DIGEST_INTERVAL, users whose digest is of today and
+    of their current contacts version are skipped. Safe to run from several
+    processes at once: the digests are upserts and the emails are claimed.
+    """
+    repository = BirthdayDigestRepository(db)
+    contact_repository = ContactRepository(db)
+    email_repository = EmailOutboxRepository(db)
+    window = birthday_window()
+    after_id = 0
+    while True:
+        users = await repository.get_users_to_refresh(
+            window[0],
+            after_id,
+            config.BIRTHDAY_DIGEST_BATCH_SIZE,
+            config.BIRTHDAY_DIGEST_EMAIL,
+        )
+        if not users:
+            return
+
+        birthdays = await contact_repository.get_birthdays_of_users(
+            [user.id for user in users], *window
+        )
+        digests = {user.id: serialize_contacts(birthdays[user.id]) for user in users}
+        await repository.save_digests(
+            [
+                _digest(user.id, window, user.version or 0, digests[user.id])
+                for user in users
+            ]
+        )
+
+        if config.BIRTHDAY_DIGEST_EMAIL:
+            claimed = await repository.claim_emails(list(digests), window[0])
+            for user in users:
+                if user.id in claimed and user.confirmed and digests[user.id]:
+                    email_repository.add(
+                        user.email,
+                        "Upcoming birthdays",
+                        "birthday_digest.html",
+                        _email_context(user, digests[user.id]),
+                    )
+            await db.commit()
+            email_worker.notify()
+
+        after_id = users[-1].id
@@ -0,0 +1,146 @@
+import json
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any
+
+from sqlalchemy.orm import make_transient_to_detached
+
+from src.conf.config import config
+from src.database.models import User
+
+
+class MemoryCacheBackend:
+    """In-process LRU cache with per-entry TTL."""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._data: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+
+    async def get(self, key: str):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value, ttl: float) -> None:
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    async def delete(self, key: str) -> None:
+        self._data.pop(key, None)
+
+    async def delete_prefix(self, prefix: str) -> None:
+        for key in [key for key in self._data if key.startswith(prefix)]:
+            del self._data[key]
+
+
+class RedisCacheBackend:
+    """Shared cache on top of any redis.asyncio compatible client.
+
+    Values are stored as JSON so that every worker process can read them.
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    async def get(self, key: str):
+        value = await self.client.get(key)
+        return json.loads(value) if value is not None else None
+
+    async def set(self, key: str, value, ttl: float) -> None:
+        await self.client.set(key, json.dumps(value), ex=max(int(ttl), 1))
+
+    async def delete(self, key: str) -> None:
+        await self.client.delete(key)
+
+    async def delete_prefix(self, prefix: str) -> None:
+        keys = [key async for key in self.client.scan_iter(match=f"{prefix}*")]
+        if keys:
+            await self.client.delete(*keys)
+
+
+def create_cache_backend(url: str | None = None):
+    if not url:
+        return MemoryCacheBackend(config.CACHE_MAX_SIZE)
+
+    # redis is an optional dependency, only needed for the shared backend
+    import redis.asyncio as redis
+
+    return RedisCacheBackend(redis.from_url(url, decode_responses=True))
+
+
+cache_backend = create_cache_backend(config.CACHE_URL)
+
+
+class UserCache:
+    # sensitive columns are never put into the cache
+    excluded_columns = {"hashed_password"}
+
+    def __init__(self, backend, ttl: int):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(username: str, iat: int | None = None) -> str:
+        if iat is None:
+            return f"user:{username}:"
+        return f"user:{username}:{iat}"
+
+    def _dump(self, user: User) -> dict:
+        data = {}
+        for column in User.__table__.columns:
+            if column.key in self.excluded_columns:
+                continue
+            value = getattr(user, column.key)
+            if isinstance(value, datetime):
+                value = value.isoformat()
+            data[column.key] = value
+        return data
+
+    @staticmethod
+    def _load(data: dict) -> User:
+        data = dict(data)
+        if data.get("created_at"):
+            data["created_at"] = datetime.fromisoformat(data["created_at"])
+        user = User(**data)
+        # turn the instance into a "loaded from db" one, without pending changes
+        make_transient_to_detached(user)
+        return user
+
+    async def get(self, username: str, iat: int | None) -> User | None:
+        data = await self.backend.get(self._key(username, iat))
+        if data is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        # detached, like the users loaded by get_current_user
+        return self._load(data)
+
+    async def set(self, user: User, iat: int | None, exp: int | None = None) -> None:
+        ttl = self.ttl
+        if exp is not None:
+            ttl = min(ttl, exp - time.time())
+        if ttl <= 0:
+            return
+        await self.backend.set(self._key(user.username, iat), self._dump(user), ttl)
+
+    async def invalidate(self, username: str) -> None:
+        await self.backend.delete_prefix(self._key(username))
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+user_cache = UserCache(cache_backend, config.USER_CACHE_TTL_SECONDS)
@@ -1,12 +1,73 @@
-from datetime import date
+import asyncio
+import csv
+import io
+from datetime import date, timedelta
+from itertools import islice
+from typing import AsyncIterable, AsyncIterator, Iterable, List
+
+from fastapi import HTTPException, UploadFile, status
+from pydantic import ValidationError
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.repository.contacts import ContactRepository
 from src.repository.groups import GroupRepository
-from src.schemas import ContactModel, ContactUpdate, ContactIsActiveUpdate
+from src.schemas import (
+    ContactModel,
+    ContactUpdate,
+    ContactIsActiveUpdate,
+    ContactImportResult,
+    ContactChanges,
+    ContactStats,
+)
 from src.database.models import User
+from src.conf import messages
+from src.conf.config import config
+from src.services.pagination import (
+    encode_cursor,
+    decode_cursor,
+    from_micros,
+    to_micros,
+)
+from src.services.etag import contact_etag, parse_contact_etags
+from src.services.tracing import traced
+
+
+def _format_validation_error(e: ValidationError) -> List[str]:
+    return [
+        f"{'.'.join(str(loc) for loc in error['loc'])}: {error['msg']}"
+        for error in e.errors()
+    ]
+
+
+def _read_csv_batch(reader: csv.DictReader, size: int) -> List[dict]:
+    rows = list(islice(reader, size))
+    for row in rows:
+        groups = row.get("groups") or ""
+        row["groups"] = [group for group in groups.split(";") if group.strip()]
+    return rows
 
 
+async def read_csv_rows(file: UploadFile) -> AsyncIterator[dict]:
+    # read in batches from the spooled upload, never all at once; past the
+    # spool threshold it is on disk, so the batches are read in a thread
+    text = io.TextIOWrapper(file.file, encoding="utf-8-sig", newline="")
+    reader = csv.DictReader(text)
+    try:
+        while rows := await asyncio.to_thread(
+            _read_csv_batch, reader, config.CONTACT_IMPORT_BATCH_SIZE
+        ):
+            for row in rows:
+                yield row
+    finally:
+        text.detach()
+
+
+async def _iterate(rows: Iterable[dict]) -> AsyncIterator[dict]:
+    for row in rows:
+        yield row
+
+
+@traced
 class ContactService:
     def __init__(self, db: AsyncSession):
         self.contact_repository = ContactRepository(db)
@@ -16,8 +77,132 @@ class ContactService:
         groups = await self.group_repository.get_groups_by_ids(body.groups, user)
         return await self.contact_repository.create_contact(body, groups, user)
 
-    async def get_contacts(self, skip: int, limit: int, query: str | None, user: User):
-        return await self.contact_repository.get_contacts(skip, limit, query, user)
+    async def import_contacts(
+        self, rows: Iterable[dict] | AsyncIterable[dict], user: User
+    ) -> ContactImportResult:
+        group_ids = set(await self.group_repository.get_group_ids(user))
+        created = 0
+        errors = []
+        batch = []
+
+        if isinstance(rows, Iterable):
+            rows = _iterate(rows)
+        row_number = 0
+        async for row in rows:
+            row_number += 1
+            if row_number > config.CONTACT_IMPORT_MAX_ROWS:
+                errors.append(
+                    {"row": row_number, "errors": [messages.IMPORT_ROWS_LIMIT]}
+                )
+                break
+
+            try:
+                body = ContactModel.model_validate(row)
+            except ValidationError as e:
+                errors.append(
+                    {"row": row_number, "errors": _format_validation_error(e)}
+                )
+                continue
+
+            row_errors = []
+            if body.birthday is None:
+                row_errors.append(f"birthday: {messages.FIELD_REQUIRED}")
+            unknown_groups = set(body.groups) - group_ids
+            if unknown_groups:
+                row_errors.append(
+                    f"groups: {messages.UNKNOWN_GROUPS} {sorted(unknown_groups)}"
+                )
+            if row_errors:
+                errors.append({"row": row_number, "errors": row_errors})
+                continue
+
+            batch.append(body)
+            if len(batch) >= config.CONTACT_IMPORT_BATCH_SIZE:
+                created += len(
+                    await self.contact_repository.create_contacts(batch, user)
+                )
+                batch = []
+
+        if batch:
+            created += len(await self.contact_repository.create_contacts(batch, user))
+
+        return ContactImportResult(created=created, errors=errors)
+
+    async def get_contacts(
+        self,
+        skip: int,
+        limit: int,
+        query: str | None,
+        user: User,
+        cursor: str | None = None,
+    ):
+        if query:
+            # search results are ranked by relevance, so they are paged by offset
+            if cursor:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=messages.SEARCH_CURSOR_UNSUPPORTED,
+                )
+            contacts = await self.contact_repository.search_contacts(
+                query, skip, limit, user
+            )
+            return contacts, None
+
+        after = decode_cursor(cursor, (str, str, int)) if cursor else None
+        # one extra row tells whether there is a next page
+        contacts = await self.contact_repository.get_contacts(
+            skip, limit + 1, user, after
+        )
+        next_cursor = None
+        if len(contacts) > limit:
+            contacts = contacts[:limit]
+            last = contacts[-1]
+            next_cursor = encode_cursor([last.surname, last.name, last.id])
+        return contacts, next_cursor
+
+    async def get_changes(
+        self, since: str | None, limit: int, user: User
+    ) -> ContactChanges:
+        now = await self.contact_repository.get_db_now()
+        after = None
+        if since:
+            updated_at, contact_id = decode_cursor(since, (int, int))
+            after = (from_micros(updated_at), contact_id)
+            # deletions older than that are pruned, they can't be reported
+            retention = timedelta(days=config.SYNC_TOMBSTONE_RETENTION_DAYS)
+            if after[0] < now - retention:
+                raise HTTPException(
+                    status_code=status.HTTP_410_GONE,
+                    detail=messages.SYNC_TOKEN_EXPIRED,
+                )
+
+        # one extra row tells whether there is a next page
+        contacts = await self.contact_repository.get_changed_contacts(
+            user, after, limit + 1
+        )
+        has_more = len(contacts) > limit
+        if has_more:
+            contacts = contacts[:limit]
+            last = contacts[-1]
+            until = last.updated_at
+            next_token = encode_cursor([to_micros(last.updated_at), last.id])
+        else:
+            # updated_at is the transaction start time, so transactions still
+            # in flight may commit older values; the next sync starts a bit
+            # earlier and may repeat a few contacts, clients upsert by id
+            until = None
+            watermark = now - timedelta(seconds=config.SYNC_OVERLAP_SECONDS)
+            next_token = encode_cursor([to_micros(watermark), 0])
+
+        # a full sync (no token) has nothing to delete on the client
+        deleted = []
+        if after is not None:
+            deleted = await self.contact_repository.get_deleted_contact_ids(
+                user, after[0], until
+            )
+        return ContactChanges(
+            changed=contacts, deleted=deleted, next_token=next_token, has_more=has_more
+        )
 
     async def get_contacts_by_birthday(
         self,
@@ -25,25 +210,92 @@ class ContactService:
         to_date: date | None,
         user: User,
     ):
+        if from_date and to_date and to_date < from_date:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=messages.INVALID_DATE_RANGE,
+            )
         return await self.contact_repository.get_contacts_by_birthday(
             from_date, to_date, user
         )
 
+    async def get_collection_version(self, user: User) -> int:
+        return await self.contact_repository.versions.get_version("contacts", user)
+
+    async def get_stats(self, user: User) -> ContactStats:
+        # maintained by the writes, no contact is counted here
+        counts = await self.contact_repository.versions.get_counts(user)
+        if counts is None:
+            return ContactStats()
+        return ContactStats(
+            contacts=counts.contact_count,
+            active_contacts=counts.active_contact_count,
+            groups=counts.group_count,
+        )
+
+    async def get_contact_etag(self, contact_id: int, user: User) -> str | None:
+        version = await self.contact_repository.get_contact_version(contact_id, user)
+        return contact_etag(contact_id, version) if version is not None else None
+
     async def get_contact(self, contact_id: int, user: User):
         return await self.contact_repository.get_contact_by_id(contact_id, user)
 
-    async def update_contact(self, contact_id: int, body: ContactUpdate, user: User):
+    async def _precondition_failed(self, contact_id: int, user: User):
+        # the conditional update matched nothing, 412 if the contact exists
+        # with another version, the caller answers 404 otherwise
+        version = await self.contact_repository.get_contact_version(contact_id, user)
+        if version is not None:
+            raise HTTPException(
+                status_code=status.HTTP_412_PRECONDITION_FAILED,
+                detail=messages.PRECONDITION_FAILED,
+            )
+
+    async def update_contact(
+        self,
+        contact_id: int,
+        body: ContactUpdate,
+        user: User,
+        if_match: str | None = None,
+    ):
+        versions = parse_contact_etags(if_match, contact_id) if if_match else None
         groups = await self.group_repository.get_groups_by_ids(body.groups, user)
-        return await self.contact_repository.update_contact(
-            contact_id, body, groups, user
+        contact = await self.contact_repository.update_contact(
+            contact_id, body, groups, user, versions
         )
+        if contact is None and versions is not None:
+            await self._precondition_failed(contact_id, user)
+        return contact
 
     async def update_contact_is_active(
-        self, contact_id: int, body: ContactIsActiveUpdate, user: User
+        self,
+        contact_id: int,
+        body: ContactIsActiveUpdate,
+        user: User,
+        if_match: str | None = None,
     ):
-        return await self.contact_repository.update_contact_is_active(
-            contact_id, body, user
+        versions = parse_contact_etags(if_match, contact_id) if if_match else None
+        contact = await self.contact_repository.update_contact_is_active(
+            contact_id, body, user, versions
         )
+        if contact is None and versions is not None:
+            await self._precondition_failed(contact_id, user)
+        return contact
+
+    async def remove_contact(
+        self, contact_id: int, user: User, if_match: str | None = None
+    ):
+        versions = parse_contact_etags(if_match, contact_id) if if_match else None
+        contact = await self.contact_repository.remove_contact(
+            contact_id, user, versions
+        )
+        if contact is None and versions is not None:
+            await self._precondition_failed(contact_id, user)
+        return contact
+
 
-    async def remove_contact(self, contact_id: int, user: User):
-        return await self.contact_repository.remove_contact(contact_id, user)
+async def prune_contact_tombstones(db: AsyncSession) -> None:
+    repository = ContactRepository(db)
+    now = await repository.get_db_now()
+    await repository.prune_tombstones(
+        now - timedelta(days=config.SYNC_TOMBSTONE_RETENTION_DAYS)
+    )
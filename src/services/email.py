@@ -1,41 +1,280 @@
+import asyncio
+import logging
+import time
+from datetime import timedelta
+from email.message import EmailMessage
+from email.utils import formataddr
 from pathlib import Path
+from typing import List
 
-from fastapi_mail import FastMail, MessageSchema, ConnectionConfig, MessageType
-from fastapi_mail.errors import ConnectionErrors
+import aiosmtplib
+from jinja2 import Environment, FileSystemLoader, select_autoescape
 from pydantic import EmailStr
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.services.auth import create_email_token
 from src.conf.config import config
+from src.database.db import sessionmanager
+from src.database.models import EmailOutbox
+from src.repository.emails import EmailOutboxRepository, utcnow
+from src.services.auth import create_email_token
+from src.services.metrics import Histogram
+from src.services.tracing import traced
+
+logger = logging.getLogger(__name__)
 
-conf = ConnectionConfig(
-    MAIL_USERNAME=config.MAIL_USERNAME,
-    MAIL_PASSWORD=config.MAIL_PASSWORD,
-    MAIL_FROM=config.MAIL_FROM,
-    MAIL_PORT=config.MAIL_PORT,
-    MAIL_SERVER=config.MAIL_SERVER,
-    MAIL_FROM_NAME=config.MAIL_FROM_NAME,
-    MAIL_STARTTLS=config.MAIL_STARTTLS,
-    MAIL_SSL_TLS=config.MAIL_SSL_TLS,
-    USE_CREDENTIALS=config.USE_CREDENTIALS,
-    VALIDATE_CERTS=config.VALIDATE_CERTS,
-    TEMPLATE_FOLDER=Path(__file__).parent / "templates",
+# templates are compiled on the first use and cached by the environment
+templates = Environment(
+    loader=FileSystemLoader(Path(__file__).parent / "templates"),
+    autoescape=select_autoescape(["html"]),
 )
+TEMPLATES = ["confirm_email.html", "birthday_digest.html"]
+
+
+def _confirmation_context(email: EmailOutbox) -> dict:
+    return {"token": create_email_token(data={"sub": email.recipient})}
+
+
+# secrets are not kept in the outbox, they are made when the email is sent
+SEND_TIME_CONTEXT = {"confirm_email.html": _confirmation_context}
+
+
+def render_message(email: EmailOutbox) -> EmailMessage:
+    context = dict(email.context)
+    if email.template in SEND_TIME_CONTEXT:
+        context.update(SEND_TIME_CONTEXT[email.template](email))
+    html = templates.get_template(email.template).render(**context)
+    message = EmailMessage()
+    message["From"] = formataddr((config.MAIL_FROM_NAME, config.MAIL_FROM))
+    message["To"] = email.recipient
+    message["Subject"] = email.subject
+    message.set_content(html, subtype="html")
+    return message
+
+
+def retry_delay(attempts: int) -> timedelta:
+    # exponential backoff: base, 2 * base, 4 * base... up to the max
+    seconds = config.EMAIL_RETRY_BASE_SECONDS * 2 ** (attempts - 1)
+    return timedelta(seconds=min(seconds, config.EMAIL_RETRY_MAX_SECONDS))
+
 
-async def send_email(email: EmailStr, username: str, host: str):
-    try: 
-        token_verification = create_email_token(data={"sub": email})
-        message = MessageSchema(
-            subject="Confirm your email",
-            recipients=[email],
-            template_body={
-                "host": host,
-                "username": username,
-                "token": token_verification,
-            },
-            subtype=MessageType.html,
+class PermanentEmailError(Exception):
+    """Rejected by the server, sending it again won't help."""
+
+
+class MemoryTransport:
+    """Keeps sent messages in memory, a stand-in for SMTP in tests."""
+
+    def __init__(self):
+        self.sent: List[EmailMessage] = []
+
+    async def send(self, messages: List[EmailMessage]) -> List[Exception | None]:
+        self.sent.extend(messages)
+        return [None] * len(messages)
+
+    async def close(self) -> None:
+        pass
+
+
+class SMTPTransport:
+    """Sends over a few SMTP connections kept open between batches."""
+
+    def __init__(self, connections: int):
+        self._clients = [self._create_client() for _ in range(connections)]
+
+    @staticmethod
+    def _create_client() -> aiosmtplib.SMTP:
+        credentials = {}
+        if config.USE_CREDENTIALS:
+            credentials = {
+                "username": config.MAIL_USERNAME,
+                "password": config.MAIL_PASSWORD,
+            }
+        return aiosmtplib.SMTP(
+            hostname=config.MAIL_SERVER,
+            port=config.MAIL_PORT,
+            use_tls=config.MAIL_SSL_TLS,
+            start_tls=config.MAIL_STARTTLS,
+            validate_certs=config.VALIDATE_CERTS,
+            timeout=config.EMAIL_SMTP_TIMEOUT,
+            **credentials,
         )
 
-        fm = FastMail(conf)
-        await fm.send_message(message, template_name="confirm_email.html")
-    except ConnectionErrors as e:
-        print(e)
+    async def _send_one(
+        self, client: aiosmtplib.SMTP, message: EmailMessage
+    ) -> Exception | None:
+        for attempt in range(2):
+            try:
+                if not client.is_connected:
+                    await client.connect()
+                await client.send_message(message)
+                return None
+            except aiosmtplib.SMTPServerDisconnected as e:
+                # idle connections get closed by the server, reconnect once
+                if attempt:
+                    return e
+            except aiosmtplib.SMTPRecipientsRefused as e:
+                return PermanentEmailError(str(e))
+            except aiosmtplib.SMTPResponseException as e:
+                if e.code >= 500:
+                    return PermanentEmailError(str(e))
+                return e
+            except (aiosmtplib.SMTPException, OSError, TimeoutError) as e:
+                client.close()
+                return e
+
+    async def _send_share(
+        self, client: aiosmtplib.SMTP, messages: List[EmailMessage]
+    ) -> List[Exception | None]:
+        return [await self._send_one(client, message) for message in messages]
+
+    async def send(self, messages: List[EmailMessage]) -> List[Exception | None]:
+        # message i goes to the connection i % n, connections work concurrently
+        n = len(self._clients)
+        shares = await asyncio.gather(
+            *(
+                self._send_share(client, messages[i::n])
+                for i, client in enumerate(self._clients)
+            )
+        )
+        results = [None] * len(messages)
+        for i, share in enumerate(shares):
+            results[i::n] = share
+        return results
+
+    async def close(self) -> None:
+        for client in self._clients:
+            if client.is_connected:
+                try:
+                    await client.quit()
+                except aiosmtplib.SMTPException:
+                    client.close()
+
+
+def create_transport() -> MemoryTransport | SMTPTransport:
+    if config.EMAIL_TRANSPORT == "memory":
+        return MemoryTransport()
+    return SMTPTransport(config.EMAIL_SMTP_CONNECTIONS)
+
+
+class EmailWorker:
+    """Drains the email outbox in batches, in the background of the app."""
+
+    def __init__(self, transport: MemoryTransport | SMTPTransport):
+        self.transport = transport
+        self.sent = 0
+        self.failed = 0
+        self.gave_up = 0
+        self.batch_time = Histogram()
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    def notify(self) -> None:
+        # a new email, don't wait for the next poll
+        self._wakeup.set()
+
+    async def process_batch(self) -> int:
+        async with sessionmanager.session() as db:
+            repository = EmailOutboxRepository(db)
+            emails = await repository.claim_batch(
+                config.EMAIL_BATCH_SIZE,
+                timedelta(seconds=config.EMAIL_LEASE_SECONDS),
+            )
+            if not emails:
+                return 0
+
+            start = time.perf_counter()
+            results = {}
+            rendered = []
+            for email in emails:
+                try:
+                    rendered.append((email, render_message(email)))
+                except Exception as e:
+                    results[email.id] = PermanentEmailError(repr(e))
+            sent = await self.transport.send([message for _, message in rendered])
+            for (email, _), error in zip(rendered, sent):
+                results[email.id] = error
+
+            sent_ids, failures = [], []
+            for email in emails:
+                error = results[email.id]
+                if error is None:
+                    sent_ids.append(email.id)
+                    continue
+                retry_at = None
+                if (
+                    not isinstance(error, PermanentEmailError)
+                    and email.attempts < config.EMAIL_MAX_ATTEMPTS
+                ):
+                    retry_at = utcnow() + retry_delay(email.attempts)
+                else:
+                    self.gave_up += 1
+                failures.append((email.id, repr(error), retry_at))
+
+            await repository.save_results(sent_ids, failures)
+            self.sent += len(sent_ids)
+            self.failed += len(failures)
+            self.batch_time.observe(time.perf_counter() - start)
+            return len(emails)
+
+    async def _run(self) -> None:
+        while True:
+            self._wakeup.clear()
+            try:
+                processed = await self.process_batch()
+            except Exception:
+                logger.exception("Email batch failed")
+                processed = 0
+            if processed < config.EMAIL_BATCH_SIZE:
+                # the outbox is drained
+                try:
+                    await asyncio.wait_for(
+                        self._wakeup.wait(), config.EMAIL_POLL_INTERVAL
+                    )
+                except TimeoutError:
+                    pass
+
+    def start(self) -> None:
+        for name in TEMPLATES:
+            templates.get_template(name)
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.transport.close()
+
+    def stats(self) -> dict:
+        return {
+            "transport": type(self.transport).__name__,
+            "sent": self.sent,
+            "failed": self.failed,
+            "gave_up": self.gave_up,
+            "batch_time": self.batch_time.snapshot(),
+        }
+
+
+email_worker = EmailWorker(create_transport())
+
+
+@traced
+class EmailService:
+    def __init__(self, db: AsyncSession):
+        self.repository = EmailOutboxRepository(db)
+
+    async def send_confirmation_email(self, email: EmailStr, username: str, host: str):
+        # the token is made at send time from the recipient, see render_message
+        await self.repository.enqueue(
+            email,
+            "Confirm your email",
+            "confirm_email.html",
+            {"host": str(host), "username": username},
+        )
+        email_worker.notify()
+
+
+async def prune_sent_emails(db: AsyncSession) -> None:
+    retention = timedelta(days=config.EMAIL_OUTBOX_RETENTION_DAYS)
+    await EmailOutboxRepository(db).prune_sent(utcnow() - retention)
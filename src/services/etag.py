@@ -0,0 +1,47 @@
+import hashlib
+
+from fastapi import Response, status
+
+
+def contact_etag(contact_id: int, version: int) -> str:
+    return f'"c{contact_id}-{version}"'
+
+
+def collection_etag(*parts) -> str:
+    digest = hashlib.sha256(repr(parts).encode()).hexdigest()[:32]
+    return f'"{digest}"'
+
+
+def _split(header: str) -> list[str]:
+    return [tag.strip().removeprefix("W/") for tag in header.split(",")]
+
+
+def etag_matches(header: str | None, etag: str) -> bool:
+    if not header:
+        return False
+    tags = _split(header)
+    return "*" in tags or etag in tags
+
+
+def parse_contact_etags(header: str, contact_id: int) -> list[int] | None:
+    """Returns contact versions listed in an If-Match header.
+
+    None means any version matches ("*").
+    """
+    tags = _split(header)
+    if "*" in tags:
+        return None
+
+    versions = []
+    prefix = f'"c{contact_id}-'
+    for tag in tags:
+        if tag.startswith(prefix) and tag.endswith('"'):
+            try:
+                versions.append(int(tag[len(prefix) : -1]))
+            except ValueError:
+                continue
+    return versions
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
@@ -0,0 +1,129 @@
+import csv
+import io
+import json
+from datetime import date, datetime
+from typing import AsyncIterator, List, Literal
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.conf.config import config
+from src.database.models import User
+from src.repository.contacts import ContactRepository
+from src.services.tracing import traced
+
+ExportFormat = Literal["csv", "ndjson", "vcf"]
+
+MEDIA_TYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "vcf": "text/vcard",
+}
+
+CSV_COLUMNS = [
+    "id",
+    "name",
+    "surname",
+    "email",
+    "phone_number",
+    "birthday",
+    "is_active",
+    "groups",
+]
+
+
+def _birthday(value: date | datetime) -> str:
+    if isinstance(value, datetime):
+        value = value.date()
+    return value.isoformat()
+
+
+def _csv_lines(rows: List[list]) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue()
+
+
+def _csv_chunk(chunk: List[tuple]) -> str:
+    return _csv_lines(
+        [
+            [
+                row.id,
+                row.name,
+                row.surname,
+                row.email,
+                row.phone_number,
+                _birthday(row.birthday),
+                row.is_active,
+                ";".join(groups),
+            ]
+            for row, groups in chunk
+        ]
+    )
+
+
+def _ndjson_chunk(chunk: List[tuple]) -> str:
+    return "".join(
+        json.dumps(
+            {
+                "id": row.id,
+                "name": row.name,
+                "surname": row.surname,
+                "email": row.email,
+                "phone_number": row.phone_number,
+                "birthday": _birthday(row.birthday),
+                "is_active": row.is_active,
+                "groups": groups,
+            }
+        )
+        + "\n"
+        for row, groups in chunk
+    )
+
+
+def _vcard_escape(value: str) -> str:
+    # RFC 6350, section 3.4
+    return (
+        value.replace("\\", "\\\\")
+        .replace(",", "\\,")
+        .replace(";", "\\;")
+        .replace("\n", "\\n")
+    )
+
+
+def _vcf_chunk(chunk: List[tuple]) -> str:
+    cards = []
+    for row, groups in chunk:
+        name, surname = _vcard_escape(row.name), _vcard_escape(row.surname)
+        lines = [
+            "BEGIN:VCARD",
+            "VERSION:3.0",
+            f"N:{surname};{name};;;",
+            f"FN:{name} {surname}",
+            f"EMAIL:{_vcard_escape(row.email)}",
+            f"TEL:{_vcard_escape(row.phone_number)}",
+            f"BDAY:{_birthday(row.birthday)}",
+        ]
+        if groups:
+            lines.append(f"CATEGORIES:{','.join(map(_vcard_escape, groups))}")
+        lines.append("END:VCARD")
+        cards.append("\r\n".join(lines) + "\r\n")
+    return "".join(cards)
+
+
+FORMATTERS = {"csv": _csv_chunk, "ndjson": _ndjson_chunk, "vcf": _vcf_chunk}
+
+
+@traced
+class ContactExportService:
+    def __init__(self, db: AsyncSession):
+        self.repository = ContactRepository(db)
+
+    async def export(self, format: ExportFormat, user: User) -> AsyncIterator[str]:
+        formatter = FORMATTERS[format]
+        if format == "csv":
+            yield _csv_lines([CSV_COLUMNS])
+
+        async for chunk in self.repository.stream_contacts(
+            user, config.CONTACT_EXPORT_CHUNK_SIZE
+        ):
+            yield formatter(chunk)
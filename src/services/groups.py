@@ -1,14 +1,24 @@
+from typing import List
+
 from fastapi import HTTPException, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import IntegrityError
+from src.repository.contacts import ContactRepository
 from src.repository.groups import GroupRepository
 from src.schemas import GroupModel, GroupResponse
-from src.database.models import User
+from src.database.models import Group, User
 from src.conf import messages
+from src.services.pagination import encode_cursor, decode_cursor
+from src.services.tracing import traced
+
+
+# the unique constraint of group (name, user_id); named by PostgreSQL,
+# SQLite reports the columns instead
+GROUP_UNIQUE_CONSTRAINTS = ("unique_group_user", "group.name, group.user_id")
 
 
 def _handle_integrity_error(e: IntegrityError):
-    if "unique_tag_user" in str(e.orig):
+    if any(name in str(e.orig) for name in GROUP_UNIQUE_CONSTRAINTS):
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT,
             detail=messages.GROUP_ALREADY_EXISTS,
@@ -20,9 +30,11 @@ def _handle_integrity_error(e: IntegrityError):
         )
 
 
+@traced
 class GroupService:
     def __init__(self, db: AsyncSession):
         self.repository = GroupRepository(db)
+        self.contact_repository = ContactRepository(db)
 
     async def create_group(self, body: GroupModel, user: User):
         try:
@@ -31,16 +43,51 @@ class GroupService:
             await self.repository.db.rollback()
             _handle_integrity_error(e)
 
-    async def get_groups(self, skip: int, limit: int, user: User):
-        return await self.repository.get_groups(skip, limit, user)
+    async def get_groups(
+        self, skip: int, limit: int, user: User, cursor: str | None = None
+    ):
+        after = decode_cursor(cursor, (int,))[0] if cursor else None
+        # one extra row tells whether there is a next page
+        groups = await self.repository.get_groups(skip, limit + 1, user, after)
+        next_cursor = None
+        if len(groups) > limit:
+            groups = groups[:limit]
+            next_cursor = encode_cursor([groups[-1].id])
+        return groups, next_cursor
+
+    async def get_collection_version(self, user: User) -> int:
+        return await self.repository.versions.get_version("groups", user)
+
+    async def get_contacts_version(self, user: User) -> int:
+        # membership changes bump the contacts version as well
+        return await self.repository.versions.get_version("contacts", user)
 
     async def get_group(self, group_id: int, user: User):
         return await self.repository.get_group_by_id(group_id, user)
 
+    async def get_group_contacts(
+        self, group: Group, limit: int, user: User, cursor: str | None = None
+    ):
+        after = decode_cursor(cursor, (int,))[0] if cursor else None
+        # one extra row tells whether there is a next page
+        contacts = await self.contact_repository.get_group_contacts(
+            group.id, limit + 1, user, after
+        )
+        next_cursor = None
+        if len(contacts) > limit:
+            contacts = contacts[:limit]
+            next_cursor = encode_cursor([contacts[-1].id])
+        return contacts, next_cursor
+
+    async def add_contacts(self, group: Group, contact_ids: List[int], user: User):
+        return await self.repository.add_contacts(group, contact_ids, user)
+
+    async def remove_contacts(self, group: Group, contact_ids: List[int], user: User):
+        return await self.repository.remove_contacts(group, contact_ids, user)
+
     async def update_group(self, group_id: int, body: GroupModel, user: User):
         try:
-
-            return await self.repository.update_group(group_id, body)
+            return await self.repository.update_group(group_id, body, user)
         except IntegrityError as e:
             await self.repository.db.rollback()
             _handle_integrity_error(e)
@@ -0,0 +1,103 @@
+import asyncio
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
+
+from passlib.context import CryptContext
+
+from src.conf.config import config
+from src.services.metrics import Histogram
+
+
+@lru_cache
+def _crypt_context(rounds: int) -> CryptContext:
+    return CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=rounds)
+
+
+# module level functions, so they can be pickled for a process pool
+def hash_password(password: str, rounds: int) -> str:
+    return _crypt_context(rounds).hash(password)
+
+
+def verify_and_update(
+    password: str, hashed_password: str, rounds: int
+) -> tuple[bool, str | None]:
+    return _crypt_context(rounds).verify_and_update(password, hashed_password)
+
+
+class HashingPoolSaturated(Exception):
+    pass
+
+
+class HashingPool:
+    """Runs bcrypt off the event loop with a bounded number of pending jobs."""
+
+    def __init__(self, workers: int, queue_size: int, executor: str, rounds: int):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.executor_type = executor
+        self.rounds = rounds
+        self.pending = 0
+        self.rejected = 0
+        self.latency = Histogram()
+        self._executor: Executor | None = None
+
+    @property
+    def executor(self) -> Executor:
+        # created lazily, a process pool must not be forked at import time
+        if self._executor is None:
+            if self.executor_type == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="hashing"
+                )
+        return self._executor
+
+    @property
+    def queue_depth(self) -> int:
+        return max(self.pending - self.workers, 0)
+
+    async def run(self, func, *args):
+        if self.pending >= self.workers + self.queue_size:
+            self.rejected += 1
+            raise HashingPoolSaturated()
+
+        self.pending += 1
+        start = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, func, *args)
+        finally:
+            self.pending -= 1
+            self.latency.observe(time.perf_counter() - start)
+
+    async def hash(self, password: str) -> str:
+        return await self.run(hash_password, password, self.rounds)
+
+    async def verify_and_update(
+        self, password: str, hashed_password: str
+    ) -> tuple[bool, str | None]:
+        return await self.run(verify_and_update, password, hashed_password, self.rounds)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "pending": self.pending,
+            "queue_depth": self.queue_depth,
+            "rejected": self.rejected,
+            "latency": self.latency.snapshot(),
+        }
+
+
+hashing_pool = HashingPool(
+    config.HASH_WORKERS,
+    config.HASH_QUEUE_SIZE,
+    config.HASH_EXECUTOR,
+    config.BCRYPT_ROUNDS,
+)
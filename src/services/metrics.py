@@ -0,0 +1,191 @@
+import json
+import time
+from bisect import bisect_left
+
+# default latency buckets, in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Cumulative-bucket histogram, compatible with the Prometheus layout."""
+
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def snapshot(self) -> dict:
+        cumulative = []
+        total = 0
+        for bound, count in zip(self.buckets + ("+Inf",), self.counts):
+            total += count
+            cumulative.append((bound, total))
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "max": self.max,
+            "buckets": cumulative,
+        }
+
+
+# A metric family is a JSON friendly dict, so that the families of every
+# worker process can be written to a file and merged by the one serving
+# /metrics:
+#   {"name": ..., "type": "counter" | "gauge" | "histogram", "help": ...,
+#    "samples": [[labels, value]]}
+# where a histogram value is a Histogram.snapshot()
+
+
+def family(name: str, type: str, help: str, samples: list[tuple[dict, object]]) -> dict:
+    return {"name": name, "type": type, "help": help, "samples": samples}
+
+
+def _merge_values(type: str, left, right):
+    if type != "histogram":
+        return left + right
+    return {
+        "count": left["count"] + right["count"],
+        "sum": left["sum"] + right["sum"],
+        "max": max(left["max"], right["max"]),
+        "buckets": [
+            (bound, count + other)
+            for (bound, count), (_, other) in zip(left["buckets"], right["buckets"])
+        ],
+    }
+
+
+def merge_families(snapshots: list[list[dict]]) -> list[dict]:
+    """Sums the samples with the same name and labels across processes."""
+    merged: dict[str, dict] = {}
+    for families in snapshots:
+        for metric in families:
+            target = merged.setdefault(metric["name"], {**metric, "samples": {}})
+            for labels, value in metric["samples"]:
+                key = json.dumps(labels, sort_keys=True)
+                if key in target["samples"]:
+                    value = _merge_values(
+                        metric["type"], target["samples"][key][1], value
+                    )
+                target["samples"][key] = (labels, value)
+    return [
+        {**metric, "samples": list(metric["samples"].values())}
+        for metric in merged.values()
+    ]
+
+
+def _labels(labels: dict, **extra) -> str:
+    labels = {**labels, **extra}
+    if not labels:
+        return ""
+    escaped = (
+        str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        for value in labels.values()
+    )
+    pairs = ",".join(f'{key}="{value}"' for key, value in zip(labels, escaped))
+    return "{" + pairs + "}"
+
+
+def render_prometheus(families: list[dict]) -> str:
+    """Prometheus text exposition format, version 0.0.4."""
+    lines = []
+    for metric in sorted(families, key=lambda metric: metric["name"]):
+        name = metric["name"]
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        for labels, value in metric["samples"]:
+            if metric["type"] != "histogram":
+                lines.append(f"{name}{_labels(labels)} {value}")
+                continue
+            for bound, count in value["buckets"]:
+                lines.append(f"{name}_bucket{_labels(labels, le=bound)} {count}")
+            lines.append(f"{name}_sum{_labels(labels)} {value['sum']}")
+            lines.append(f"{name}_count{_labels(labels)} {value['count']}")
+    return "\n".join(lines) + "\n"
+
+
+class RequestMetricsMiddleware:
+    """Latency per route template and requests in flight.
+
+    The route is known only after routing, so it is read from the scope
+    once the app returns; requests that match no route share one label
+    to keep the number of series bounded.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status_code = 500
+
+        async def send_with_status(message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        request_metrics.in_flight[method] = request_metrics.in_flight.get(method, 0) + 1
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            request_metrics.in_flight[method] -= 1
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            request_metrics.observe(
+                method, path, status_code, time.perf_counter() - start
+            )
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.latency: dict[tuple[str, str, int], Histogram] = {}
+        self.in_flight: dict[str, int] = {}
+
+    def observe(self, method: str, route: str, status: int, elapsed: float) -> None:
+        key = (method, route, status)
+        histogram = self.latency.get(key)
+        if histogram is None:
+            histogram = self.latency[key] = Histogram()
+        histogram.observe(elapsed)
+
+    def families(self) -> list[dict]:
+        return [
+            family(
+                "http_request_duration_seconds",
+                "histogram",
+                "HTTP request latency by route template",
+                [
+                    (
+                        {"method": method, "route": route, "status": str(status)},
+                        histogram.snapshot(),
+                    )
+                    for (method, route, status), histogram in self.latency.items()
+                ],
+            ),
+            family(
+                "http_requests_in_progress",
+                "gauge",
+                "HTTP requests being processed",
+                [
+                    ({"method": method}, count)
+                    for method, count in self.in_flight.items()
+                ],
+            ),
+        ]
+
+
+request_metrics = RequestMetrics()
@@ -0,0 +1,294 @@
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import time
+from pathlib import Path
+
+from src.conf.config import config
+from src.database.db import sessionmanager
+from src.services.avatars import avatar_worker
+from src.services.cache import user_cache
+from src.services.email import email_worker
+from src.services.hashing import hashing_pool
+from src.services.metrics import (
+    family,
+    merge_families,
+    render_prometheus,
+    request_metrics,
+)
+from src.services.tokens import token_verifier
+from src.services.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+
+def _pool_families() -> list[dict]:
+    stats = sessionmanager.pool_stats()
+    pools = [({"pool": "primary"}, stats["primary"])] + [
+        ({"pool": replica["host"] or "replica"}, replica)
+        for replica in stats["replicas"]
+    ]
+    return [
+        family(
+            "db_pool_connections",
+            "gauge",
+            "Connections of the pool by state",
+            [
+                ({**labels, "state": state}, pool[state])
+                for labels, pool in pools
+                for state in ("checked_in", "checked_out", "overflow")
+            ],
+        ),
+        family(
+            "db_pool_timeouts_total",
+            "counter",
+            "Connection checkouts that timed out",
+            [(labels, pool["timeouts"]) for labels, pool in pools],
+        ),
+        family(
+            "db_pool_wait_seconds",
+            "histogram",
+            "Time waited for a pool connection",
+            [(labels, pool["wait_time"]) for labels, pool in pools],
+        ),
+    ]
+
+
+def _hashing_families() -> list[dict]:
+    stats = hashing_pool.stats()
+    return [
+        family(
+            "password_hash_seconds",
+            "histogram",
+            "bcrypt hash and verify time, queueing included",
+            [({}, stats["latency"])],
+        ),
+        family(
+            "password_hash_pending",
+            "gauge",
+            "bcrypt jobs running or queued",
+            [({}, stats["pending"])],
+        ),
+        family(
+            "password_hash_rejected_total",
+            "counter",
+            "bcrypt jobs rejected because the pool was saturated",
+            [({}, stats["rejected"])],
+        ),
+    ]
+
+
+def _background_families() -> list[dict]:
+    email = email_worker.stats()
+    avatars = avatar_worker.stats()
+    return [
+        family(
+            "email_send_total",
+            "counter",
+            "Outbox emails by send outcome",
+            [
+                ({"outcome": "sent"}, email["sent"]),
+                ({"outcome": "failed"}, email["failed"]),
+                ({"outcome": "gave_up"}, email["gave_up"]),
+            ],
+        ),
+        family(
+            "email_batch_seconds",
+            "histogram",
+            "Time to send a batch of outbox emails",
+            [({}, email["batch_time"])],
+        ),
+        family(
+            "avatar_jobs_total",
+            "counter",
+            "Avatar jobs by outcome",
+            [
+                ({"outcome": "processed"}, avatars["processed"]),
+                ({"outcome": "failed"}, avatars["failed"]),
+            ],
+        ),
+        family(
+            "avatar_jobs_queued",
+            "gauge",
+            "Avatar jobs waiting for the worker",
+            [({}, avatars["queued"])],
+        ),
+    ]
+
+
+def _cache_families() -> list[dict]:
+    return [
+        family(
+            "cache_requests_total",
+            "counter",
+            "Cache lookups by cache and result",
+            [
+                ({"cache": "user", "result": "hit"}, user_cache.hits),
+                ({"cache": "user", "result": "miss"}, user_cache.misses),
+                ({"cache": "token", "result": "hit"}, token_verifier.hits),
+                ({"cache": "token", "result": "miss"}, token_verifier.misses),
+            ],
+        ),
+    ]
+
+
+def _tracing_families() -> list[dict]:
+    stats = tracer.stats()
+    return [
+        family(
+            "trace_spans_total",
+            "counter",
+            "Finished spans by outcome",
+            [
+                ({"outcome": "exported"}, stats["exported"]),
+                ({"outcome": "dropped"}, stats["dropped"]),
+            ],
+        ),
+    ]
+
+
+def collect() -> list[dict]:
+    """Metric families of this process."""
+    return [
+        *request_metrics.families(),
+        *_pool_families(),
+        *_hashing_families(),
+        *_background_families(),
+        *_cache_families(),
+        *_tracing_families(),
+    ]
+
+
+def _hit_ratio(families: list[dict]) -> dict:
+    # a ratio can't be summed across processes, it is derived after merging
+    counts: dict[str, dict[str, int]] = {}
+    for metric in families:
+        if metric["name"] == "cache_requests_total":
+            for labels, value in metric["samples"]:
+                counts.setdefault(labels["cache"], {})[labels["result"]] = value
+    return family(
+        "cache_hit_ratio",
+        "gauge",
+        "Share of cache lookups that were hits",
+        [
+            (
+                {"cache": cache},
+                result.get("hit", 0) / total if (total := sum(result.values())) else 0,
+            )
+            for cache, result in counts.items()
+        ],
+    )
+
+
+class MetricsExporter:
+    """Aggregates the metrics of all the worker processes.
+
+    Every process writes its families to METRICS_DIR/metrics-<pid>.json
+    periodically; /metrics, served by any of them, merges the files.
+    Without METRICS_DIR only the serving process is reported.
+
+    The file of a process that stopped or went stale is retired: its
+    counters and histograms are added to METRICS_DIR/retired.json, so that
+    the merged totals never go down, and its gauges are dropped.
+    """
+
+    def __init__(self, directory: str | None):
+        self.directory = Path(directory) if directory else None
+        self._task: asyncio.Task | None = None
+
+    @property
+    def _path(self) -> Path:
+        return self.directory / f"metrics-{os.getpid()}.json"
+
+    def _write(self, families: list[dict]) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        temporary = self._path.with_suffix(".tmp")
+        temporary.write_text(json.dumps(families))
+        # atomic, readers never see a partly written file
+        os.replace(temporary, self._path)
+
+    @property
+    def _retired_path(self) -> Path:
+        return self.directory / "retired.json"
+
+    def _read_retired(self) -> list[dict]:
+        try:
+            return json.loads(self._retired_path.read_text())
+        except (OSError, ValueError):
+            return []
+
+    def _retire(self, path: Path) -> None:
+        # under a lock, a file is retired once however many processes see it
+        with open(self.directory / "retired.lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                families = json.loads(path.read_text())
+            except FileNotFoundError:
+                return
+            except ValueError:
+                families = []
+            totals = [metric for metric in families if metric["type"] != "gauge"]
+            retired = merge_families([self._read_retired(), totals])
+            temporary = self._retired_path.with_suffix(".tmp")
+            temporary.write_text(json.dumps(retired))
+            os.replace(temporary, self._retired_path)
+            path.unlink()
+
+    def _read_all(self) -> list[list[dict]]:
+        snapshots = []
+        stale = time.time() - config.METRICS_STALE_SECONDS
+        for path in self.directory.glob("metrics-*.json"):
+            try:
+                if path.stat().st_mtime < stale:
+                    # a process that is gone
+                    self._retire(path)
+                    continue
+                snapshots.append(json.loads(path.read_text()))
+            except (OSError, ValueError):
+                continue
+        # read last: it has the files retired meanwhile by other processes
+        snapshots.append(self._read_retired())
+        return snapshots
+
+    def _exchange(self, families: list[dict]) -> list[dict]:
+        self._write(families)
+        return merge_families(self._read_all())
+
+    async def render(self) -> str:
+        # collected on the event loop, the counters are not thread safe;
+        # only the file I/O goes to a thread
+        families = collect()
+        if self.directory is not None:
+            families = await asyncio.to_thread(self._exchange, families)
+        return render_prometheus([*families, _hit_ratio(families)])
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(config.METRICS_FLUSH_INTERVAL)
+            try:
+                await asyncio.to_thread(self._write, collect())
+            except OSError:
+                logger.exception("Writing metrics failed")
+
+    def start(self) -> None:
+        if self.directory is not None and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def _write_and_retire(self, families: list[dict]) -> None:
+        self._write(families)
+        self._retire(self._path)
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+            try:
+                await asyncio.to_thread(self._write_and_retire, collect())
+            except OSError:
+                logger.exception("Retiring metrics failed")
+
+
+metrics_exporter = MetricsExporter(config.METRICS_DIR)
@@ -0,0 +1,49 @@
+import base64
+import binascii
+import json
+from datetime import datetime, timedelta
+
+from fastapi import HTTPException, status
+
+from src.conf import messages
+from src.conf.config import config
+
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+
+
+# naive datetimes as integers, they survive JSON without losing precision
+def to_micros(value: datetime) -> int:
+    return (value - EPOCH) // MICROSECOND
+
+
+def from_micros(value: int) -> datetime:
+    return EPOCH + value * MICROSECOND
+
+
+def encode_cursor(values: list) -> str:
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, types: tuple[type, ...]) -> tuple:
+    invalid_cursor = HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST, detail=messages.INVALID_CURSOR
+    )
+
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (binascii.Error, ValueError):
+        raise invalid_cursor
+
+    if not isinstance(values, list) or len(values) != len(types):
+        raise invalid_cursor
+    if not all(type(value) is type_ for value, type_ in zip(values, types)):
+        raise invalid_cursor
+    return tuple(values)
+
+
+def clamp_limit(limit: int) -> int:
+    # any limit used to be accepted, so out of range ones are not rejected
+    return max(1, min(limit, config.PAGE_MAX_LIMIT))
@@ -0,0 +1,85 @@
+import json
+import logging
+import time
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from src.conf.config import config
+from src.database.db import QueryStats, current_query_stats
+from src.services.tracing import current_span
+
+logger = logging.getLogger(__name__)
+
+
+def server_timing(stats: QueryStats, elapsed: float) -> str:
+    return (
+        f'db;dur={stats.duration * 1000:.2f};desc="{stats.count} queries", '
+        f"app;dur={elapsed * 1000:.2f}"
+    )
+
+
+class QueryStatsMiddleware:
+    """Attributes SQL statements to HTTP requests.
+
+    Adds a Server-Timing header and logs a structured line per request,
+    as a warning when the request sent more than DB_QUERY_COUNT_WARN
+    statements.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = QueryStats()
+        token = current_query_stats.set(stats)
+        start = time.perf_counter()
+        status_code = 500
+
+        async def send_with_timing(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if config.SERVER_TIMING_HEADER:
+                    value = server_timing(stats, time.perf_counter() - start)
+                    message["headers"] = [
+                        *message.get("headers", []),
+                        (b"server-timing", value.encode()),
+                    ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            current_query_stats.reset(token)
+            self._log(scope, status_code, stats, time.perf_counter() - start)
+
+    @staticmethod
+    def _log(scope: Scope, status_code: int, stats: QueryStats, elapsed: float):
+        level = logging.INFO
+        if stats.count > config.DB_QUERY_COUNT_WARN:
+            level = logging.WARNING
+        if not logger.isEnabledFor(level):
+            return
+        record = {
+            "method": scope["method"],
+            "path": scope["path"],
+            "status": status_code,
+            "duration_ms": round(elapsed * 1000, 2),
+            "db_queries": stats.count,
+            "db_time_ms": round(stats.duration * 1000, 2),
+            "db_slowest_ms": round(stats.slowest * 1000, 2),
+            "db_slowest_statement": (
+                " ".join(stats.slowest_statement.split())[:300]
+                if stats.slowest_statement
+                else None
+            ),
+        }
+        span = current_span.get()
+        if span is not None:
+            # to find the trace of a slow request from its log line
+            record["trace_id"] = span.trace_id
+        logger.log(level, json.dumps(record))
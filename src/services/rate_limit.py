@@ -0,0 +1,236 @@
+import json
+import logging
+import math
+import time
+from dataclasses import dataclass
+
+from jose import JWTError
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.routing import compile_path
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from src.conf import messages
+from src.conf.config import config
+from src.database.db import sessionmanager
+from src.repository.rate_limits import RateLimitRepository
+from src.services.tokens import token_verifier
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+
+@dataclass(frozen=True)
+class Rule:
+    capacity: int
+    period: int
+
+    @classmethod
+    def parse(cls, spec: str) -> "Rule":
+        # "10/minute"
+        count, period = spec.split("/")
+        return cls(int(count), PERIODS[period.strip()])
+
+    @property
+    def rate(self) -> float:
+        # tokens per second
+        return self.capacity / self.period
+
+
+@dataclass
+class Decision:
+    allowed: bool
+    tokens: float
+
+
+class DatabaseRateLimitBackend:
+    """Token buckets shared by all the workers, in the database.
+
+    One upsert on the primary per request of a limited route; RATE_LIMIT_URL
+    moves them to redis. The clocks of the app hosts are expected in sync.
+    """
+
+    async def take(self, key: str, rule: Rule) -> Decision:
+        async with sessionmanager.session() as db:
+            allowed, tokens = await RateLimitRepository(db).take(
+                key, rule.capacity, rule.rate, time.time()
+            )
+        return Decision(allowed, tokens)
+
+
+async def prune_rate_limit_buckets(db: AsyncSession) -> None:
+    await RateLimitRepository(db).delete_full(time.time())
+
+
+# refill and take in one round trip, atomic for all the workers;
+# the clock of the redis server is shared by all of them as well
+TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(now - ts, 0) * rate)
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate))
+return {allowed, tostring(tokens)}
+"""
+
+
+class RedisRateLimitBackend:
+    """Token buckets shared by all the workers, any redis.asyncio client."""
+
+    def __init__(self, client):
+        self.client = client
+        self._script = client.register_script(TOKEN_BUCKET_SCRIPT)
+
+    async def take(self, key: str, rule: Rule) -> Decision:
+        allowed, tokens = await self._script(
+            keys=[key], args=[rule.capacity, rule.rate]
+        )
+        return Decision(bool(allowed), float(tokens))
+
+
+def create_rate_limit_backend(url: str | None = None):
+    if not url:
+        return DatabaseRateLimitBackend()
+
+    # redis is an optional dependency, only needed for the shared backend
+    import redis.asyncio as redis
+
+    return RedisRateLimitBackend(redis.from_url(url, decode_responses=True))
+
+
+def client_identity(scope: Scope) -> str:
+    """The user of a valid bearer token, the client address otherwise."""
+    headers = dict(scope["headers"])
+    authorization = headers.get(b"authorization", b"").decode("latin-1")
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() == "bearer" and token:
+        try:
+            # cached, the route's own verification finds it there
+            payload = token_verifier.decode(token)
+            if payload.get("sub"):
+                return f"user:{payload['sub']}"
+        except JWTError:
+            pass
+
+    if config.RATE_LIMIT_TRUST_FORWARDED and b"x-forwarded-for" in headers:
+        forwarded = headers[b"x-forwarded-for"].decode("latin-1")
+        return f"ip:{forwarded.split(',')[0].strip()}"
+    client = scope.get("client")
+    return f"ip:{client[0] if client else 'unknown'}"
+
+
+class RateLimitMiddleware:
+    """Token-bucket rate limiting per route and user (or client address).
+
+    Rules are keyed by "METHOD /path", the path may be a route template
+    such as /api/contacts/{contact_id}; an exact path is matched first, then
+    the templates in the order of the rules. Routes without a rule fall back
+    to the default one, if any.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        backend=None,
+        rules: dict[str, str] | None = None,
+        default: str | None = None,
+    ):
+        self.app = app
+        self.backend = backend or create_rate_limit_backend(config.RATE_LIMIT_URL)
+        self.rules = {
+            route: Rule.parse(spec)
+            for route, spec in (config.RATE_LIMITS if rules is None else rules).items()
+        }
+        self.templates = []
+        for route in self.rules:
+            method, _, path = route.partition(" ")
+            if "{" in path:
+                self.templates.append((method, compile_path(path)[0], route))
+        default = config.RATE_LIMIT_DEFAULT if default is None else default
+        self.default = Rule.parse(default) if default else None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        route = self._match(scope["method"], scope["path"])
+        rule = self.rules[route] if route else self.default
+        if rule is None:
+            await self.app(scope, receive, send)
+            return
+
+        # routes with their own rule have their own buckets
+        bucket = route or "default"
+        key = f"ratelimit:{bucket}:{client_identity(scope)}"
+        try:
+            decision = await self.backend.take(key, rule)
+        except Exception:
+            # the limiter being down must not take the API down with it
+            logger.exception("Rate limit backend failed")
+            await self.app(scope, receive, send)
+            return
+
+        headers = self._headers(rule, decision)
+        if not decision.allowed:
+            retry_after = math.ceil((1 - decision.tokens) / rule.rate)
+            await self._reject(send, headers + [(b"retry-after", str(retry_after))])
+            return
+
+        async def send_with_headers(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                message["headers"] = [
+                    *message.get("headers", []),
+                    *((name, value.encode()) for name, value in headers),
+                ]
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
+
+    def _match(self, method: str, path: str) -> str | None:
+        """The rule key of the request, None without a rule."""
+        route = f"{method} {path}"
+        if route in self.rules:
+            return route
+        for rule_method, regex, route in self.templates:
+            if rule_method == method and regex.match(path):
+                return route
+        return None
+
+    @staticmethod
+    def _headers(rule: Rule, decision: Decision) -> list[tuple[bytes, str]]:
+        remaining = math.floor(decision.tokens)
+        # seconds until the bucket is full again
+        reset = math.ceil((rule.capacity - decision.tokens) / rule.rate)
+        return [
+            (b"ratelimit-limit", str(rule.capacity)),
+            (b"ratelimit-remaining", str(remaining)),
+            (b"ratelimit-reset", str(reset)),
+            (b"ratelimit-policy", f"{rule.capacity};w={rule.period}"),
+        ]
+
+    @staticmethod
+    async def _reject(send: Send, headers: list[tuple[bytes, str]]) -> None:
+        body = json.dumps({"error": messages.EXCEED_REQUESTS_LIMIT}).encode()
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 429,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    *((name, value.encode()) for name, value in headers),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,65 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.conf.config import config
+from src.database.db import sessionmanager
+from src.services.tracing import current_span, tracer
+
+logger = logging.getLogger(__name__)
+
+Job = Callable[[AsyncSession], Awaitable[None]]
+
+
+class Scheduler:
+    """Runs periodic maintenance jobs in the application process.
+
+    Every job gets its own session; a failing run is logged and retried
+    on the next interval.
+    """
+
+    def __init__(self):
+        self._jobs: list[tuple[str, float, Job]] = []
+        self._tasks: list[asyncio.Task] = []
+
+    def add_job(self, name: str, interval: float, job: Job) -> None:
+        self._jobs.append((name, interval, job))
+
+    async def run_job(self, name: str, job: Job) -> None:
+        span = tracer.start_root(f"job {name}") if config.TRACING_ENABLED else None
+        token = current_span.set(span)
+        try:
+            async with sessionmanager.session() as db:
+                await job(db)
+        except Exception as e:
+            if span is not None:
+                span.set_error(e)
+            logger.exception("Scheduled job %s failed", name)
+        finally:
+            current_span.reset(token)
+            if span is not None:
+                tracer.end(span)
+
+    async def _run_periodically(self, name: str, interval: float, job: Job) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            await self.run_job(name, job)
+
+    def start(self) -> None:
+        if self._tasks:
+            return
+        for name, interval, job in self._jobs:
+            self._tasks.append(
+                asyncio.create_task(self._run_periodically(name, interval, job))
+            )
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+
+scheduler = Scheduler()
@@ -0,0 +1,110 @@
+import hashlib
+import logging
+import uuid
+from datetime import timedelta
+
+from fastapi import HTTPException, Request, status
+from jose import JWTError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.conf import messages
+from src.conf.config import config
+from src.database.models import User
+from src.repository.emails import utcnow
+from src.repository.sessions import UserSessionRepository
+from src.services.auth import create_access_token, create_refresh_token
+from src.services.tokens import keyring, revocation_list
+from src.services.tracing import traced
+
+logger = logging.getLogger(__name__)
+
+
+def hash_token_id(jti: str) -> str:
+    return hashlib.sha256(jti.encode()).hexdigest()
+
+
+def device_name(request: Request) -> str | None:
+    user_agent = request.headers.get("user-agent")
+    return user_agent[:255] if user_agent else None
+
+
+def _invalid_refresh_token():
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail=messages.INVALID_REFRESH_TOKEN,
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+
+@traced
+class SessionService:
+    """Sessions of the signed-in devices, one row per device.
+
+    Tokens carry the id of their session (sid). A refresh token is good
+    for one use: refreshing replaces it, and presenting a replaced one
+    means it leaked, so the whole session is ended.
+    """
+
+    def __init__(self, db: AsyncSession):
+        self.repository = UserSessionRepository(db)
+
+    @staticmethod
+    def _expires_at():
+        return utcnow() + timedelta(seconds=config.JWT_REFRESH_EXPIRATION_SECONDS)
+
+    @staticmethod
+    async def _tokens(username: str, session_id: int, jti: str) -> dict:
+        access_token = await create_access_token(
+            data={"sub": username, "sid": session_id}
+        )
+        refresh_token = await create_refresh_token(
+            data={"sub": username, "sid": session_id, "jti": jti}
+        )
+        return {
+            "access_token": access_token,
+            "refresh_token": refresh_token,
+            "token_type": "bearer",
+        }
+
+    async def sign_in(self, user: User, device: str | None) -> dict:
+        jti = uuid.uuid4().hex
+        user_session = await self.repository.create_session(
+            user.id, hash_token_id(jti), device, self._expires_at()
+        )
+        return await self._tokens(user.username, user_session.id, jti)
+
+    async def refresh(self, refresh_token: str, device: str | None) -> dict:
+        try:
+            claims = keyring.decode(refresh_token)
+        except JWTError:
+            raise _invalid_refresh_token()
+        if claims.get("token_type") != "refresh" or not all(
+            claims.get(claim) for claim in ("sub", "sid", "jti")
+        ):
+            raise _invalid_refresh_token()
+
+        session_id, jti = claims["sid"], uuid.uuid4().hex
+        rotated = await self.repository.rotate(
+            session_id,
+            hash_token_id(claims["jti"]),
+            hash_token_id(jti),
+            device,
+            self._expires_at(),
+        )
+        if not rotated:
+            # a replaced token (or the session expired): end the session,
+            # whoever holds its current refresh token has to sign in again
+            if await self.repository.delete_session(session_id):
+                logger.warning("Refresh token reused, session %s ended", session_id)
+            raise _invalid_refresh_token()
+        return await self._tokens(claims["sub"], session_id, jti)
+
+    async def sign_out(self, claims: dict) -> None:
+        # the access token stops working at once, the session with it
+        await revocation_list.revoke(claims)
+        if claims.get("sid"):
+            await self.repository.delete_session(claims["sid"])
+
+
+async def prune_expired_sessions(db: AsyncSession) -> None:
+    await UserSessionRepository(db).delete_expired(utcnow())
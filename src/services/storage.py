@@ -0,0 +1,56 @@
+import asyncio
+import shutil
+from pathlib import Path
+
+import cloudinary
+import cloudinary.uploader
+
+from src.conf.config import config
+
+
+class CloudinaryStorage:
+    def __init__(self, cloud_name: str, api_key: int, api_secret: str):
+        # global client configuration, done once per process
+        cloudinary.config(
+            cloud_name=cloud_name,
+            api_key=api_key,
+            api_secret=api_secret,
+            secure=True,
+        )
+
+    async def save(self, path: Path, key: str) -> str:
+        public_id = f"ContactsAPI/{Path(key).with_suffix('')}"
+        # the client is synchronous, keep it off the event loop
+        result = await asyncio.to_thread(
+            cloudinary.uploader.upload, str(path), public_id=public_id, overwrite=False
+        )
+        return cloudinary.CloudinaryImage(public_id).build_url(
+            width=config.AVATAR_SIZE,
+            height=config.AVATAR_SIZE,
+            crop="fill",
+            version=result.get("version"),
+        )
+
+
+class LocalStorage:
+    """Files in a local directory, served by the app under base_url."""
+
+    def __init__(self, root: str, base_url: str):
+        self.root = Path(root)
+        self.base_url = base_url
+
+    def _copy(self, path: Path, target: Path) -> None:
+        target.parent.mkdir(parents=True, exist_ok=True)
+        # keys are content hashes, an existing file has the same content
+        if not target.exists():
+            shutil.copyfile(path, target)
+
+    async def save(self, path: Path, key: str) -> str:
+        await asyncio.to_thread(self._copy, path, self.root / key)
+        return f"{self.base_url}{key}"
+
+
+def create_storage() -> CloudinaryStorage | LocalStorage:
+    if config.AVATAR_STORAGE == "local":
+        return LocalStorage(config.AVATAR_LOCAL_DIR, config.AVATAR_LOCAL_URL)
+    return CloudinaryStorage(config.CLD_NAME, config.CLD_API_KEY, config.CLD_API_SECRET)
@@ -0,0 +1,214 @@
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from jose import jwk, jwt
+from jose.exceptions import ExpiredSignatureError, JWTError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.conf.config import config
+from src.database.db import sessionmanager
+from src.repository.emails import utcnow
+from src.repository.revocations import RevokedTokenRepository
+from src.services.cache import cache_backend
+
+ASYMMETRIC_PREFIXES = ("RS", "PS", "ES")
+
+
+def _read_key(value: str) -> str:
+    # a PEM key may be given inline or as the path of a .pem file
+    if value.endswith(".pem"):
+        return Path(value).read_text()
+    return value
+
+
+class Keyring:
+    """The signing key of the tokens and their verification keys, by kid.
+
+    Rotation without logging anyone out: add the new key to
+    JWT_VERIFICATION_KEYS on every instance first, then make it the
+    JWT_KEY_ID; the old one is removed once the tokens it signed expired.
+    Tokens without a kid, issued before keys had ids, are checked against
+    JWT_SECRET; without a JWT_KEY_ID they are signed without a kid, and
+    checked with the signing key.
+    """
+
+    def __init__(
+        self,
+        algorithm: str,
+        secret: str,
+        key_id: str | None = None,
+        signing_key: str | None = None,
+        verification_keys: dict[str, str] | None = None,
+    ):
+        self.algorithm = algorithm
+        self.key_id = key_id
+        asymmetric = algorithm.startswith(ASYMMETRIC_PREFIXES)
+        signing_key = _read_key(signing_key) if signing_key else secret
+        keys = {kid: _read_key(key) for kid, key in (verification_keys or {}).items()}
+
+        # parsed once, python-jose would parse them again for every token
+        self._signing_key = jwk.construct(signing_key, algorithm)
+        self._keys = {kid: jwk.construct(key, algorithm) for kid, key in keys.items()}
+        # checks the tokens signed here, the public half for RS, PS and ES
+        own_key = self._signing_key.public_key() if asymmetric else self._signing_key
+        if key_id:
+            self._keys.setdefault(key_id, own_key)
+        if key_id and not asymmetric:
+            self._legacy_key = jwk.construct(secret, algorithm)
+        else:
+            self._legacy_key = own_key
+
+    def sign(self, claims: dict) -> str:
+        headers = {"kid": self.key_id} if self.key_id else None
+        return jwt.encode(
+            claims, self._signing_key, algorithm=self.algorithm, headers=headers
+        )
+
+    def decode(self, token: str) -> dict:
+        kid = jwt.get_unverified_header(token).get("kid")
+        key = self._legacy_key if kid is None else self._keys.get(kid)
+        if key is None:
+            raise JWTError("Unknown signing key")
+        return jwt.decode(token, key, algorithms=[self.algorithm])
+
+
+keyring = Keyring(
+    config.JWT_ALGORITHM,
+    config.JWT_SECRET,
+    config.JWT_KEY_ID,
+    config.JWT_SIGNING_KEY,
+    config.JWT_VERIFICATION_KEYS,
+)
+
+
+class TokenVerifier:
+    """Decodes access tokens, the claims of the recently seen ones are kept.
+
+    A bounded LRU keyed by the digest of the token: a token seen before
+    costs a hash and a dict lookup instead of a signature check, until
+    its exp. Revocation is not cached, see RevocationList.
+    """
+
+    def __init__(self, keyring: Keyring, max_size: int):
+        self.keyring = keyring
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._verified: OrderedDict[bytes, dict] = OrderedDict()
+
+    def decode(self, token: str) -> dict:
+        digest = hashlib.sha256(token.encode()).digest()
+        claims = self._verified.get(digest)
+        if claims is not None:
+            if claims.get("exp", float("inf")) > time.time():
+                self.hits += 1
+                self._verified.move_to_end(digest)
+                return claims
+            del self._verified[digest]
+            raise ExpiredSignatureError("Signature has expired.")
+
+        self.misses += 1
+        claims = self.keyring.decode(token)
+        self._verified[digest] = claims
+        if len(self._verified) > self.max_size:
+            self._verified.popitem(last=False)
+        return claims
+
+
+token_verifier = TokenVerifier(keyring, config.JWT_VERIFY_CACHE_SIZE)
+
+
+class RevocationList:
+    """Ids (jti) of revoked tokens, until the tokens expire on their own."""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    @staticmethod
+    def _key(jti: str) -> str:
+        return f"revoked:{jti}"
+
+    async def revoke(self, claims: dict) -> None:
+        jti, exp = claims.get("jti"), claims.get("exp")
+        if jti is None or exp is None:
+            return
+        ttl = exp - time.time()
+        if ttl > 0:
+            await self.backend.set(self._key(jti), 1, ttl)
+
+    async def is_revoked(self, claims: dict) -> bool:
+        jti = claims.get("jti")
+        if jti is None:
+            return False
+        return await self.backend.get(self._key(jti)) is not None
+
+
+class DatabaseRevocationBackend:
+    """Revoked token ids in the database, shared by all the workers.
+
+    Every process keeps them in memory and reads the ones revoked since its
+    last read at most every sync_interval seconds, so a logout reaches the
+    other workers within that time. The reads overlap, a revocation that
+    commits late is not missed. Only hashes of the keys are stored.
+    """
+
+    overlap = timedelta(seconds=5)
+
+    def __init__(self, sync_interval: float):
+        self.sync_interval = sync_interval
+        self._revoked: dict[str, datetime] = {}
+        self._synced_at: datetime | None = None
+        self._next_sync = 0.0
+        self._lock = asyncio.Lock()
+
+    @staticmethod
+    def _hash(key: str) -> str:
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    async def _sync(self) -> None:
+        async with self._lock:
+            if time.monotonic() < self._next_sync:
+                return
+            now = utcnow()
+            since = self._synced_at - self.overlap if self._synced_at else None
+            async with sessionmanager.session() as db:
+                revoked = await RevokedTokenRepository(db).get_revoked(now, since)
+            self._revoked = {
+                token_hash: expires_at
+                for token_hash, expires_at in self._revoked.items()
+                if expires_at > now
+            }
+            self._revoked.update(revoked)
+            self._synced_at = now
+            self._next_sync = time.monotonic() + self.sync_interval
+
+    async def get(self, key: str):
+        if time.monotonic() >= self._next_sync:
+            await self._sync()
+        expires_at = self._revoked.get(self._hash(key))
+        return 1 if expires_at is not None and expires_at > utcnow() else None
+
+    async def set(self, key: str, value, ttl: float) -> None:
+        token_hash = self._hash(key)
+        expires_at = utcnow() + timedelta(seconds=ttl)
+        async with sessionmanager.session() as db:
+            await RevokedTokenRepository(db).add(token_hash, expires_at)
+        self._revoked[token_hash] = expires_at
+
+
+def create_revocation_backend():
+    if config.CACHE_URL:
+        # shared with the other workers, as the user cache
+        return cache_backend
+    return DatabaseRevocationBackend(config.JWT_REVOCATION_SYNC_SECONDS)
+
+
+async def prune_revoked_tokens(db: AsyncSession) -> None:
+    await RevokedTokenRepository(db).delete_expired(utcnow())
+
+
+revocation_list = RevocationList(create_revocation_backend())
@@ -0,0 +1,358 @@
+import asyncio
+import contextlib
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import os
+import random
+import time
+from dataclasses import dataclass, field
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from src.conf.config import config
+
+logger = logging.getLogger(__name__)
+
+# span kinds of the OTLP data model
+INTERNAL = 1
+SERVER = 2
+CLIENT = 3
+
+# status codes of the OTLP data model
+STATUS_UNSET = 0
+STATUS_ERROR = 2
+
+
+@dataclass(slots=True)
+class Span:
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: str | None = None
+    kind: int = INTERNAL
+    start: int = field(default_factory=time.time_ns)
+    end: int | None = None
+    attributes: dict = field(default_factory=dict)
+    status: int = STATUS_UNSET
+    message: str | None = None
+
+    def set_error(self, error: BaseException) -> None:
+        self.status = STATUS_ERROR
+        self.message = repr(error)[:300]
+
+    def to_otlp(self) -> dict:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start),
+            "endTimeUnixNano": str(self.end),
+            "attributes": [
+                _attribute(key, value) for key, value in self.attributes.items()
+            ],
+            "status": {"code": self.status},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        if self.message:
+            span["status"]["message"] = self.message
+        return span
+
+
+def _attribute(key: str, value) -> dict:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+# the span of the running request or job, None when it isn't sampled
+current_span: contextvars.ContextVar[Span | None] = contextvars.ContextVar(
+    "current_span", default=None
+)
+
+
+def parse_traceparent(header: str) -> tuple[str, str, bool] | None:
+    """trace id, parent span id and sampled flag of a W3C traceparent."""
+    parts = header.strip().split("-")
+    if len(parts) < 4 or len(parts[0]) != 2 or parts[0] == "ff":
+        return None
+    _, trace_id, parent_id, flags = parts[:4]
+    if len(trace_id) != 32 or len(parent_id) != 16 or len(flags) != 2:
+        return None
+    try:
+        sampled = bool(int(flags, 16) & 1)
+        int(trace_id, 16), int(parent_id, 16)
+    except ValueError:
+        return None
+    if trace_id == "0" * 32 or parent_id == "0" * 16:
+        return None
+    return trace_id, parent_id, sampled
+
+
+class MemorySpanExporter:
+    """Keeps exported spans in memory, a stand-in for the collector in tests."""
+
+    def __init__(self):
+        self.spans: list[dict] = []
+
+    def export(self, spans: list[dict]) -> None:
+        self.spans.extend(spans)
+
+
+class FileSpanExporter:
+    """Appends a line of OTLP/JSON per batch, as the collector's file exporter.
+
+    The file can be replayed into a collector with its otlpjsonfile receiver.
+    """
+
+    def __init__(self, path: str, service_name: str):
+        self.path = path
+        self.resource = {
+            "attributes": [
+                _attribute("service.name", service_name),
+                _attribute("process.pid", os.getpid()),
+            ]
+        }
+
+    def export(self, spans: list[dict]) -> None:
+        line = {
+            "resourceSpans": [
+                {
+                    "resource": self.resource,
+                    "scopeSpans": [{"scope": {"name": __name__}, "spans": spans}],
+                }
+            ]
+        }
+        with open(self.path, "a") as file:
+            file.write(json.dumps(line) + "\n")
+
+
+def create_exporter() -> MemorySpanExporter | FileSpanExporter:
+    if config.TRACING_EXPORTER == "memory":
+        return MemorySpanExporter()
+    return FileSpanExporter(config.TRACING_FILE, config.TRACING_SERVICE_NAME)
+
+
+class Tracer:
+    """Creates spans and exports the finished ones in batches.
+
+    Only sampled traces create spans at all: code running outside of one
+    sees no current span and skips tracing with a single lookup.
+    """
+
+    def __init__(self, exporter, sample_ratio: float, max_queue: int):
+        self.exporter = exporter
+        self.sample_ratio = sample_ratio
+        self.max_queue = max_queue
+        self.exported = 0
+        self.dropped = 0
+        self._queue: list[Span] = []
+        self._task: asyncio.Task | None = None
+
+    def should_sample(self, trace_id: str) -> bool:
+        # ratio based on the trace id, so that every service of a trace
+        # configured with the same ratio takes the same decision
+        return int(trace_id[16:], 16) < self.sample_ratio * 2**64
+
+    def start_root(
+        self, name: str, kind: int = INTERNAL, traceparent: str | None = None
+    ) -> Span | None:
+        """A span of a new trace, or of the caller's one; None if not sampled."""
+        parent = parse_traceparent(traceparent) if traceparent else None
+        if parent is not None:
+            trace_id, parent_id, sampled = parent
+        else:
+            trace_id, parent_id = f"{random.getrandbits(128):032x}", None
+            sampled = self.should_sample(trace_id)
+        if not sampled:
+            return None
+        return Span(name, trace_id, f"{random.getrandbits(64):016x}", parent_id, kind)
+
+    def start_child(self, parent: Span, name: str, kind: int = INTERNAL) -> Span:
+        return Span(
+            name,
+            parent.trace_id,
+            f"{random.getrandbits(64):016x}",
+            parent.span_id,
+            kind,
+        )
+
+    def end(self, span: Span) -> None:
+        span.end = time.time_ns()
+        if len(self._queue) >= self.max_queue:
+            # the exporter can't keep up, tracing must not eat the memory
+            self.dropped += 1
+            return
+        self._queue.append(span)
+
+    @contextlib.contextmanager
+    def span(self, name: str, kind: int = INTERNAL, **attributes):
+        """A child of the current span, nothing when there is none."""
+        parent = current_span.get()
+        if parent is None:
+            yield None
+            return
+        span = self.start_child(parent, name, kind)
+        span.attributes.update(attributes)
+        token = current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.set_error(e)
+            raise
+        finally:
+            current_span.reset(token)
+            self.end(span)
+
+    def _export(self, spans: list[Span]) -> None:
+        self.exporter.export([span.to_otlp() for span in spans])
+
+    async def flush(self) -> None:
+        spans, self._queue = self._queue, []
+        if not spans:
+            return
+        try:
+            await asyncio.to_thread(self._export, spans)
+            self.exported += len(spans)
+        except Exception:
+            self.dropped += len(spans)
+            logger.exception("Exporting %d spans failed", len(spans))
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(config.TRACING_FLUSH_INTERVAL)
+            await self.flush()
+
+    def start(self) -> None:
+        if config.TRACING_ENABLED and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "queued": len(self._queue),
+            "exported": self.exported,
+            "dropped": self.dropped,
+        }
+
+
+tracer = Tracer(
+    create_exporter(), config.TRACING_SAMPLE_RATIO, config.TRACING_MAX_QUEUE
+)
+
+
+def trace_function(func, name: str | None = None):
+    """Wraps a coroutine function in a span, a child of the current one."""
+    name = name or func.__qualname__
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        parent = current_span.get()
+        if parent is None:
+            return await func(*args, **kwargs)
+        span = tracer.start_child(parent, name)
+        token = current_span.set(span)
+        try:
+            return await func(*args, **kwargs)
+        except BaseException as e:
+            span.set_error(e)
+            raise
+        finally:
+            current_span.reset(token)
+            tracer.end(span)
+
+    return wrapper
+
+
+def traced(target):
+    """Traces a coroutine function, or the public coroutine methods of a class.
+
+    Applied when the module is imported: with TRACING_ENABLED off the
+    target is returned as it is and tracing costs nothing at all.
+    """
+    if not config.TRACING_ENABLED:
+        return target
+    if not inspect.isclass(target):
+        return trace_function(target)
+    for attribute, value in list(vars(target).items()):
+        if not attribute.startswith("_") and inspect.iscoroutinefunction(value):
+            setattr(target, attribute, trace_function(value))
+    return target
+
+
+def start_sql_span(statement: str, dialect: str) -> Span | None:
+    parent = current_span.get()
+    if parent is None:
+        return None
+    # "SELECT", "INSERT"... low cardinality, the statement is an attribute
+    operation = statement.lstrip().split(None, 1)[0].upper() if statement else "SQL"
+    span = tracer.start_child(parent, operation, CLIENT)
+    span.attributes["db.system"] = dialect
+    span.attributes["db.statement"] = " ".join(statement.split())[:1000]
+    return span
+
+
+class TracingMiddleware:
+    """Server span of every sampled request, named after its route template.
+
+    Honours the sampling decision of a W3C traceparent sent by the caller.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not config.TRACING_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        traceparent = dict(scope["headers"]).get(b"traceparent")
+        span = tracer.start_root(
+            scope["method"],
+            SERVER,
+            traceparent.decode("latin-1") if traceparent else None,
+        )
+        if span is None:
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        token = current_span.set(span)
+        try:
+            await self.app(scope, receive, send_with_status)
+        except BaseException as e:
+            span.set_error(e)
+            raise
+        finally:
+            current_span.reset(token)
+            route = getattr(scope.get("route"), "path", None)
+            if route:
+                span.name = f"{scope['method']} {route}"
+                span.attributes["http.route"] = route
+            span.attributes["http.request.method"] = scope["method"]
+            span.attributes["url.path"] = scope["path"]
+            span.attributes["http.response.status_code"] = status_code
+            if status_code >= 500:
+                span.status = STATUS_ERROR
+            tracer.end(span)
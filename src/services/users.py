@@ -1,10 +1,38 @@
+from fastapi import HTTPException, status
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.exc import IntegrityError
 from libgravatar import Gravatar
 
+from src.conf import messages
 from src.repository.users import UserRepository
 from src.schemas import UserCreate
+from src.services.cache import user_cache
+from src.services.tracing import traced
 
+# the unique constraints of users.email and users.username; named by
+# PostgreSQL, SQLite reports the columns instead
+USER_UNIQUE_CONSTRAINTS = (
+    "users_email_key",
+    "users_username_key",
+    "users.email",
+    "users.username",
+)
 
+
+def _handle_integrity_error(e: IntegrityError):
+    if any(name in str(e.orig) for name in USER_UNIQUE_CONSTRAINTS):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=messages.USER_EMAIL_OR_NAME_ALREADY_EXISTS,
+        )
+    else:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=messages.INTEGRITY_ERROR,
+        )
+
+
+@traced
 class UserService:
     def __init__(self, db: AsyncSession):
         self.repository = UserRepository(db)
@@ -16,19 +44,28 @@ class UserService:
             avatar = g.get_image()
         except Exception:
             pass
-        return await self.repository.create_user(body, avatar)
+        # no lookups first: the unique constraints reject duplicates,
+        # concurrent registrations included
+        try:
+            return await self.repository.create_user(body, avatar)
+        except IntegrityError as e:
+            await self.repository.db.rollback()
+            _handle_integrity_error(e)
 
     async def get_user_by_id(self, user_id: int):
         return await self.repository.get_user_by_id(user_id)
 
-    async def get_user_by_username(self, username: str, refresh_token: str = None):
-        return await self.repository.get_user_by_username(username, refresh_token)
+    async def get_user_by_username(self, username: str):
+        return await self.repository.get_user_by_username(username)
 
     async def get_user_by_email(self, email: str):
         return await self.repository.get_user_by_email(email)
 
     async def confirmed_email(self, email: str) -> None:
-        return await self.repository.confirmed_email(email)
-    
+        user = await self.repository.confirmed_email(email)
+        await user_cache.invalidate(user.username)
+
     async def update_avatar_url(self, email: str, url: str):
-        return await self.repository.update_avatar_url(email, url)
+        user = await self.repository.update_avatar_url(email, url)
+        await user_cache.invalidate(user.username)
+        return user
@@ -0,0 +1,74 @@
+import os
+import tempfile
+import uuid
+
+import pytest
+
+# the settings are read when the app is imported
+DB_PATH = os.path.join(tempfile.mkdtemp(), "test.db")
+os.environ.update(
+    DB_URL=f"sqlite+aiosqlite:///{DB_PATH}",
+    DB_POOL_PRE_PING="false",
+    JWT_SECRET="test-secret",
+    MAIL_USERNAME="test@example.com",
+    MAIL_PASSWORD="test",
+    MAIL_FROM="test@example.com",
+    MAIL_SERVER="localhost",
+    EMAIL_TRANSPORT="memory",
+    CLD_NAME="test",
+    AVATAR_STORAGE="local",
+    BCRYPT_ROUNDS="4",
+    RATE_LIMITS="{}",
+)
+
+import httpx
+from sqlalchemy import update
+
+from main import app
+from src.database.db import sessionmanager
+from src.database.models import Base, User
+
+
+@pytest.fixture(scope="session")
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture(scope="session")
+async def database():
+    async with sessionmanager._engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+    yield
+    await sessionmanager.close()
+
+
+@pytest.fixture
+async def client(database):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        yield client
+
+
+@pytest.fixture
+async def credentials(client):
+    """A registered user with a confirmed email, a new one for every test."""
+    username = f"user{uuid.uuid4().hex[:8]}"
+    credentials = {"username": username, "password": "password1"}
+    response = await client.post(
+        "/api/auth/register",
+        json={**credentials, "email": f"{username}@example.com"},
+    )
+    assert response.status_code == 201
+    async with sessionmanager.session() as db:
+        await db.execute(
+            update(User).where(User.username == username).values(confirmed=True)
+        )
+        await db.commit()
+    return credentials
+
+
+@pytest.fixture
+async def tokens(client, credentials):
+    response = await client.post("/api/auth/login", data=credentials)
+    assert response.status_code == 200
+    return response.json()
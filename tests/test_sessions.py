@@ -0,0 +1,58 @@
+import asyncio
+
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+def bearer(tokens: dict) -> dict:
+    return {"Authorization": f"Bearer {tokens['access_token']}"}
+
+
+async def refresh(client, refresh_token: str):
+    return await client.post(
+        "/api/auth/refresh-token", json={"refresh_token": refresh_token}
+    )
+
+
+async def test_refresh_rotates_the_refresh_token(client, tokens):
+    response = await refresh(client, tokens["refresh_token"])
+
+    assert response.status_code == 200
+    rotated = response.json()
+    assert rotated["refresh_token"] != tokens["refresh_token"]
+    response = await client.get("/api/users/me", headers=bearer(rotated))
+    assert response.status_code == 200
+
+
+async def test_refresh_token_reuse_ends_the_session(client, tokens):
+    rotated = (await refresh(client, tokens["refresh_token"])).json()
+
+    response = await refresh(client, tokens["refresh_token"])
+    assert response.status_code == 401
+
+    # the session is over, for the holder of the current token as well
+    response = await refresh(client, rotated["refresh_token"])
+    assert response.status_code == 401
+
+
+async def test_logout_rejects_the_access_token(client, tokens):
+    response = await client.get("/api/users/me", headers=bearer(tokens))
+    assert response.status_code == 200
+
+    response = await client.post("/api/auth/logout", headers=bearer(tokens))
+    assert response.status_code == 200
+
+    response = await client.get("/api/users/me", headers=bearer(tokens))
+    assert response.status_code == 401
+    response = await refresh(client, tokens["refresh_token"])
+    assert response.status_code == 401
+
+
+async def test_concurrent_refresh_rotates_once(client, tokens):
+    responses = await asyncio.gather(
+        refresh(client, tokens["refresh_token"]),
+        refresh(client, tokens["refresh_token"]),
+    )
+
+    assert sorted(response.status_code for response in responses) == [200, 401]